@@ -1,48 +1,193 @@
 # keeps track of all constants
 # these constants can be used throughout the program but can also be changed on the fly
 # we import the variables from a json file and then can load them anywhere
+#
+# the constants are read through config.current, which is an immutable snapshot of constants.json.
+# whenever the file changes, a new snapshot is made and swapped in all at once, so a reader never sees a mix of
+# old and new values. in hot paths, grab the snapshot once and read from it:
+#   constants = config.current
+#   total = subtotal * constants.tax_rate
+import hashlib
+import json
 import os
+from typing import NamedTuple
 
 from src.utils.json_utils import *
-from discord.ext.tasks import loop
-
-# the actual constants
-constants = load_json("src/kryptonite_bot/constants.json")
-max_transfer_limit = constants["max transfer limit"]
-trading_limit_shares = constants["trading limit shares"]
-tax_free_trading_limit_dollars = constants["tax free trading limit dollars"]
-taxed_trading_limit_dollars = constants["taxed trading limit dollars"]
-tax_rate = constants["tax rate"]
-start_amount = constants["start amount"]
-max_balance = constants["max balance"]
-max_market_cap = constants["max market cap"]
-shares_per_interval = constants["shares per interval"]
-min_coins = constants["min_coins"]
-max_coins = constants["max_coins"]
-poverty_line = constants["poverty line"]
-
-@loop(minutes=1)
+from src.utils.log import logMsg
+from src.utils.scheduler import scheduler
+
+constants_path = "src/kryptonite_bot/constants.json"
+
+class Constants(NamedTuple):
+    """
+    An immutable snapshot of all the constants.
+    """
+    max_transfer_limit: float
+    trading_limit_shares: int
+    tax_free_trading_limit_dollars: float
+    taxed_trading_limit_dollars: float
+    tax_rate: float
+    start_amount: float
+    max_balance: float
+    max_market_cap: float
+    shares_per_interval: int
+    min_coins: int
+    max_coins: int
+    poverty_line: float
+    auction_window: float
+
+# the name of every constant in constants.json and the attribute it is stored as
+json_names = {
+    "max transfer limit": "max_transfer_limit",
+    "trading limit shares": "trading_limit_shares",
+    "tax free trading limit dollars": "tax_free_trading_limit_dollars",
+    "taxed trading limit dollars": "taxed_trading_limit_dollars",
+    "tax rate": "tax_rate",
+    "start amount": "start_amount",
+    "max balance": "max_balance",
+    "max market cap": "max_market_cap",
+    "shares per interval": "shares_per_interval",
+    "min_coins": "min_coins",
+    "max_coins": "max_coins",
+    "poverty line": "poverty_line",
+    "auction window": "auction_window",
+}
+
+# the constants that were added after constants.json files were copied around(see src/utils/guilds.py) and the value
+# they have when a file does not have them yet
+defaults = {
+    "auction window": 0, # seconds. 0 trades right away instead of in batch auctions. see src/utils/auction.py
+}
+
+def validate_constant(constant_name:str, value):
+    """
+    Validates the value of a constant and converts it to the right type.
+
+    values can come in as strings(from the change_constants command) or as numbers(from the json).
+    raises a ValueError if the value is invalid.
+    """
+    field = json_names[constant_name]
+    field_type = Constants.__annotations__[field]
+
+    if isinstance(value, bool):
+        raise ValueError(f"{constant_name} must be a number, not {value}")
+    if isinstance(value, str):
+        value = float(value.replace("_", "")) # raises a ValueError by itself if it is not a number
+
+    if field_type is int:
+        if value != int(value):
+            raise ValueError(f"{constant_name} must be a whole number, not {value}")
+        value = int(value)
+    else:
+        value = float(value)
+
+    if value < 0:
+        raise ValueError(f"{constant_name} cannot be negative")
+    if field == "shares_per_interval" and value == 0:
+        raise ValueError(f"{constant_name} must be at least 1")
+    return value
+
+def parse_constants(constants:dict)->Constants:
+    """
+    Turns the dict from constants.json into a snapshot. raises a ValueError if a constant is missing or invalid.
+    """
+    values = {}
+    for constant_name, field in json_names.items():
+        if key_exists(constants, constant_name):
+            values[field] = validate_constant(constant_name, constants[constant_name])
+        elif constant_name in defaults:
+            values[field] = validate_constant(constant_name, defaults[constant_name])
+        else:
+            raise ValueError(f"{constant_name} is missing")
+
+    if values["min_coins"] > values["max_coins"]:
+        raise ValueError("min_coins cannot be greater than max_coins")
+    return Constants(**values)
+
+class Config:
+    def __init__(self, path:str):
+        """
+        Holds the current snapshot of the constants.
+
+        The file is only reparsed when it actually changed. every reload first compares the file's modification time
+        and size, which is a single stat call. if those changed, the file is read and its hash is compared, so
+        touching the file without changing it does not reparse it either.
+        """
+        self.path = path
+        self._stat = None
+        self._hash = None
+        self.current = None
+        self.reload()
+
+    def _file_stat(self)->tuple:
+        stat = os.stat(self.path)
+        return stat.st_mtime_ns, stat.st_size
+
+    def reload(self)->bool:
+        """
+        Reloads the constants if the file changed. Returns True if a new snapshot was published.
+
+        if the file has invalid constants, the old snapshot is kept. (on startup, there is no old snapshot so it raises)
+        """
+        stat = self._file_stat()
+        if stat == self._stat: return False
+
+        with open(self.path, "rb") as file:
+            data = file.read()
+        digest = hashlib.sha1(data).hexdigest()
+        self._stat = stat
+        if digest == self._hash: return False
+
+        try:
+            snapshot = parse_constants(json.loads(data))
+        except ValueError as error:
+            if self.current is None: raise
+            logMsg(f"Did not reload constants: {error}")
+            return False
+
+        self._hash = digest
+        self.current = snapshot # publishes the new snapshot
+        return True
+
+    def change(self, constant_name:str, value)->str:
+        """
+        Changes the value of a constant.
+
+        the new value is validated, written to the json and published right away, instead of waiting for the next
+        reload. Returns a message saying what happened.
+        """
+        if constant_name not in json_names:
+            return f"{constant_name} does not exist."
+
+        try:
+            value = validate_constant(constant_name, value)
+            constants = load_json(self.path)
+            old_val = constants.get(constant_name, defaults.get(constant_name)) # gets the old value
+            constants[constant_name] = value # changes the value of the constant
+            snapshot = parse_constants(constants)
+        except ValueError as error:
+            return f"could not change **{constant_name}**: {error}"
+
+        update_json(self.path, constants) # updates the json
+
+        self._stat = self._file_stat()
+        with open(self.path, "rb") as file:
+            self._hash = hashlib.sha1(file.read()).hexdigest()
+        self.current = snapshot
+
+        return f"changed **{constant_name}**'s value from **{old_val}** to **{value}** successfully."
+
+config = Config(constants_path)
+
+@scheduler.job(every=1, phase="constants")
 async def reload_constants():
     """
     Loads constants that are used.
 
     These are in a json so they can easily be permanently changed during runtime.
     """
-    global tax_rate, tax_free_trading_limit_dollars, trading_limit_shares, max_transfer_limit, start_amount, \
-        taxed_trading_limit_dollars, max_balance, max_market_cap, shares_per_interval, min_coins, max_coins
-    constants = load_json("src/kryptonite_bot/constants.json")
-    max_transfer_limit = constants["max transfer limit"]
-    trading_limit_shares = constants["trading limit shares"]
-    tax_free_trading_limit_dollars = constants["tax free trading limit dollars"]
-    taxed_trading_limit_dollars = constants["taxed trading limit dollars"]
-    tax_rate = constants["tax rate"]
-    start_amount = constants["start amount"]
-    max_balance = constants["max balance"]
-    max_market_cap = constants["max market cap"]
-    shares_per_interval = constants["shares per interval"]
-    min_coins = constants["min_coins"]
-    max_coins = constants["max_coins"]
-    poverty_line = constants["poverty line"]
+    if config.reload():
+        logMsg("Reloaded the constants")
 
 async def change_constants(constant_name, value):
     """
@@ -55,19 +200,7 @@ async def change_constants(constant_name, value):
     Takes in the name of the constant we want to change, as well as a new value for it. then, if the constant exists,
     change it. additionally, we modify the actual json file.
     """
-    constants = load_json("src/kryptonite_bot/constants.json") # loas the constants
-
-    if not key_exists(constants, constant_name):
-        return f"{constant_name} does not exist."
-
-    old_val = constants[constant_name] # gets the old value
-    constants[constant_name] = value # changes the value of the constant
-
-    update_json("src/kryptonite_bot/constants.json", constants) # updates the json
-
-    return f"changed **{constant_name}**'s value from **{old_val}** to **{value}** successfully."
-
-
+    return config.change(constant_name, value)
 
 def reload_constants_sync():
     """
@@ -75,20 +208,7 @@ def reload_constants_sync():
 
     These are in a json so they can easily be permanently changed during runtime.
     """
-    global tax_rate, tax_free_trading_limit_dollars, trading_limit_shares, max_transfer_limit, start_amount, \
-        taxed_trading_limit_dollars, max_balance, max_market_cap, shares_per_interval, min_coins, max_coins
-    constants = load_json("src/kryptonite_bot/constants.json")
-    max_transfer_limit = constants["max transfer limit"]
-    trading_limit_shares = constants["trading limit shares"]
-    tax_free_trading_limit_dollars = constants["tax free trading limit dollars"]
-    taxed_trading_limit_dollars = constants["taxed trading limit dollars"]
-    tax_rate = constants["tax rate"]
-    start_amount = constants["start amount"]
-    max_balance = constants["max balance"]
-    max_market_cap = constants["max market cap"]
-    shares_per_interval = constants["shares per interval"]
-    min_coins = constants["min_coins"]
-    max_coins = constants["max_coins"]
+    config.reload()
 
 def change_constants_sync(constant_name, value):
     """
@@ -97,18 +217,5 @@ def change_constants_sync(constant_name, value):
     constants are stored in src/kryptonite_bot/constants.json
 
     these values are meant to be used globally but can be changed and reloaded on the fly.
-
-    Takes in the name of the constant we want to change, as well as a new value for it. then, if the constant exists,
-    change it. additionally, we modify the actual json file.
     """
-    constants = load_json("src/kryptonite_bot/constants.json") # loas the constants
-
-    if not key_exists(constants, constant_name):
-        return f"{constant_name} does not exist."
-
-    old_val = constants[constant_name] # gets the old value
-    constants[constant_name] = value # changes the value of the constant
-
-    update_json("src/kryptonite_bot/constants.json", constants) # updates the json
-
-    return f"changed **{constant_name}**'s value from **{old_val}** to **{value}** successfully."
+    return config.change(constant_name, value)
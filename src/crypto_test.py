@@ -2,6 +2,7 @@ import csv
 import datetime
 
 from utils.crypto_currency import *
+from utils.engine import add_currencies, simulate_cache
 import utils.json_utils
 from src.constants import *
 """
@@ -32,11 +33,9 @@ def simulate_notrade(time_period=10080):
     rows = []
 
     for i in range(time_period):
-        db = utils.json_utils.load_json("db/crypto_currencies.json") # loads all currencies
-
         try:
-            coin = CryptoCurrency(db["currencies"][0])  # creates the coin
-            coin.simulate() # simulates the coin
+            coin = next(iter(crypto_cache.values()))  # the first coin in the cache
+            coin.simulate(Random(), datetime.datetime.now()) # simulates the coin
 
             rows.append([ # appends the values to the rows
                 i,
@@ -49,7 +48,7 @@ def simulate_notrade(time_period=10080):
             ])
 
             print(f"Iteration: {i}    ||    Value: {coin.value}")
-        except IndexError: print("Coin value crashed");break
+        except StopIteration: print("Coin value crashed");break
 
     save_to_file(filename, rows)
 
@@ -68,7 +67,7 @@ def simulate_with_trade(time_period=10080):
 
     for i in range(time_period):
         try:
-            coin = CryptoCurrency(crypto_cache[0])
+            coin = next(iter(crypto_cache.values()))
 
             # trades
             purchase = 0
@@ -78,7 +77,7 @@ def simulate_with_trade(time_period=10080):
             if randint(0,1440)==1: purchase =coin_buy(buyshares, coin)
             if randint(0,1440)==1: sale =coin_sell(sellshares, coin)
 
-            coin.simulate()
+            coin.simulate(Random(), datetime.datetime.now())
 
             rows.append([  # appends the values to the rows
                 i,
@@ -90,7 +89,7 @@ def simulate_with_trade(time_period=10080):
                 coin.total_shares
             ])
             print(f"Iteration: {i}    ||    Value: {coin.value}")
-        except IndexError: print("Coin value crashed"); break
+        except StopIteration: print("Coin value crashed"); break
 
     save_to_file(filename, rows)
 
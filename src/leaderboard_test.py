@@ -0,0 +1,62 @@
+import bisect
+import sys
+from random import Random
+from src.utils.leaderboard import SkipList
+"""
+Tester for the leaderboard's skip list.
+Date: 2026-10-19
+objective:
+    inserts and removes random keys in a SkipList and in a plain sorted list at the same time.
+    after every change, the rank of a random key and a random slice are compared between the two.
+    at the end, every rank and the whole list are compared.
+
+    python -m src.leaderboard_test [operations] [seed]
+"""
+
+def check(skip:SkipList, keys:list, rng:Random):
+    # the skip list has to agree with the sorted list
+    assert len(skip) == len(keys), (len(skip), len(keys))
+    if keys:
+        key = rng.choice(keys)
+        assert skip.rank(key) == bisect.bisect_left(keys, key) + 1, key
+    start, count = rng.randint(1, len(keys) + 2), rng.randint(0, 12)
+    assert skip.slice(start, count) == keys[start - 1:start - 1 + count], (start, count)
+
+def random_test(operations:int=20_000, seed:int=0):
+    rng = Random(seed)
+    skip, keys = SkipList(), []
+    for i in range(operations):
+        if keys and rng.random() < 0.4: # removes a key
+            key = keys.pop(rng.randrange(len(keys)))
+            skip.remove(key)
+        else: # inserts a key. worths are often tied, so ties are broken by the id like on the leaderboard
+            key = (-rng.randint(0, 500), i)
+            bisect.insort(keys, key)
+            skip.insert(key)
+        check(skip, keys, rng)
+
+    for position, key in enumerate(keys, 1):
+        assert skip.rank(key) == position, key
+    assert skip.slice(1, len(keys)) == keys
+    print(f"{operations} operations, {len(keys)} keys left: ok")
+
+def missing_test():
+    # removing or ranking a key that is not there raises a KeyError
+    skip = SkipList()
+    for key in [(0, 1), (-5, 2), (-5, 3)]:
+        skip.insert(key)
+    for method in (skip.remove, skip.rank):
+        try:
+            method((-5, 4))
+            raise AssertionError(f"{method.__name__} did not raise")
+        except KeyError:
+            pass
+    assert skip.slice(1, 10) == [(-5, 2), (-5, 3), (0, 1)]
+    assert skip.slice(4, 10) == []
+    print("missing keys: ok")
+
+if __name__ == '__main__':
+    operations = int(sys.argv[1]) if len(sys.argv) > 1 else 20_000
+    seed = int(sys.argv[2]) if len(sys.argv) > 2 else 0
+    missing_test()
+    random_test(operations, seed)
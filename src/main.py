@@ -11,65 +11,162 @@ from discord.ext import commands
 from discord.ext.tasks import loop
 import asyncio
 import logging
+import os
+import signal
 
 from random import randint, uniform, choice
 from math import floor
 import sys
-from constants import *
+from src.constants import *
 from src.utils.json_utils import *
 from src.utils.users import *
 from src.utils.crypto_currency import *
 from src.utils.discord_utils import *
 from src.utils.log import *
-
-# sets up logging
-logger = logging.getLogger('discord')
-logger.setLevel(logging.DEBUG)
-handler = logging.FileHandler(filename="logs/discord.log", encoding='utf-8', mode='w')
-handler.setFormatter(logging.Formatter('%(asctime)s:%(levelname)s:%(name)s: %(message)s'))
-logger.addHandler(handler)
+from src.utils.money import *
+from src.utils.transactions import Transaction, TransactionConflict, recover, compact, compact_wal, drop_dead_holdings
+from src.utils.engine import engine_client, EngineError, simulate_cache, add_currencies, add_shares, add_coin
+from src.utils.holders import holders
+from src.utils.leaderboard import leaderboard
+from src.utils.portfolio import portfolio
+from src.utils.market import market
+from src.utils.ledger import LedgerImbalance, Entry, move, wallet, bank
+from src.utils.events import *
+from src.utils.replay import snapshot_economy
+from src.utils.shards import serve_backend, message_payload, deliver
+from src.utils.guilds import guild_economies, hibernate_guilds
+from src.utils.rpc import RpcError
+from src.utils.profiler import SamplingProfiler, MemoryTracker
+from src.utils.scheduler import scheduler
+from src.utils.trading import trade, execute_orders
+from src.utils.auction import auction
+from src.utils.orders import order_book, directions, max_orders, max_days, expiry_key
+from src.utils.alerts import alert_book, max_alerts, check_coins, check_alerts
+from src.utils.wal import wal
+from src.utils.timers import timers, OnCooldown
+from src.utils.outbox import outbox
+
+# sets up logging. records are written to logs/ by a background thread
+setup_logging()
 
 imp_info = load_json("src/kryptonite_bot/imp_info.json") # loads the important info
+if imp_info.get("engine socket"): # the market engine runs as its own process. see src/utils/engine.py
+    engine_client.use_socket(imp_info["engine socket"])
+elif imp_info.get("price board"): # other processes read the prices from shared memory. see src/utils/price_board.py
+    engine_client.local.use_price_board(imp_info["price board"])
+guild_economies.max_workers = imp_info.get("guild workers", guild_economies.max_workers) # see src/utils/guilds.py
 
 bot = commands.Bot(command_prefix=">", help_command=None) # initializes the bot. disables the default help command
 discord.AllowedMentions(replied_user=True)
 
+cpu_profiler = SamplingProfiler() # created here so it samples the event loop's thread
+memory_tracker = MemoryTracker()
+
 
 # GENERAL BOT COMMANDS =================================================================#
 
 
+async def start_economy():
+    await reload_constants() # loads all the constants into memory
+
+    await load_db_into_cache() # loads all currencies. the cache is kept when the bot reconnects
+    recover() # replays the write ahead log on top of the snapshots
+
+    await print_cache() # prints the cache
+
 @bot.event
 async def on_ready(): # runs this on startup
     logMsg("online")
 
     # dm me that it started
-    await dm_user(bot, id=imp_info['owner id'], msg="Online")
+    outbox.send(imp_info['owner id'], "Online")
 
-    await reload_constants() # loads all the constants into memory
-
-    await clear_cache()
-
-    await load_db_into_cache() # loads all currencies
-
-    await print_cache() # prints the cache
+    await start_economy()
 
     await bot.change_presence(activity=discord.Game(name=">help"))
 
+async def run_backend():
+    """
+    Runs the economy for the shards instead of connecting to discord. see src/utils/shards.py
+    """
+    if imp_info["token"]: # only logs in to the api, so owner commands can still dm. the shards hold the gateway
+        await bot.login(imp_info["token"])
+    await start_economy()
+
+    server = await serve_backend(bot, imp_info["backend socket"], on_command_error)
+    logMsg(f"Economy backend listening on {imp_info['backend socket']}")
+
+    stopped = asyncio.Event()
+    for signum in (signal.SIGINT, signal.SIGTERM): # a guild economy is stopped with SIGTERM when it hibernates
+        asyncio.get_running_loop().add_signal_handler(signum, stopped.set)
+
+    parent = os.getppid()
+    async with server:
+        while not stopped.is_set():
+            try:
+                await asyncio.wait_for(stopped.wait(), 5)
+            except asyncio.TimeoutError: # a guild economy stops with the bot that started it
+                if imp_info.get("guild id") and os.getppid() != parent: break
+
+    await scheduler.stop() # the tick that is running finishes first
+    await timers.stop()
+    await outbox.stop()
+    await guild_economies.close()
+    await compact() # everything in the write ahead log goes into the files
+    logMsg("Economy backend stopped")
+
 @bot.event
 async def on_command_error(ctx, error):
+    if isinstance(error, commands.CommandInvokeError) and isinstance(error.original, OnCooldown):
+        error = error.original # a cooldown that survives restarts. see src/utils/timers.py
+
     # the cooldown error
     # if the user tries to run a command while on cooldown, this message is sent
-    if isinstance(error, commands.CommandOnCooldown):
+    if isinstance(error, (commands.CommandOnCooldown, OnCooldown)):
         em = discord.Embed(title="Your sending commands too quickly!",
                            description=f"You can try that again in {int(error.retry_after)} seconds",
                            colour=c.red())
         await ctx.send(ctx.author.mention, embed=em)
 
-@bot.command()
-async def change_constants(ctx, constant_name:str, value):# allows me to change the constants
+    # someone else changed the user in the middle of the command. nothing was saved, so it can just be ran again
+    elif isinstance(error, commands.CommandInvokeError) and isinstance(error.original, TransactionConflict):
+        em = discord.Embed(title="Something changed while that was running",
+                           description="Nothing went through, try that again.",
+                           colour=c.red())
+        await ctx.send(ctx.author.mention, embed=em)
+
+    # the market engine is down or refused the request. nothing was saved
+    elif isinstance(error, commands.CommandInvokeError) and isinstance(error.original, EngineError):
+        em = discord.Embed(title="The market is unavailable right now",
+                           description="Nothing went through, try that again in a bit.",
+                           colour=c.red())
+        await ctx.send(ctx.author.mention, embed=em)
+        logMsg(f"Market engine error in {ctx.command}: {error.original}")
+
+    # the money did not add up. nothing was saved and the audit was logged
+    elif isinstance(error, commands.CommandInvokeError) and isinstance(error.original, LedgerImbalance):
+        em = discord.Embed(title="Something went wrong",
+                           description="Nothing went through.",
+                           colour=c.red())
+        await ctx.send(ctx.author.mention, embed=em)
+
+@bot.command(name="change_constants")
+async def change_constants_command(ctx, constant_name:str, value):# allows me to change the constants
     if ctx.author.id != imp_info['owner id']: return
 
-    await change_constants(constant_name, value)
+    msg = await change_constants(constant_name, value)
+    await ctx.send(msg, reference=ctx.message)
+
+@bot.command()
+async def guild_economy(ctx): # gives the server its own economy. see src/utils/guilds.py
+    if ctx.author.id != imp_info['owner id'] or ctx.guild is None: return
+
+    if imp_info.get("guild id") is not None or not guild_economies.create(ctx.guild.id):
+        await ctx.send("This server already has its own economy.", reference=ctx.message)
+        return
+
+    await ctx.send(f"**{ctx.guild.name}** has its own economy now. its coins, constants and balances start over.",
+                   reference=ctx.message)
 
 @bot.command()
 async def clear_coins(ctx): # allows me to clear the crypto db
@@ -77,7 +174,7 @@ async def clear_coins(ctx): # allows me to clear the crypto db
 
     clear_db() # clears the db
 
-    await dm_user(bot,imp_info["owner id"], "Cleared the Crypto Database")
+    outbox.send(imp_info["owner id"], "Cleared the Crypto Database")
 
     logMsg("Cleared the Crypto Database")
 
@@ -85,9 +182,13 @@ async def clear_coins(ctx): # allows me to clear the crypto db
 async def add_currency(ctx): # allows me to add currencies
     if ctx.author.id != imp_info['owner id']: return
 
-    coin = CryptoCurrency()
+    try:
+        coin = await add_coin()
+    except NamesExhausted as error:
+        await ctx.send(f"Could not add a new currency: {error}", reference=ctx.message)
+        return
 
-    await dm_user(bot, imp_info["owner id"], f"Added new currency, {coin.name}")
+    outbox.send(imp_info["owner id"], f"Added new currency, {coin.name}")
     logMsg(f"Added new currency, {coin.name}")
 
 @bot.command(aliases=['cl'])
@@ -116,10 +217,66 @@ async def servers(ctx):
 
     em = discord.Embed(title="Joined Servers")
     for guild in bot.guilds:
-        owner = await bot.fetch_user(int(guild.owner_id))
+        owner = guild.owner or await bot.fetch_user(int(guild.owner_id)) # only asks discord if it is not cached
         em.add_field(name=guild.name, value=f"members: **{guild.member_count}**  |  owner: **{owner.name}**", inline=False)
 
-    await dm_user(bot, imp_info['owner id'], embed=em)
+    outbox.send(imp_info['owner id'], embed=em)
+
+@bot.command(aliases=['prof'])
+async def profile(ctx, seconds:float=10, limit:int=15, by:str="self"):
+    """
+    Profiles the bot's cpu usage for :seconds: seconds of live traffic.
+
+    a sampling profiler watches the event loop while the bot keeps running normally, then the functions that
+    took the most time are sent back. :by: can be "self" or "total".
+    """
+    if ctx.author.id != imp_info['owner id']: return
+
+    if cpu_profiler.running:
+        await ctx.send("A profile is already running.", reference=ctx.message)
+        return
+
+    seconds = min(max(seconds, 1), 300) # between 1 second and 5 minutes
+    await ctx.send(f"Profiling for {seconds} seconds...", reference=ctx.message)
+
+    cpu_profiler.start()
+    await asyncio.sleep(seconds)
+    cpu_profiler.stop()
+
+    for block in code_blocks(cpu_profiler.report(limit=limit, by=by)):
+        await ctx.send(block)
+
+@bot.command()
+async def jobs(ctx):
+    # shows how long every scheduled job takes. see src/utils/scheduler.py
+    if ctx.author.id != imp_info['owner id']: return
+
+    for block in code_blocks(scheduler.report()):
+        await ctx.send(block)
+
+@bot.command(aliases=['memory'])
+async def mem(ctx, action:str="snap", limit:int=15):
+    """
+    Tracks the bot's memory usage with tracemalloc.
+
+    '>mem start' starts tracing and takes the first snapshot.
+    '>mem snap' takes another snapshot and shows the biggest allocators since the last one.
+    '>mem stop' stops tracing.
+    """
+    if ctx.author.id != imp_info['owner id']: return
+
+    action = action.lower()
+    if action == "start":
+        await asyncio.get_running_loop().run_in_executor(None, memory_tracker.start)
+        msg = "Started tracing memory."
+    elif action == "stop":
+        memory_tracker.stop()
+        msg = "Stopped tracing memory."
+    else: # snapshots are slow to take, so it is done off the event loop
+        msg = await asyncio.get_running_loop().run_in_executor(None, memory_tracker.diff, limit)
+
+    for block in code_blocks(msg):
+        await ctx.send(block)
 
 
 # HELP COMMAND STUFF =================================================================#
@@ -130,8 +287,8 @@ async def help(ctx): # make this a docs page
     em = discord.Embed(title="Help Menu", description="Use '>help [command]' for more info.", color=c.purple())
     em.add_field(name="Bot-related", value="change_log, invite", inline=False)
     em.add_field(name="How to play", value="coins, accounts, taxes, wallet", inline=False)
-    em.add_field(name="Economy commands:", value="daily, init, balance, deposit, withdraw, transfer, beg", inline=False)
-    em.add_field(name="Crypto commands:", value="holdings, view, buy, sell, list, can_afford", inline=False)
+    em.add_field(name="Economy commands:", value="daily, init, balance, deposit, withdraw, transfer, beg, leaderboard", inline=False)
+    em.add_field(name="Crypto commands:", value="holdings, view, buy, sell, order, alert, list, can_afford", inline=False)
     em.add_field(name="Gambling commands:", value="coin_flip, lower", inline=False)
 
     await ctx.send(embed=em, reference=ctx.message)
@@ -182,6 +339,19 @@ async def bal(ctx):
 
     await ctx.send(embed=em, reference=ctx.message)
 
+@help.command(name="leaderboard")
+async def leaderboard_help(ctx):
+    em = discord.Embed(title="Leaderboard", description="The richest users.", color=c.purple())
+    em.add_field(name="Usage", value="'>leaderboard [**global or server**] [**page**]' or '>lb [**global or server**] [**page**]'", inline=False)
+    em.add_field(name="Example", value=">leaderboard server 2\n"
+                                       "*Shows ranks 11-20 of this server*", inline=False)
+    em.add_field(name="Description",
+                 value="Ranks users by net worth: your wallet, both bank accounts and the value of your holdings.\n"
+                       "Holdings are valued at the latest prices, which change every minute.\n\n"
+                       "For more info on your holdings, use; '>help holdings'", inline=False)
+
+    await ctx.send(embed=em, reference=ctx.message)
+
 @help.command()
 async def holdings(ctx):
     em = discord.Embed(title="Holdings", description="View your investments.", color=c.purple())
@@ -203,7 +373,7 @@ async def transfer(ctx):
     em.add_field(name="Example", value=">transfer 500 @user hello\n"
                                        "*Transfers $500 from your wallet to @user's wallet and dm's the recipient 'hello'*", inline=False)
     em.add_field(name="Description", value=f"transfer money from your wallet to the specified user's wallet.\n "
-                                           f"Has to be less than ${max_transfer_limit/100} and greater then 0.\n\n"
+                                           f"Has to be less than ${config.current.max_transfer_limit/100} and greater then 0.\n\n"
                                            f"For more info on your wallet, use; '>help wallet'",
                  inline=False)
 
@@ -266,19 +436,27 @@ async def list(ctx):
 
     await ctx.send(embed=em, reference=ctx.message)
 
+def batch_note()->str: # how trades are made while batch auctions are on. see src/utils/auction.py
+    window = config.current.auction_window
+    if window <= 0: return ""
+    return (f"Trades are made in batches: yours waits up to {window} seconds and is made at the same price as every "
+            f"other trade of the coin in that time.\n\n")
+
 @help.command()
 async def buy(ctx):
+    example = next(iter(coin_index.ids), "kuki-bux") # the name of any currency
     em = discord.Embed(title="Buy", description="Buy a cryptocurrency.", color=c.purple())
     em.add_field(name="Usage", value="'>buy [**ntfa or tfa**] [**coin name**] [**num coins to buy**]',\n '>purchase [**ntfa or tfa**] [**coin name**] [**num coins to buy**]'\n or '>p [**ntfa or tfa**] [**coin name**] [**num coins to buy**]'", inline=False)
-    em.add_field(name="Example", value=f">buy ntfa {crypto_cache[0]['name']} 1\n"
-                                       f"*Buys 1 {crypto_cache[0]['name']} coin for your ntfa account. this will be taxed*")
+    em.add_field(name="Example", value=f">buy ntfa {example} 1\n"
+                                       f"*Buys 1 {example} coin for your ntfa account. this will be taxed*")
     em.add_field(name="Description",
                  value=f"Buy into a Cryptocurrency. you must specify which account you will use (tfa or ntfa)."
                        f"The chosen account will store the holding of said cryptocurrency's coins.\n This means that each account can hold different investments."
                        f"Both accounts can hold coins of the same currency.\n "
-                       f"(ntfa can hold your {crypto_cache[0]['name']} coins while tfa can also hold {crypto_cache[0]['name']} coins at the same time)\n\n"
+                       f"(ntfa can hold your {example} coins while tfa can also hold {example} coins at the same time)\n\n"
                        f"You must buy at least 1 of a coin. no fractional buys.\n\n"
-                       f"Do note that there are limits set in place for how many coins you can buy/sell at a time({trading_limit_shares}) and maximum trade volumes(for more info, use; '>help accounts'). Trades are also limited to 1 every 15 seconds.\n\n"
+                       f"Do note that there are limits set in place for how many coins you can buy/sell at a time({config.current.trading_limit_shares}) and maximum trade volumes(for more info, use; '>help accounts'). Trades are also limited to 1 every 15 seconds.\n\n"
+                       f"{batch_note()}"
                        f"Additionally, there are taxes(12%) imposed on your purchase if you are using a ntfa bank account.\n\n"
                        f"For more info on taxes, use; '>help taxes'", inline=False)
 
@@ -286,24 +464,64 @@ async def buy(ctx):
 
 @help.command()
 async def sell(ctx):
+    example = next(iter(coin_index.ids), "kuki-bux") # the name of any currency
     em = discord.Embed(title="Sell", description="Sell a cryptocurrency.", color=c.purple())
     em.add_field(name="Usage",
                  value="'>sell [**ntfa or tfa**] [**coin name**] [**num coins to buy**]'\nor '>s [**ntfa or tfa**] [**coin name**] [**num coins to buy**]'",
                  inline=False)
-    em.add_field(name="Example", value=f">sell ntfa {crypto_cache[0]['name']} 1\n"
-                                       f"*Sells 1 {crypto_cache[0]['name']} coin from your ntfa account.*")
+    em.add_field(name="Example", value=f">sell ntfa {example} 1\n"
+                                       f"*Sells 1 {example} coin from your ntfa account.*")
     em.add_field(name="Description",
                  value=f"Sell coins of a Cryptocurrency. you must specify which account you will use (tfa or ntfa)."
                        f"The chosen account will sell shares of said cryptocurrency's coins.\n This means that each account can hold different investments. "
                        f"Both accounts can hold coins of the same cryptocurrency.\n "
-                       f"(ntfa can hold your {crypto_cache[0]['name']} coins while tfa can also hold {crypto_cache[0]['name']} coins at the same time)\n\n"
+                       f"(ntfa can hold your {example} coins while tfa can also hold {example} coins at the same time)\n\n"
                        f"You must sell at least 1 of a coin. no fractional sales.\n\n"
-                       f"Do note that there are limits set in place for how many coins you can buy/sell at a time({trading_limit_shares}) and maximum trade volumes(for more info, use; '>help accounts'). Trades are also limited to 1 every 15 seconds.\n\n"
+                       f"Do note that there are limits set in place for how many coins you can buy/sell at a time({config.current.trading_limit_shares}) and maximum trade volumes(for more info, use; '>help accounts'). Trades are also limited to 1 every 15 seconds.\n\n"
+                       f"{batch_note()}"
                        f"There are no taxes on sales.\n\n"
                        f"For more info on taxes, use; '>help taxes'", inline=False)
 
     await ctx.send(embed=em, reference=ctx.message)
 
+@help.command(name="order")
+async def order_help(ctx):
+    example = next(iter(coin_index.ids), "kuki-bux") # the name of any currency
+    em = discord.Embed(title="Order", description="Buy or sell a cryptocurrency once it reaches a price.", color=c.purple())
+    em.add_field(name="Usage", value="'>order [**ntfa or tfa**] [**buy or sell**] [**limit, stop or take-profit**] [**coin name**] [**num coins**] [**price**]'\n"
+                                     "'>orders' to see your orders\n"
+                                     "'>cancel_order [**order id**]' to cancel one", inline=False)
+    em.add_field(name="Example", value=f">order ntfa sell stop {example} 5 0.5\n"
+                                       f"*Sells 5 {example} coins from your ntfa account if its value falls to $0.5*", inline=False)
+    em.add_field(name="Description",
+                 value=f"An order waits until the value of the coin reaches its price, then it is bought or sold at the value of the coin at that moment.\n\n"
+                       f" **limit buy**: buys once the value is at or below the price\n"
+                       f" **limit sell**: sells once the value is at or above the price\n"
+                       f" **stop sell**: sells once the value is at or below the price, to stop a loss\n"
+                       f" **stop buy**: buys once the value is at or above the price\n"
+                       f" **take-profit sell**: sells once the value is at or above the price\n\n"
+                       f"Orders are checked every minute, after the coins are simulated. nothing is set aside for an order, "
+                       f"so if you cannot afford it(or do not hold the coins) when it is reached, it is cancelled. you get a dm either way.\n\n"
+                       f"You can have up to {max_orders} orders. an order that is not reached in {max_days} days is cancelled.", inline=False)
+
+    await ctx.send(embed=em, reference=ctx.message)
+
+@help.command(name="alert")
+async def alert_help(ctx):
+    example = next(iter(coin_index.ids), "kuki-bux") # the name of any currency
+    em = discord.Embed(title="Alert", description="Get a dm when a cryptocurrency reaches a price.", color=c.purple())
+    em.add_field(name="Usage", value="'>alert [**coin name**] [**above or below**] [**price**]'\n"
+                                     "'>alerts' to see your alerts\n"
+                                     "'>cancel_alert [**alert id**]' to cancel one", inline=False)
+    em.add_field(name="Example", value=f">alert {example} above 20\n"
+                                       f"*Sends you a dm once the value of {example} rises to $20*", inline=False)
+    em.add_field(name="Description",
+                 value=f"An alert goes off once, the first time the value of the coin moves past its price, then it is gone. "
+                       f"alerts are checked every minute, after the coins are simulated. all the alerts that went off in that minute come in one dm.\n\n"
+                       f"You can have up to {max_alerts} alerts.", inline=False)
+
+    await ctx.send(embed=em, reference=ctx.message)
+
 @help.command()
 async def can_afford(ctx):
     em = discord.Embed(title="Coming soon", description="We are working(probably) on adding this feature", colour=c.purple())
@@ -340,10 +558,10 @@ async def accounts(ctx):
     em.add_field(name="What kind of accounts are there?",
                  value=f"There are 2 accounts:\n\n"
                        f" **Tax-free accounts**, also known as **tfa**. these are not taxed on purchases. "
-                       f"This means that crypto purchases will be cheaper with a tax-free account, however, trades with said account are limited(max of ${tax_free_trading_limit_dollars/100})."
+                       f"This means that crypto purchases will be cheaper with a tax-free account, however, trades with said account are limited(max of ${config.current.tax_free_trading_limit_dollars/100})."
                        f"These accounts are better suited for smaller purchases.\n\n"
                        f"Next, there are **Non-Tax-free accounts** also known as **ntfa**. these accounts are taxed."
-                       f"Every cryptocurrency purchase will be taxed by 12%, however, you can make much larger trades with ntfa accounts(max of ${taxed_trading_limit_dollars/100})",
+                       f"Every cryptocurrency purchase will be taxed by 12%, however, you can make much larger trades with ntfa accounts(max of ${config.current.taxed_trading_limit_dollars/100})",
                  inline=False)
     em.add_field(name="How do my accounts store my investments?",
                  value=f"Upon purchasing, the name of the currency and the number of coins you have purchased are logged into your account. you can view this using '>holdings'\n\n"
@@ -377,8 +595,8 @@ async def taxes(ctx):
 
     await ctx.send(embed=em, reference=ctx.message)
 
-@help.command()
-async def wallet(ctx):
+@help.command(name="wallet")
+async def wallet_help(ctx):
     em = discord.Embed(title="Wallet", description="All about your Wallet.", color=c.purple())
     em.add_field(name="What is my Wallet for?",
                  value="Your wallet is used for money on your person. "
@@ -403,8 +621,8 @@ async def beg(ctx):
     em.add_field(name="Usage",value="'>beg'",inline=False)
     em.add_field(name="Description",
                  value="You can get for money and earn between $10 and $75.\n"
-                       f"Note that you can only beg if you have less than ${poverty_line} in both your wallet and in both bank account balances.\n"
-                       f"This means that if you have more than ${poverty_line} in any of your account balances or wallet, you cannot beg.\n\n"
+                       f"Note that you can only beg if you have less than ${config.current.poverty_line} in both your wallet and in both bank account balances.\n"
+                       f"This means that if you have more than ${config.current.poverty_line} in any of your account balances or wallet, you cannot beg.\n\n"
                        f"For more info on accounts, use; '>help accounts'\n"
                        f"For more info on your wallet, use; '>help wallet'",
                  inline=False)
@@ -471,39 +689,42 @@ async def beg(ctx):
 
     if ctx.author.bot: return
 
-    user = User(ctx.author.id)
-
     em = discord.Embed(title="Beg for money", color=c.orange())
     em.set_thumbnail(url=ctx.author.avatar_url)  # the avatar
 
-    # verifies if the user is poor enough
-    # only works if the user has less than the poverty line
-    if (user.wallet > poverty_line or
-        user.accounts["tfa"]["balance"] > poverty_line or
-            user.accounts["ntfa"]["balance"] > poverty_line):
-        em.add_field(name="Error",
-                     value=f"You have too much money!\n"
-                           f" You must have less than ${poverty_line} in both your bank accounts and wallet!\n"
-                           f"run '>bal' to determine how much money you have.",
-                     inline=False)
+    async with Transaction(users=[ctx.author.id]) as tx:
+        user = tx.user(ctx.author.id)
 
-    else: # otherwise gives the user money
+        # verifies if the user is poor enough
+        # only works if the user has less than the poverty line
+        poverty_line = to_money(config.current.poverty_line)
+        if (user.wallet > poverty_line or
+            user.accounts["tfa"].balance > poverty_line or
+                user.accounts["ntfa"].balance > poverty_line):
+            em.add_field(name="Error",
+                         value=f"You have too much money!\n"
+                               f" You must have less than ${fmt_money(poverty_line)} in both your bank accounts and wallet!\n"
+                               f"run '>bal' to determine how much money you have.",
+                         inline=False)
 
-        amount = randint(10, 75)
-        user.wallet += amount
-        user.save()
+        else: # otherwise gives the user money
+
+            amount = to_money(randint(10, 75))
+            user.wallet += amount
+            tx.post(move("beg", "mint", wallet(user.uid), amount))
+            await tx.commit(Beg(user.uid, amount))
 
-        if randint(1,10) ==1: # no money ?
-            msg = f"No money {bot.get_emoji(977639838641688596)} ?"
-        else: msg = "You begged for money"
+            if randint(1,10) ==1: # no money ?
+                msg = f"No money {bot.get_emoji(977639838641688596)} ?"
+            else: msg = "You begged for money"
 
-        em.add_field(name=msg, value=f"You begged and earned ${amount}")
+            em.add_field(name=msg, value=f"You begged and earned ${fmt_money(amount)}")
 
     await ctx.send(embed=em, reference=ctx.message)
 
 @bot.command(aliases=["flip", "cf"])
 @commands.cooldown(20, 10, commands.BucketType.user) # max usage of 20 times and have to wait 30 seconds afterward
-async def coin_flip(ctx, guess:str, amount:float):
+async def coin_flip(ctx, guess:str, amount:to_money):
     """
     Coinflip command.
 
@@ -516,7 +737,6 @@ async def coin_flip(ctx, guess:str, amount:float):
 
     em = discord.Embed(title="Coin Flip",color=c.green())
     em.set_thumbnail(url=ctx.author.avatar_url)  # the avatar
-    user = User(ctx.author.id)
 
     # the user can only gamble positive amounts of money
     if amount <= 0:
@@ -526,24 +746,6 @@ async def coin_flip(ctx, guess:str, amount:float):
         await ctx.send(embed=em, reference=ctx.message)
         return
 
-    # checks if the user has enough money
-    if amount > user.wallet:
-        if randint(1,10) ==1: # no money ?
-            msg = f"No money {bot.get_emoji(977639838641688596)} ?"
-        else: msg = "Error"
-
-        em.add_field(name=msg,
-                     value=f"Not enough money to gamble.",
-                     inline=False)
-        em.add_field(name="Has:",
-                     value=f"${user.wallet}",
-                     inline=False)
-        em.add_field(name="Needs:",
-                     value=f"${amount}",
-                     inline=False)
-        await ctx.send(embed=em, reference=ctx.message)
-        return
-
     # checks if the guess is formatted right
     if guess.lower() not in ["tails", "t", "heads", "h"]:
         em.add_field(name="Error",
@@ -554,24 +756,48 @@ async def coin_flip(ctx, guess:str, amount:float):
         await ctx.send(embed=em, reference=ctx.message)
         return
 
-    # rolls the dice
-    if randint(1,2) == 1:
-        user.wallet += amount
-        em.add_field(name="You Won!",
-                     value=f"You gained ${amount}!",
-                     inline=False)
-    else:
-        user.wallet -=amount
-        em.add_field(name="You Lost!",
-                     value=f"You lost ${amount}!",
-                     inline=False)
+    async with Transaction(users=[ctx.author.id]) as tx:
+        user = tx.user(ctx.author.id)
+
+        # checks if the user has enough money
+        if amount > user.wallet:
+            if randint(1,10) ==1: # no money ?
+                msg = f"No money {bot.get_emoji(977639838641688596)} ?"
+            else: msg = "Error"
+
+            em.add_field(name=msg,
+                         value=f"Not enough money to gamble.",
+                         inline=False)
+            em.add_field(name="Has:",
+                         value=f"${fmt_money(user.wallet)}",
+                         inline=False)
+            em.add_field(name="Needs:",
+                         value=f"${fmt_money(amount)}",
+                         inline=False)
+
+        else:
+            # rolls the dice. the house pays out wins and takes losses
+            won = randint(1,2) == 1
+            if won:
+                user.wallet += amount
+                tx.post(move("coin_flip", "house", wallet(user.uid), amount))
+                em.add_field(name="You Won!",
+                             value=f"You gained ${fmt_money(amount)}!",
+                             inline=False)
+            else:
+                user.wallet -=amount
+                tx.post(move("coin_flip", wallet(user.uid), "house", amount))
+                em.add_field(name="You Lost!",
+                             value=f"You lost ${fmt_money(amount)}!",
+                             inline=False)
+
+            await tx.commit(CoinFlip(user.uid, amount, won)) # saves the user
 
-    user.save() # saves the user
     await ctx.send(embed=em, reference=ctx.message)
 
 @bot.command(asliases=['low'])
 @commands.cooldown(20, 10, commands.BucketType.user) # max usage of 20 times and have to wait 30 seconds afterward
-async def lower(ctx, guess:int, amount:float):
+async def lower(ctx, guess:int, amount:to_money):
     """
     Lower/Upper command.
 
@@ -585,7 +811,6 @@ async def lower(ctx, guess:int, amount:float):
 
     em = discord.Embed(title="Lower",color=c.green())
     em.set_thumbnail(url=ctx.author.avatar_url)  # the avatar
-    user = User(ctx.author.id)
 
     # the user can only gamble positive amounts of money
     if amount <= 0:
@@ -595,25 +820,6 @@ async def lower(ctx, guess:int, amount:float):
         await ctx.send(embed=em, reference=ctx.message)
         return
 
-    # checks if the user has enough money
-    if amount > user.wallet:
-        if randint(1, 10) == 1:  # no money ?
-            msg = f"No money {bot.get_emoji(977639838641688596)} ?"
-        else:
-            msg = "Error"
-
-        em.add_field(name=msg,
-                     value=f"Not enough money to gamble.",
-                     inline=False)
-        em.add_field(name="Has:",
-                     value=f"${user.wallet}",
-                     inline=False)
-        em.add_field(name="Needs:",
-                     value=f"${amount}",
-                     inline=False)
-        await ctx.send(embed=em, reference=ctx.message)
-        return
-
     # the user's guess must fall between [1-99]
     if guess >99 or guess < 1:
         em.add_field(name="Error",
@@ -622,44 +828,67 @@ async def lower(ctx, guess:int, amount:float):
         await ctx.send(embed=em, reference=ctx.message)
         return
 
-    reference = randint(0,100) # the number generated by the computer.
-
-    if guess <= reference: # if the user number is less than the generated on, the user wins
-        won=True
-        # if less than 45, give 25% less for every 5 points lower
-        if guess < 45:
-            change = max(1, int(amount + (0.05*(guess - 50)*amount)))
-            user.wallet += change
-
-        # if higher than 65, 0.25x more for every 5 points higher
-        elif guess > 65:
-            change = int(amount + (0.05*(guess - 65) * amount))
-            user.wallet += change
-
-        else: # otherwise
-            change = amount
-            user.wallet += change
+    async with Transaction(users=[ctx.author.id]) as tx:
+        user = tx.user(ctx.author.id)
+
+        # checks if the user has enough money
+        if amount > user.wallet:
+            if randint(1, 10) == 1:  # no money ?
+                msg = f"No money {bot.get_emoji(977639838641688596)} ?"
+            else:
+                msg = "Error"
+
+            em.add_field(name=msg,
+                         value=f"Not enough money to gamble.",
+                         inline=False)
+            em.add_field(name="Has:",
+                         value=f"${fmt_money(user.wallet)}",
+                         inline=False)
+            em.add_field(name="Needs:",
+                         value=f"${fmt_money(amount)}",
+                         inline=False)
 
-    else: # if the user num is higher, then they lose money
-        won=False
-        change = amount
-        user.wallet -= change
-
-    # make the embed
-    em.add_field(name=f"You {'Won' if won else 'Lost'} {'' if won else '' if randint(0,10)!=1 else bot.get_emoji(980704152550277152)}!",
-                 value=f"You guessed: {guess}\nThe reference was: {reference}",
-                 inline=False)
-    em.add_field(name=f"You {'Gained' if won else 'Lost'}:",
-                 value=f"{change} coins!",
-                 inline=False)
-    em.add_field(name="Wallet",
-                 value=f"You now have: {round(user.wallet,4)} coins!",
-                 inline=False)
-    em.add_field(name=f"{'Congratulations!' if won else 'Better luck next time!'}",
-                 value=f"Be sure to gimme more money- I MEAN, play again!!",
-                 inline=False)
+        else:
+            reference = randint(0,100) # the number generated by the computer.
+
+            if guess <= reference: # if the user number is less than the generated on, the user wins
+                won=True
+                # if less than 45, give 25% less for every 5 points lower
+                if guess < 45:
+                    change = max(to_money(1), amount + amount*(guess - 50)//20)
+
+                # if higher than 65, 0.25x more for every 5 points higher
+                elif guess > 65:
+                    change = amount + amount*(guess - 65)//20
+
+                else: # otherwise
+                    change = amount
+
+                user.wallet += change
+                tx.post(move("lower", "house", wallet(user.uid), change)) # the house pays out
+
+            else: # if the user num is higher, then they lose money
+                won=False
+                change = amount
+                user.wallet -= change
+                tx.post(move("lower", wallet(user.uid), "house", change))
+
+            # make the embed
+            em.add_field(name=f"You {'Won' if won else 'Lost'} {'' if won else '' if randint(0,10)!=1 else bot.get_emoji(980704152550277152)}!",
+                         value=f"You guessed: {guess}\nThe reference was: {reference}",
+                         inline=False)
+            em.add_field(name=f"You {'Gained' if won else 'Lost'}:",
+                         value=f"{fmt_money(change)} coins!",
+                         inline=False)
+            em.add_field(name="Wallet",
+                         value=f"You now have: {fmt_money(user.wallet)} coins!",
+                         inline=False)
+            em.add_field(name=f"{'Congratulations!' if won else 'Better luck next time!'}",
+                         value=f"Be sure to gimme more money- I MEAN, play again!!",
+                         inline=False)
+
+            await tx.commit(Lower(user.uid, guess, reference, change, won)) # saves
 
-    user.save() # saves
     await ctx.send(embed=em, reference=ctx.message) # sends the embed
 
 
@@ -667,19 +896,21 @@ async def lower(ctx, guess:int, amount:float):
 
 
 @bot.command(aliases=["d"])
-@commands.cooldown(1, 86400, commands.BucketType.user) # only used once per day.
 async def daily(ctx): # daily command to give the user money into their wallet
 
     if ctx.author.bot: return  # does not answer to bots
 
-    user = User(ctx.author.id)
-    amount = randint(150, 600) # range 150-600 bucks
-    user.wallet += amount
-    user.save()
+    async with Transaction(users=[ctx.author.id]) as tx:
+        tx.start_cooldown("daily", ctx.author.id, 86400) # only used once per day. kept when the bot restarts
+        user = tx.user(ctx.author.id)
+        amount = to_money(randint(150, 600)) # range 150-600 bucks
+        user.wallet += amount
+        tx.post(move("daily", "mint", wallet(user.uid), amount))
+        await tx.commit(Daily(user.uid, amount))
 
     # creates the embed.
     em = discord.Embed(title="Daily Money",
-                       description=f"You recived **${amount}** the money has been deposited into your wallet", color=c.orange())
+                       description=f"You recived **${fmt_money(amount)}** the money has been deposited into your wallet", color=c.orange())
     em.set_thumbnail(url=ctx.author.avatar_url)  # the avatar
 
     await ctx.send(embed=em, reference=ctx.message)
@@ -710,9 +941,40 @@ async def bal(ctx, member:int=None): # gives the current balance
 
     em = discord.Embed(title=f"User Balance{f' for {member}' if avatar is None else ''}", color=c.orange())
     if avatar is not None: em.set_thumbnail(url=avatar) # the avatar
-    em.add_field(name="Wallet", value=f"${round(user.wallet, 4)}", inline=False)
-    em.add_field(name="TFA", value=f"${round(user.accounts['tfa']['balance'], 4)}\nHoldings: {len(user.accounts['tfa']['holdings'])}", inline=False)
-    em.add_field(name="NTFA", value=f"${round(user.accounts['ntfa']['balance'],4)}\nHoldings: {len(user.accounts['ntfa']['holdings'])}", inline=False)
+    em.add_field(name="Wallet", value=f"${fmt_money(user.wallet)}", inline=False)
+    em.add_field(name="TFA", value=f"${fmt_money(user.accounts['tfa'].balance)}\nHoldings: {len(user.accounts['tfa'].holdings)}", inline=False)
+    em.add_field(name="NTFA", value=f"${fmt_money(user.accounts['ntfa'].balance)}\nHoldings: {len(user.accounts['ntfa'].holdings)}", inline=False)
+
+    await ctx.send(embed=em, reference=ctx.message)
+
+@bot.command(name="leaderboard", aliases=["lb", "top"])
+async def leaderboard_command(ctx, scope:str="global", page:int=1):
+    """
+    Shows the users with the highest net worth, 10 per page.
+
+    the global ranking comes straight from the leaderboard's skip list. the server ranking only ranks the members of
+    the server the command was used in.
+    """
+    if ctx.author.bot: return  # does not answer to bots
+
+    per_page = 10
+    start = (max(page, 1) - 1) * per_page + 1
+    by_server = scope.lower() in ("server", "guild", "s") and ctx.guild is not None
+
+    if by_server:
+        ranked = leaderboard.among(member.id for member in ctx.guild.members)
+        rows = ranked[start - 1:start - 1 + per_page]
+        rank = next((rank for rank, uid, worth in ranked if uid == ctx.author.id), None)
+        title = f"{ctx.guild.name} Leaderboard"
+    else:
+        rows = leaderboard.top(start, per_page)
+        rank = leaderboard.rank_of(ctx.author.id)
+        title = "Global Leaderboard"
+
+    em = discord.Embed(title=title, color=c.orange())
+    value = "\n".join(f"**{rank}.** <@{uid}>  -  ${fmt_money(worth)}" for rank, uid, worth in rows)
+    em.add_field(name=f"Page {max(page, 1)}", value=value or "No one here yet", inline=False)
+    em.add_field(name="Your rank", value=f"#{rank}" if rank is not None else "Unranked. use '>init' to get started", inline=False)
 
     await ctx.send(embed=em, reference=ctx.message)
 
@@ -723,95 +985,94 @@ async def holdings(ctx, account_name=None):
 
     By default, shows both. however, if specified, it will show a specific account's investments.
 
-    depending on which account whose holdings we want, we can load holdings_list() which loads all
-    holdings in an account and equates it to msg. we can then return msg
+    the holdings are valued by the portfolio(see src/utils/portfolio.py), then holdings_list() turns an account's
+    holdings into the text of its field.
     """
-    async def holdings_list(user:User, account_name:str):
-        # loads all holdings in a user's account
+    def holdings_list(account_name:str):
+        # lists all holdings in a user's account
         value = ""
-        for holding in user.accounts[account_name]["holdings"]:
-
-            for currency_dict in crypto_cache: # looks for the currency holding in the cache's value.
-                if currency_dict["name"] == holding:
-                    coin_value = CryptoCurrency(currency_dict).value
-                    break
-
-            # displays the number of shares as well as the colume
-            value += f"{holding}: {user.accounts[account_name]['holdings'][holding]}  |  Value: ${round(coin_value * user.accounts[account_name]['holdings'][holding], 4)}\n"
+        for holding in valuation.accounts[account_name]:
+            # displays the number of shares as well as the volume
+            value += f"{holding.name or 'crashed coin'}: {holding.shares}  |  Value: ${fmt_money(holding.value)}\n"
 
         # embeds cannot contain empty strings, so if there are no holdings, say that there are no holdings
         if value == "":
             return "No holdings"
-        else: return value
+        else: return value + f"Total: ${fmt_money(valuation.account_totals[account_name])}"
 
     if ctx.author.bot: return  # does not answer to bots
 
     user = User(ctx.author.id) # loads the user
+    valuation = portfolio.value(user)
     em = discord.Embed(title="User Holdings", color=c.orange()) # the embed used.
     em.set_thumbnail(url=ctx.author.avatar_url) # the avatar
 
     if account_name is None: # load all accounts if nothing is specified
         em.add_field(name="TFA",
-                     value=await holdings_list(user, "tfa"),
+                     value=holdings_list("tfa"),
                      inline=False)
         em.add_field(name="NTFA",
-                     value=await holdings_list(user, "ntfa"),
+                     value=holdings_list("ntfa"),
                      inline=False)
+        em.add_field(name="Total value", value=f"${fmt_money(valuation.total)}", inline=False)
 
     elif account_name.lower() == "tfa": # for the tax-free account
         em.add_field(name="TFA",
-                     value=await holdings_list(user, account_name))
+                     value=holdings_list("tfa"))
 
     elif account_name.lower() == "ntfa": # for the non-tax-free account
         em.add_field(name="NTFA",
-                     value=await holdings_list(user, account_name))
+                     value=holdings_list("ntfa"))
 
 
     await ctx.send(embed=em, reference=ctx.message) # returns the message
 
 @bot.command(aliases=["t"])
-async def transfer(ctx, amount:float, member:discord.Member, message:str = None):
+async def transfer(ctx, amount:to_money, member:discord.Member, message:str = None):
     """
     Transfers money from 1 wallet to the next.
 
     only accepts non-zero positive values. then it calls the user.transfer() method
-    afterward saves.
+    both users are loaded and saved together in a transaction, so they cant be changed by another command in between.
     """
 
     if ctx.author.bot: return  # does not answer to bots
 
-    user = User(ctx.author.id)
-
     em = discord.Embed(title="Transfer Money", color=c.orange())
     em.set_thumbnail(url=ctx.author.avatar_url)  # the avatar
 
-    if amount<=0.0: # amount has to be greater than 0
+    if amount<=0: # amount has to be greater than 0
         em.add_field(name="Transfer", value="Amount must be a positive number")
         await ctx.send(embed=em, reference=ctx.message)
         return
-    if amount > max_transfer_limit: # amount exceeds the trtansfer limit
+    if amount > to_money(config.current.max_transfer_limit): # amount exceeds the trtansfer limit
         em.add_field(name="Error", value="Exceeds transfer limit", inline=False)
-        em.add_field(name="max limit:", value=f"${max_transfer_limit}", inline=False)
-        em.add_field(name="To send:", value=f"${max_transfer_limit}", inline=False)
+        em.add_field(name="max limit:", value=f"${config.current.max_transfer_limit}", inline=False)
+        em.add_field(name="To send:", value=f"${fmt_money(amount)}", inline=False)
         await ctx.send(embed=em, reference=ctx.message)
         return
 
-    res = user.transfer(amount=amount, uid=member.id) # transfers the money
+    async with Transaction(users=[ctx.author.id, member.id]) as tx:
+        user = tx.user(ctx.author.id)
+        sender_wallet = user.wallet
+        res = user.transfer(amount=amount, recipient=tx.user(member.id)) # transfers the money
+        sent = user.wallet != sender_wallet
+        if sent:
+            tx.post(move("transfer", wallet(ctx.author.id), wallet(member.id), amount))
+            await tx.commit(Transfer(ctx.author.id, member.id, amount)) # saves both users
 
     em.add_field(name="Transfer", value=f"{res} to {member.name}")
 
     await ctx.send(embed=em, reference=ctx.message) # sends the response
 
-    if message is not None: # dm's the message
+    if sent and message is not None: # dm's the message
         dm_em = discord.Embed(title="Money Transfer", colour=c.orange())
-        dm_em.add_field(name=f"{ctx.author} sent you money", value=amount, inline=False)
+        dm_em.add_field(name=f"{ctx.author} sent you money", value=f"${fmt_money(amount)}", inline=False)
         dm_em.add_field(name="Message: ", value=message, inline=False)
-        await dm_user(bot, id=member.id, embed=dm_em)
-
-    user.save() # saves the user
+        outbox.send(member.id, embed=dm_em)
 
 @bot.command(aliases=["bw"])
-async def withdraw(ctx, account_name:str, amount:float):
+async def withdraw(ctx, account_name:str, amount:to_money):
     """
     Withdraws money from the user's bank account.
 
@@ -826,20 +1087,25 @@ async def withdraw(ctx, account_name:str, amount:float):
     em = discord.Embed(title="Bank Withdraw", color=c.orange())
     em.set_thumbnail(url=ctx.author.avatar_url)  # the avatar
 
-    if amount <=0.0:
+    if amount <=0:
         em.add_field(name="Error", value="Amount must be a positive number")
         await ctx.send(embed=em, reference=ctx.message)
         return
 
-    user = User(ctx.author.id)
-    msg= user.bank_withdraw(amount=amount, account_name=account_name.lower())
+    account_name = account_name.lower()
+    async with Transaction(users=[ctx.author.id]) as tx:
+        user = tx.user(ctx.author.id)
+        old_wallet = user.wallet
+        msg= user.bank_withdraw(amount=amount, account_name=account_name)
+        if user.wallet != old_wallet:
+            tx.post(move("withdraw", bank(user.uid, account_name), wallet(user.uid), amount))
+            await tx.commit(BankTransfer(user.uid, account_name, -amount))
+
     em.add_field(name="Withdraw", value=msg)
     await ctx.send(embed=em, reference=ctx.message)
 
-    user.save()
-
 @bot.command(aliases=["bd"])
-async def deposit(ctx, account_name: str, amount: float):
+async def deposit(ctx, account_name: str, amount: to_money):
     """
     deposits money into the user's bank account.
 
@@ -854,18 +1120,23 @@ async def deposit(ctx, account_name: str, amount: float):
     em = discord.Embed(title="Bank Deposit", color=c.orange())
     em.set_thumbnail(url=ctx.author.avatar_url)  # the avatar
 
-    if amount <= 0.0:
+    if amount <= 0:
         em.add_field(name="Error", value="Amount must be a positive number")
         await ctx.send(embed=em, reference=ctx.message)
         return
 
-    user = User(ctx.author.id)
-    msg= user.bank_deposit(amount=amount, account_name=account_name.lower())
+    account_name = account_name.lower()
+    async with Transaction(users=[ctx.author.id]) as tx:
+        user = tx.user(ctx.author.id)
+        old_wallet = user.wallet
+        msg= user.bank_deposit(amount=amount, account_name=account_name)
+        if user.wallet != old_wallet:
+            tx.post(move("deposit", wallet(user.uid), bank(user.uid, account_name), amount))
+            await tx.commit(BankTransfer(user.uid, account_name, amount)) # saves
+
     em.add_field(name="Deposit", value=msg)
     await ctx.send(embed=em, reference=ctx.message)
 
-    user.save() # saves
-
 
 # CRYPTO COMMANDS =================================================================#
 
@@ -880,36 +1151,30 @@ async def view(ctx, coin_name:str): # view info on a specific currency
 
     em = discord.Embed(title=f"{coin_name} analytics", color=c.blue())
 
-    # looks through the cache for the currency with the same name. if it matches, return it
-    for currency_dict in crypto_cache:
-        if currency_dict["name"] == coin_name.lower():
-            coin = CryptoCurrency(currency_dict)
-            em.add_field(name="Value", value=f"${round(coin.value,4)}", inline=False)
-            em.add_field(name="Total coins", value=f"{coin.total_shares} coins", inline=False)
-            em.add_field(name="Market cap", value=f"${round(coin.market_cap,4)}", inline=False)
-            break
+    # looks up the currency with the same name in the market snapshot
+    coin = market.snapshot.by_name.get(coin_name.lower())
+    if coin is not None:
+        em.add_field(name="Value", value=coin.value_text, inline=False)
+        em.add_field(name="Total coins", value=f"{coin.total_shares} coins", inline=False)
+        em.add_field(name="Market cap", value=coin.market_cap_text, inline=False)
+        em.add_field(name="Holders", value=f"{holders.num_holders(coin.uid)} holding {holders.shares_held(coin.uid)} coins", inline=False)
 
     await ctx.send(embed=em, reference=ctx.message)
 
 @bot.command(aliases=["l"])
 async def list(ctx): # view a list of all currencies and their values
     """
-    Loads all the currencies from the cache and displays their details.
+    Displays every currency in the market snapshot. the list is already formatted when the snapshot is published.
     """
 
     if ctx.author.bot: return  # does not answer to bots
 
-    msg = ""
     em = discord.Embed(title="List cryptocurrencies", color=c.blue())
-    for currency_dict in crypto_cache: # goes through all currencies
-        coin = CryptoCurrency(currency_dict)
-        msg += f"{coin.name}  -  ${round(coin.value,4)}\n"
-
-    em.add_field(name="Currencies", value=msg)
+    em.add_field(name="Currencies", value=market.snapshot.listing)
     await ctx.send(embed=em, reference=ctx.message)
 
 @bot.command(aliases=['ca'])
-async def can_afford(ctx, account_name:str=None, coin_name:str=None, amount:float=None):
+async def can_afford(ctx, account_name:str=None, coin_name:str=None, amount:to_money=None):
     """
 
     while (True):
@@ -926,12 +1191,12 @@ async def can_afford(ctx, account_name:str=None, coin_name:str=None, amount:floa
 
     user = User(ctx.author.id)
 
-    if amount is None: amount = user.accounts[account_name]['balance']
+    if amount is None: amount = user.accounts[account_name].balance
 
     elif amount < 0: return
 
-    if not CryptoCurrency.exists(coin_name): return
-    else: coin = CryptoCurrency(CryptoCurrency.load_coin_dict(coin_name))
+    coin = market.snapshot.by_name.get(coin_name)
+    if coin is None: return
 
     em = discord.Embed(title="Coming soon!",description="Scram! Nothing to see here", colour=c.blue())
     await ctx.send(embed=em, reference=ctx.message)
@@ -950,12 +1215,8 @@ async def buy(ctx, account_name:str, coin_name:str, shares:int): # buy a currenc
     Finally, we make some final checks to see if the purchase is valid. (has enough money, dosent exceed limits)
     then we can make the purchase and save.
 
-    When calculating the value, it is compounded. we calculate the value of the currency and purchase 50 shares at a time.
-    This way, the cost of the purchase is more accurate and higher than if it was all calculated in 1 sitting.
-    we have temp variables like v and shares_traded so we know how much has been traded so far.
-    v is gradually increased every iteration and after the loop, is assigned to coin.value. meanwhile, shares_traded is
-    in case the value crashes or reaches the maximum value before it finishes calculations. this way, the value does not
-    go out of hand and the user is not charged unjustly.
+    the market engine prices the purchase and changes the value of the currency. the value is compounded, so the cost of
+    the purchase is more accurate than if it was all calculated in 1 sitting. (see CryptoCurrency.quote())
     """
 
     if ctx.author.bot: return  # does not answer to bots
@@ -969,86 +1230,43 @@ async def buy(ctx, account_name:str, coin_name:str, shares:int): # buy a currenc
         return
 
     shares = floor(shares) # makes sure all shares bought are int. not float.
-    user = User(ctx.author.id)  # loads the user
-
-    if user.shares_exceeds_trade_limit(shares): # if the user has attempted to trade more shares than they are allowed to.
-        em.add_field(name="Error", value="Shares exceed trading limit.", inline=False)
-        em.add_field(name="To buy:", value=f"{shares}", inline=False)
-        em.add_field(name="Max:", value=f"{trading_limit_shares}", inline=False)
-        await ctx.send(embed=em, reference=ctx.message)
-        
-        return
 
     if not CryptoCurrency.exists(coin_name): # checks if the coin exists. if so, load up the coin
         em.add_field(name="Error", value=f"Crypto curency: {coin_name} does not exist")
         await ctx.send(embed=em, reference=ctx.message)
         return
-    else:
-        coin = CryptoCurrency(CryptoCurrency.load_coin_dict(coin_name))
-
-
-
-    # calculates the volume of the purchase
-    subtotal = 0
-    shares_traded = 0 # keeps track of the number of shares you buy
-    v = coin.value # v keeps track of the value as we calculate the purchase
-    shares_total = shares # the total number of shares bought
-    # so as long as shares > 0, this loop will continue to run. or so long as the value dosent crash or surpass the
-    # maximum value.
-    while (shares > 0 and v> coin.delete_value and v < coin.max_value):
-
-        deduted_shares = min(shares_per_interval, shares) # the number of shares we calculate per iteration
+    coin_uid = coin_index.uid_of(coin_name)
 
-        v = coin.calc_value(v, deduted_shares, buying=True) # given the number of shares, calculate the new v
-        #print(v)
-        subtotal += coin.calc_cost(v, deduted_shares) # calculates the subtotal given v and the number of shares
-
-        shares -= deduted_shares # subtracts the number of shares we used this iteration
-        shares_traded += deduted_shares # increment the number of shares traded
-
-    # calculates the total. including taxes if applicable
-    total = user.calc_tax(account_name=account_name, subtotal=subtotal)
+    window = config.current.auction_window
+    if window > 0: # the purchase joins the coin's batch auction. see src/utils/auction.py
+        result = await auction.submit(ctx.author.id, account_name, coin_uid, "buy", shares, window)
+    else: # locks the user and the coin. the engine makes the trade, the embed is sent once the transaction is over
+        async with Transaction(users=[ctx.author.id], coins=[coin_uid]) as tx:
+            result = await trade(tx, ctx.author.id, account_name, coin_uid, "buy", shares) # see src/utils/trading.py
 
+    if result["error"] == "coin": # the coin crashed while we were waiting for it
+        em.add_field(name="Error", value=f"Crypto curency: {coin_name} does not exist")
 
+    elif result["error"] == "shares": # if the user has attempted to trade more shares than they are allowed to.
+        em.add_field(name="Error", value="Shares exceed trading limit.", inline=False)
+        em.add_field(name="To buy:", value=f"{shares}", inline=False)
+        em.add_field(name="Max:", value=f"{config.current.trading_limit_shares}", inline=False)
 
-    # a number of checks to ensure the purchase is valid
     # shares you can afford instead tells you to check >can_afford
-    if not user.has_enough_balance(account_name=account_name, cost=total): # if the user cannot afford to pay
+    elif result["error"] == "balance": # if the user cannot afford to pay
         em.add_field(name="Error", value="Does not have enough money.", inline=False)
-        em.add_field(name="Has:", value=f"${round(user.accounts[account_name]['balance'],4)}", inline=False)
-        em.add_field(name="Needs:", value=f"${round(total,4)}", inline=False)
-        em.add_field(name="Shares you can afford:", value=f"{int(user.accounts[account_name]['balance'] / coin.value)}", inline=False)
-        await ctx.send(embed=em, reference=ctx.message)
-        return
+        em.add_field(name="Has:", value=f"${fmt_money(result['budget'])}", inline=False)
+        em.add_field(name="Needs:", value=f"${fmt_money(result['total'])}", inline=False)
+        em.add_field(name="Shares you can afford:", value=f"{int(to_dollars(result['budget']) / result['previous'])}", inline=False)
 
-    if user.volume_exceeds_trade_limit(account_name=account_name, volume=subtotal): # if the volume of the purchase exceeds the limit
+    elif result["error"] == "volume": # if the volume of the purchase exceeds the limit
         # uses subtotal instead of total
         em.add_field(name="Error", value="Subtotal exceeds trading limit.", inline=False)
-        em.add_field(name="Subtotal:", value=f"${round(subtotal,4)}", inline=False)
-        em.add_field(name="Limit:", value=f"${taxed_trading_limit_dollars if account_name=='ntfa' else tax_free_trading_limit_dollars}", inline=False)
-
-        await ctx.send(embed=em, reference=ctx.message)
-        return
-
-    # if all those checks are passed, then make the purchase
-    user.modify_account(account_name=account_name, amount=-total) # when buying, amount is (-)
-    coin.change_currency_value(v) # changes the value of the currency
-    user.increase_holding(account_name=account_name, coin_name=coin_name, shares=shares_traded) # modifies the holding
-
-
-
-    coin.should_delete() # checks if the coin has crashed.
+        em.add_field(name="Subtotal:", value=f"${fmt_money(result['subtotal'])}", inline=False)
+        em.add_field(name="Limit:", value=f"${config.current.taxed_trading_limit_dollars if account_name=='ntfa' else config.current.tax_free_trading_limit_dollars}", inline=False)
 
-    # saves
-    #coin.save()
-    coin.cache()
-    user.save()
-
-    # the embed showing success
-    em.add_field(name="Success", value=f"Successfully purchased {shares_traded} coin/s of {coin_name} for ${round(total,4)}")
-
-    # log the output
-    logMsg(f"{ctx.author.name} bought {shares_traded} coin/s of {coin_name} for ${round(subtotal, 4)} from their {account_name.upper()} account. {coin_name} is now worth ${v}")
+    else: # the embed showing success
+        em.add_field(name="Success", value=f"Successfully purchased {result['shares']} coin/s of {coin_name} for ${fmt_money(result['total'])}")
 
     await ctx.send(embed=em, reference=ctx.message)
 
@@ -1064,12 +1282,8 @@ async def sell(ctx, account_name:str, coin_name:str, shares:int): # sell a curre
     Finally, we make some final checks to see if the sale is valid. (has enough shares, dosent exceed limits)
     then we can make the sale and save.
 
-    When calculating the value, it is compounded. we calculate the value of the currency and sales 50 shares at a time.
-    This way, the cost of the sale is more accurate than if it was all calculated in 1 sitting.
-    we have temp variables like v and shares_traded so we know how much has been traded so far.
-    v is gradually increased every iteration and after the loop, is assigned to coin.value. meanwhile, shares_traded is
-    in case the value crashes or reaches the maximum value before it finishes calculations. this way, the value does not
-    go out of hand and the user is not charged unjustly.
+    the market engine prices the sale and changes the value of the currency. the value is compounded, so the cost of
+    the sale is more accurate than if it was all calculated in 1 sitting. (see CryptoCurrency.quote())
     """
 
     if ctx.author.bot: return  # does not answer to bots
@@ -1083,89 +1297,233 @@ async def sell(ctx, account_name:str, coin_name:str, shares:int): # sell a curre
         return
 
     shares = floor(shares) # makes sure all shares bought are int. not float.
-    user = User(ctx.author.id)  # loads the user
+
+    if not CryptoCurrency.exists(coin_name): # checks if the coin exists. if so, load up the coin
+        em.add_field(name="Error", value=f"Crypto curency: {coin_name} does not exist")
+        await ctx.send(embed=em, reference=ctx.message)
+        return
+    coin_uid = coin_index.uid_of(coin_name)
+
+    window = config.current.auction_window
+    if window > 0: # the sale joins the coin's batch auction. see src/utils/auction.py
+        result = await auction.submit(ctx.author.id, account_name, coin_uid, "sell", shares, window)
+    else: # locks the user and the coin. the engine makes the trade, the embed is sent once the transaction is over
+        async with Transaction(users=[ctx.author.id], coins=[coin_uid]) as tx:
+            result = await trade(tx, ctx.author.id, account_name, coin_uid, "sell", shares) # see src/utils/trading.py
+
+    if result["error"] == "coin": # the coin crashed while we were waiting for it
+        em.add_field(name="Error", value=f"Crypto curency: {coin_name} does not exist")
 
     # if the user has attempted to trade more shares than they are allowed to.
-    if user.shares_exceeds_trade_limit(shares):
+    elif result["error"] == "shares":
         # uses the shares_total
         em.add_field(name="Error", value="Shares exceed trading limit.", inline=False)
         em.add_field(name="To buy:", value=f"{shares}", inline=False)
-        em.add_field(name="Max:", value=f"{trading_limit_shares}",inline=False)
-        await ctx.send(embed=em, reference=ctx.message)
-       
-        return
+        em.add_field(name="Max:", value=f"{config.current.trading_limit_shares}",inline=False)
 
-    if not CryptoCurrency.exists(coin_name): # checks if the coin exists. if so, load up the coin
+    elif result["error"] == "holdings":
+        em.add_field(name="Error", value="Not enough shares to sell.", inline=False)
+        em.add_field(name="To Sell:", value=f"{shares}",inline=False)
+        em.add_field(name="Has:", value=f"{result['held']}", inline=False)
+
+    # if the volume of the purchase exceeds the limit
+    elif result["error"] == "volume":
+        # uses subtotal instead of total
+        em.add_field(name="Error", value="Subtotal exceeds trading limit.", inline=False)
+        em.add_field(name="Subtotal:", value=f"${fmt_money(result['subtotal'])}", inline=False)
+        em.add_field(name="Limit:", value=f"${config.current.taxed_trading_limit_dollars if account_name=='ntfa' else config.current.tax_free_trading_limit_dollars}", inline=False)
+
+    else: # the embed for successful trades
+        em.add_field(name="Success", value=f"Successfully sold {result['shares']} coin/s of {coin_name} for ${fmt_money(result['subtotal'])}")
+
+    await ctx.send(embed=em, reference=ctx.message)
+
+order_reasons = { # why an order left the book. see src/utils/trading.py
+    "filled": "was filled",
+    "cancelled": "was cancelled",
+    "expired": f"expired after {max_days} days",
+    "coin": "was cancelled, the coin crashed",
+    "shares": "was cancelled, the shares exceed the trading limit",
+    "holdings": "was cancelled, you did not have enough shares to sell",
+    "balance": "was cancelled, you did not have enough money",
+    "volume": "was cancelled, its subtotal exceeds the trading limit",
+    "error": "was cancelled, it could not be made",
+}
+
+def describe_order(order)->str:
+    coin_name = coin_index.name_of(order.coin) or "a crashed coin"
+    return f"#{order.id}: {order.kind} {order.side} {order.shares} {coin_name} at ${order.price} ({order.account})"
+
+def order_closed(order, reason:str): # dm's the user when one of their orders leaves the book
+    em = discord.Embed(title="Order", colour=c.green() if reason == "filled" else c.orange())
+    em.add_field(name=describe_order(order), value=f"Your order {order_reasons.get(reason, 'was cancelled')}.")
+    outbox.send(order.uid, embed=em)
+
+order_book.notify = order_closed
+
+@bot.command()
+async def order(ctx, account_name:str, side:str, kind:str, coin_name:str, shares:int, price:float):
+    """
+    Places an order that buys or sells the coin once its value reaches :price:.
+
+    it rests in the order book until a tick moves the value to its price, then it is made like a '>buy' or '>sell'.
+    (see src/utils/orders.py)
+    """
+    if ctx.author.bot: return  # does not answer to bots
+
+    em = discord.Embed(title="Order", color=c.blue())
+    em.set_thumbnail(url=ctx.author.avatar_url)  # the avatar
+    side, kind = side.lower(), kind.lower()
+
+    if account_name not in ("ntfa", "tfa"):
+        em.add_field(name="Error", value="The account must be ntfa or tfa.")
+    elif (side, kind) not in directions:
+        em.add_field(name="Error", value=f"There are no {kind} {side} orders. use; '>help order'")
+    elif shares < 1:
+        em.add_field(name="Error", value="You must order at least 1 share.")
+    elif shares > config.current.trading_limit_shares:
+        em.add_field(name="Error", value="Shares exceed trading limit.", inline=False)
+        em.add_field(name="Max:", value=f"{config.current.trading_limit_shares}", inline=False)
+    elif price <= 0:
+        em.add_field(name="Error", value="The price must be more than $0.")
+    elif not CryptoCurrency.exists(coin_name):
         em.add_field(name="Error", value=f"Crypto curency: {coin_name} does not exist")
+    elif len(order_book.user_orders(ctx.author.id)) >= max_orders:
+        em.add_field(name="Error", value=f"You can only have {max_orders} orders. use; '>cancel_order'")
+    if em.fields:
         await ctx.send(embed=em, reference=ctx.message)
         return
-    else:
-        coin = CryptoCurrency(CryptoCurrency.load_coin_dict(coin_name))
 
+    coin_uid = coin_index.uid_of(coin_name)
+    async with Transaction(users=[ctx.author.id]) as tx: # the order and its expiry are committed together
+        record = order_book.place_record(ctx.author.id, account_name, coin_uid, side, kind, price, floor(shares))
+        tx.add_record(record)
+        order_id = record["order"][0]
+        tx.set_timer(expiry_key(order_id), max_days * 86400, kind="order_expiry", data=order_id)
+        await tx.commit()
 
+    em.add_field(name="Placed", value=describe_order(order_book.get(order_id)))
+    await ctx.send(embed=em, reference=ctx.message)
 
-    # calculates the volume of the purchase
-    subtotal = 0
-    shares_traded = 0 # keeps track of the number of shares you buy
-    v = coin.value # v keeps track of the value as we calculate the purchase
-    shares_total = shares # the total number of shares bought
-    # so as long as shares > 0, this loop will continue to run. or so long as the value dosent crash or surpass the
-    # maximum value.
-    while (shares > 0 and v> coin.delete_value and v < coin.max_value):
+@bot.command(aliases=["os"])
+async def orders(ctx): # lists the user's orders
+    if ctx.author.bot: return  # does not answer to bots
 
-        deduted_shares = min(shares_per_interval, shares) # the number of shares we calculate per iteration
+    em = discord.Embed(title="Orders", color=c.blue())
+    placed = order_book.user_orders(ctx.author.id)
+    em.add_field(name=f"{len(placed)}/{max_orders} orders",
+                 value="\n".join(describe_order(order) for order in placed) or "You have no orders.")
+    await ctx.send(embed=em, reference=ctx.message)
 
-        v = coin.calc_value(v, deduted_shares, buying=False ) # given the number of shares, calculate the new v
-        subtotal += coin.calc_cost(v, deduted_shares) # calculates the subtotal given v and the number of shares
+@bot.command(aliases=["co"])
+async def cancel_order(ctx, order_id:int):
+    if ctx.author.bot: return  # does not answer to bots
 
-        shares -= deduted_shares # subtracts the number of shares we used this iteration
-        shares_traded += deduted_shares # increment the number of shares traded
+    em = discord.Embed(title="Order", color=c.blue())
+    async with Transaction(users=[ctx.author.id]) as tx: # an order being made holds the lock until it is filled
+        order = order_book.get(order_id)
+        if order is None or order.uid != ctx.author.id: # or it was filled while we waited
+            em.add_field(name="Error", value=f"You have no order #{order_id}. use; '>orders'")
+        else:
+            tx.add_record(order_book.done_record(order_id, "cancelled"))
+            await tx.commit()
+            em.add_field(name="Cancelled", value=describe_order(order))
+    await ctx.send(embed=em, reference=ctx.message)
 
+def describe_alert(alert)->str:
+    coin_name = coin_index.name_of(alert.coin) or "a crashed coin"
+    return f"#{alert.id}: {coin_name} {alert.direction} ${alert.price}"
 
+def alerts_went_off(uid:int, alerts:list): # dm's a user every alert of theirs that went off in a tick
+    em = discord.Embed(title="Price alerts", colour=c.orange())
+    snapshot = market.snapshot # the values '>view' and '>list' show
+    for alert in alerts:
+        coin = snapshot.coins.get(alert.coin)
+        value = "The coin crashed." if coin is None else f"{coin.name} is now worth {coin.value_text}"
+        em.add_field(name=describe_alert(alert), value=value, inline=False)
+    outbox.send(uid, embed=em)
 
-    # a number of extra checks to make sure the trade is valid
-    if not user.has_enough_shares(account_name=account_name, coin_name=coin_name, shares=shares_total):
-        # uses shares_total
-        em.add_field(name="Error", value="Not enough shares to sell.", inline=False)
-        em.add_field(name="To Sell:", value=f"{shares_total}",inline=False)
-        em.add_field(name="Has:", value=f"{user.accounts[account_name]['holdings'][coin_name]}", inline=False)
-        await ctx.send(embed=em, reference=ctx.message)
-        return
+alert_book.notify = alerts_went_off
 
-    # if the volume of the purchase exceeds the limit
-    if user.volume_exceeds_trade_limit(account_name=account_name,volume=subtotal):
-        # uses subtotal instead of total
-        em.add_field(name="Error", value="Subtotal exceeds trading limit.", inline=False)
-        em.add_field(name="Subtotal:", value=f"${round(subtotal,4)}", inline=False)
-        em.add_field(name="Limit:", value=f"${taxed_trading_limit_dollars if account_name=='ntfa' else tax_free_trading_limit_dollars}", inline=False)
-        await ctx.send(embed=em, reference=ctx.message)
-        return
+@bot.command()
+async def alert(ctx, coin_name:str, direction:str, price:float):
+    """
+    Sets an alert that dm's the user once the value of the coin crosses :price:. (see src/utils/alerts.py)
+    """
+    if ctx.author.bot: return  # does not answer to bots
 
-    # sets the new balance. if it passes the limit, it caps it
-    user.cap_balance(account_name=account_name,amount=subtotal)
-    coin.change_currency_value(v)  # changes the value of the currency
-    user.decrease_holding(account_name=account_name, coin_name=coin_name,shares=shares_traded)  # modifies the holding
+    em = discord.Embed(title="Alert", color=c.blue())
+    direction = direction.lower()
+    coin = market.snapshot.by_name.get(coin_name.lower()) # the same value '>view' shows
 
+    if coin is None:
+        em.add_field(name="Error", value=f"Crypto curency: {coin_name} does not exist")
+    elif direction not in ("above", "below"):
+        em.add_field(name="Error", value="An alert is either above or below a price. use; '>help alert'")
+    elif price <= 0:
+        em.add_field(name="Error", value="The price must be more than $0.")
+    elif (direction == "above") == (coin.value >= price): # it would never cross the price
+        em.add_field(name="Error", value=f"{coin_name} is already {direction} ${price}. it is worth {coin.value_text}")
+    elif len(alert_book.user_alerts(ctx.author.id)) >= max_alerts:
+        em.add_field(name="Error", value=f"You can only have {max_alerts} alerts. use; '>cancel_alert'")
+    if em.fields:
+        await ctx.send(embed=em, reference=ctx.message)
+        return
 
+    check_coins([coin.uid]) # the alerts of the moves since the last tick go off first, the new one is only for later moves
+    placed = alert_book.place(ctx.author.id, coin.uid, direction, price)
+    await wal.sync()
 
-    coin.should_delete()  # checks if the coin has crashed.
+    em.add_field(name="Set", value=describe_alert(placed))
+    await ctx.send(embed=em, reference=ctx.message)
 
-    # saves
-    #coin.save()
-    coin.cache()
-    user.save()
+@bot.command()
+async def alerts(ctx): # lists the user's alerts
+    if ctx.author.bot: return  # does not answer to bots
 
-    # the embed for successful trades
-    em.add_field(name="Success", value=f"Successfully sold {shares_traded} coin/s of {coin_name} for ${round(subtotal,4)}")
+    em = discord.Embed(title="Alerts", color=c.blue())
+    placed = alert_book.user_alerts(ctx.author.id)
+    em.add_field(name=f"{len(placed)}/{max_alerts} alerts",
+                 value="\n".join(describe_alert(alert) for alert in placed) or "You have no alerts.")
+    await ctx.send(embed=em, reference=ctx.message)
 
-    # log the output
-    logMsg(f"{ctx.author.name} sold {shares_traded} coin/s of {coin_name} for ${round(subtotal,4)} from their {account_name.upper()} account. {coin_name} is now worth ${v}")
+@bot.command()
+async def cancel_alert(ctx, alert_id:int):
+    if ctx.author.bot: return  # does not answer to bots
 
+    em = discord.Embed(title="Alert", color=c.blue())
+    placed = alert_book.get(alert_id)
+    if placed is None or placed.uid != ctx.author.id:
+        em.add_field(name="Error", value=f"You have no alert #{alert_id}. use; '>alerts'")
+    else:
+        alert_book.cancel(alert_id)
+        await wal.sync()
+        em.add_field(name="Cancelled", value=describe_alert(placed))
     await ctx.send(embed=em, reference=ctx.message)
 
 
 # SUBPROCESSES =================================================================#
 
+@bot.event
+async def on_message(message):
+    # commands sent in a server with its own economy run in its backend. see src/utils/guilds.py
+    if message.guild is None or message.guild.id not in guild_economies or message.author.bot:
+        await bot.process_commands(message)
+        return
+    if not message.content.startswith(bot.command_prefix): return
+
+    try:
+        replies = await guild_economies.request(message.guild.id, "message",
+                                                message=message_payload(message, bot.command_prefix))
+    except RpcError as error:
+        logMsg(f"Could not forward a command to the economy of guild {message.guild.id}: {error}")
+        em = discord.Embed(title="This server's economy is unavailable", description="Try that again in a bit.",
+                           colour=c.red())
+        await message.channel.send(message.author.mention, embed=em)
+        return
+
+    await deliver(message, replies)
+
 """@bot.event
 async def on_message(message): # if kuki annoys me, reply
     if "krypto bot where" in message.content.lower():
@@ -1173,18 +1531,25 @@ async def on_message(message): # if kuki annoys me, reply
 
 
 # Run command and all the subprocesses
-# subprocesses:
-#   simulate all currencies
-#   add new currencies if need be
+# subprocesses, run by the scheduler(see src/utils/scheduler.py) in this order every minute they are due:
 #   reload constants
 #   add shares
+#   simulate all currencies
+#   make the orders the new values triggered
+#   send the price alerts that went off
+#   add new currencies if need be
+#   clean up the holders of crashed coins
+#   compact the write ahead log
+#   snapshot the economy for replays
 #   print cache
+#   hibernate idle guild economies
 #   change status?
-simulate_cache.start()
-add_currencies.start()
-reload_constants.start()
-add_shares.start()
-print_cache.start()
+scheduler.start()
+timers.start() # fires the timers of users. see src/utils/timers.py
+outbox.start(bot) # sends the dms. see src/utils/outbox.py
 # changes status
 
-bot.run(imp_info["token"]) # runs the bot
+if imp_info.get("backend socket"): # the shards talk to discord. see src/shard.py
+    asyncio.get_event_loop().run_until_complete(run_backend())
+else:
+    bot.run(imp_info["token"]) # runs the bot
@@ -0,0 +1,47 @@
+"""
+A shard of the bot.
+
+Connects to the gateway for some of the bot's shards and forwards every command to the economy backend, then sends
+what it replied. (see src/utils/shards.py) the backend has to be running first:
+    python -m src.main           # with "backend socket" set in imp_info.json
+    python -m src.shard 0,1 4    # shards 0 and 1 of 4
+    python -m src.shard 2,3 4    # shards 2 and 3 of 4
+"""
+import sys
+import discord
+from discord.ext import commands
+from src.utils.json_utils import load_json
+from src.utils.log import setup_logging, logMsg
+from src.utils.rpc import RpcClient, RpcError
+from src.utils.shards import message_payload, deliver
+
+setup_logging()
+
+imp_info = load_json("src/kryptonite_bot/imp_info.json") # loads the important info
+
+shard_ids = [int(shard_id) for shard_id in sys.argv[1].split(",")]
+shard_count = int(sys.argv[2])
+
+bot = commands.AutoShardedBot(command_prefix=">", help_command=None, shard_ids=shard_ids, shard_count=shard_count)
+backend = RpcClient(imp_info["backend socket"], "economy backend", timeout=30)
+
+@bot.event
+async def on_ready():
+    logMsg(f"shards {shard_ids} of {shard_count} online")
+    await bot.change_presence(activity=discord.Game(name=">help"))
+
+@bot.event
+async def on_message(message):
+    if message.author.bot or not message.content.startswith(bot.command_prefix): return
+
+    try:
+        replies = await backend.request("message", message=message_payload(message, bot.command_prefix))
+    except RpcError as error:
+        logMsg(f"Could not forward a command: {error}")
+        em = discord.Embed(title="The bot is restarting", description="Try that again in a bit.", colour=discord.Color.red())
+        await message.channel.send(message.author.mention, embed=em)
+        return
+
+    await deliver(message, replies)
+
+bot.run(imp_info["token"])
@@ -0,0 +1,76 @@
+import asyncio
+import sys
+from random import randint, choice
+from src.utils.json_utils import load_json
+from src.utils.rpc import RpcClient
+from src.utils.shards import shard_of
+from src.utils.money import to_money
+"""
+Tester for sharding. runs a fake gateway against a running economy backend, no discord needed.
+Date: 2026-10-19
+objective:
+    starts the backend with "backend socket" set in imp_info.json. (python -m src.main)
+    fake shards each get their own connection to the backend, like separate shard processes would.
+    messages from fake guilds are routed to the shard discord would send them to, all at the same time.
+    afterwards, the balances of every fake user are checked. transfers between them can only move money around.
+
+    python -m src.shard_test [shard count] [messages per user]
+"""
+
+imp_info = load_json("src/kryptonite_bot/imp_info.json")
+
+class FakeGateway:
+    def __init__(self, shard_count:int, guilds:int=6, users:int=8):
+        """
+        Fake guilds full of fake users. every shard is a connection to the backend.
+        """
+        self.shard_count = shard_count
+        self.shards = [RpcClient(imp_info["backend socket"], f"backend(shard {shard_id})", timeout=60)
+                       for shard_id in range(shard_count)]
+        self.guilds = [{"id": (randint(1, 2**20) << 22) + i, "name": f"guild {i}"} for i in range(guilds)]
+        self.users = [{"id": 10**17 + i, "name": f"user {i}", "bot": False, "avatar_url": ""} for i in range(users)]
+        self.sent = 0
+
+    async def send(self, guild:dict, author:dict, content:str, mentions=())->list:
+        # sends a message through the shard the guild belongs to, returns the replies
+        shard = self.shards[shard_of(guild["id"], self.shard_count)]
+        self.sent += 1
+        message = {"id": self.sent, "content": content, "author": author, "mentions": list(mentions),
+                   "guild": dict(guild, members=[user["id"] for user in self.users])}
+        return await shard.request("message", message=message)
+
+def wallet_of(replies:list)->int:
+    # the wallet field of '>bal', in money units
+    for reply in replies:
+        for field in (reply["embed"] or {}).get("fields", ()):
+            if field["name"] == "Wallet": return to_money(field["value"].lstrip("$"))
+    return None
+
+async def user_session(gateway:FakeGateway, author:dict, messages:int):
+    # one user sending money to random users in random guilds. cooldowns refuse some of them, like they would in discord
+    for _ in range(messages):
+        guild = choice(gateway.guilds)
+        other = choice(gateway.users)
+        await gateway.send(guild, author, f">transfer 1 <@{other['id']}>", mentions=[other])
+        await asyncio.sleep(0.1)
+
+async def run_test(shard_count:int=4, messages:int=20):
+    gateway = FakeGateway(shard_count)
+    guild = gateway.guilds[0]
+
+    for user in gateway.users: # everyone gets some money to send around
+        await gateway.send(guild, user, ">init")
+        await gateway.send(guild, user, ">daily")
+
+    before = [wallet_of(await gateway.send(guild, user, ">bal")) for user in gateway.users]
+    await asyncio.gather(*(user_session(gateway, user, messages) for user in gateway.users))
+    after = [wallet_of(await gateway.send(guild, user, ">bal")) for user in gateway.users]
+
+    print(f"sent {gateway.sent} messages through {shard_count} shards")
+    for user, old, new in zip(gateway.users, before, after):
+        print(f"{user['name']}: {old} -> {new}")
+    print(f"total: {sum(before)} -> {sum(after)}. {'ok' if sum(before) == sum(after) else 'MONEY WAS LOST OR CREATED'}")
+    print(await gateway.send(guild, gateway.users[0], ">lb server"))
+
+if __name__ == '__main__':
+    asyncio.run(run_test(*(int(arg) for arg in sys.argv[1:3])))
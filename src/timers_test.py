@@ -0,0 +1,83 @@
+import sys
+from random import Random
+from src.utils.timers import TimerWheel, slots, rebuild_after, max_delay
+"""
+Tester for the timing wheel.
+Date: 2026-10-19
+objective:
+    sets, replaces and cancels random timers in a TimerWheel and in a plain dict of due times at the same time.
+    the wheel is advanced by steps of every size: single seconds, jumps across the blocks of every level and jumps so
+    big that the wheel is rebuilt instead of stepped.
+    after every advance, the timers that fired have to be exactly the ones the dict says are due, in the order they
+    were due.
+
+    python -m src.timers_test [rounds] [seed]
+"""
+
+delays = [1, 5, slots - 1, slots, slots + 1, slots ** 2, slots ** 3 + 7, slots ** 4, max_delay] # seconds ahead
+
+def random_due(wheel:TimerWheel, rng:Random)->int:
+    # mostly in the next few blocks, sometimes already due
+    if rng.random() < 0.05: return wheel.now - rng.randint(0, 100)
+    return wheel.now + rng.randint(1, rng.choice(delays))
+
+def random_step(rng:Random)->int:
+    return rng.choice([1, 1, 2, rng.randint(1, slots), rng.randint(slots, slots ** 2), rng.randint(1, rebuild_after),
+                       rebuild_after + rng.randint(1, slots ** 3), rng.randint(slots ** 3, slots ** 4)])
+
+def random_test(rounds:int=3000, seed:int=0):
+    rng = Random(seed)
+    wheel = TimerWheel(path="")
+    wheel.now = slots ** 3 - 17 # a few seconds before the blocks of 3 levels end
+    expected = {} # key -> due
+    fired_count = 0
+
+    for _ in range(rounds):
+        for _ in range(rng.randint(0, 8)): # sets or replaces timers
+            key = f"timer:{rng.randint(0, 300)}"
+            due = random_due(wheel, rng)
+            wheel.set(key, due, kind="test")
+            expected[key] = due
+        for _ in range(rng.randint(0, 3)): # cancels some
+            key = f"timer:{rng.randint(0, 300)}"
+            assert wheel.cancel(key) == (expected.pop(key, None) is not None), key
+
+        to = wheel.now + random_step(rng)
+        fired = wheel.advance(to)
+        due = sorted((due, key) for key, due in expected.items() if due <= to)
+        for _, key in due:
+            del expected[key]
+
+        assert sorted(timer.key for timer in fired) == sorted(key for _, key in due), (to, fired, due)
+        assert [timer.due for timer in fired] == sorted(timer.due for timer in fired), "fired out of order"
+        assert len(wheel) == len(expected) and set(wheel.timers) == set(expected)
+        assert wheel.now == to
+        fired_count += len(fired)
+
+    fired_count += len(wheel.advance(wheel.now + max_delay + 1)) # everything left fires
+    assert not wheel.timers
+    print(f"{rounds} rounds, {fired_count} timers fired: ok")
+
+def boundary_test():
+    # a timer on the last second of every level's block and the first second of the next
+    wheel = TimerWheel(path="")
+    wheel.now = slots ** 4 - slots ** 2 # far enough from the end of the top block for every delay below
+    for level in range(1, 5):
+        end = (wheel.now // slots ** level + 1) * slots ** level
+        for due in (end - 1, end, end + 1):
+            wheel.set(f"{level}:{due}", due, kind="test")
+
+    fired = []
+    while wheel.timers:
+        before = wheel.now
+        for timer in wheel.advance(wheel.now + 1):
+            assert timer.due == wheel.now, (timer.key, before)
+            fired.append(timer.key)
+    assert len(fired) == 12
+    print("block boundaries: ok")
+
+if __name__ == '__main__':
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 3000
+    seed = int(sys.argv[2]) if len(sys.argv) > 2 else 0
+    boundary_test()
+    random_test(rounds, seed)
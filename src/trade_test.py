@@ -9,9 +9,9 @@ def exists_test(coin_name:str):
     # simulates if a coin exists
     print(CryptoCurrency.exists(coin_name))
 
-def load_dict_test(coin_name:str):
-    # tests CryptoCurrency.load_coin_dict()
-    print(CryptoCurrency.load_coin_dict(coin_name))
+def load_coin_test(coin_name:str):
+    # tests CryptoCurrency.load_coin()
+    print(CryptoCurrency.load_coin(coin_name))
 
 def calc_value_test(coin:CryptoCurrency, shares:int, buying:bool):
     # calculates the value after buying a few shares
@@ -49,7 +49,7 @@ def calc_taxes_test(user:User, coin:CryptoCurrency, shares:int, buying:bool):
     # only returned so i can use this in other tests
     return {'value':v, 'subtotal':subtotal, 'taxed_total':taxed_total, 'tax_free total': tax_free_total}
 
-def conditions_test(user:User, account_name:str, subtotal:float, total:float, shares:int):
+def conditions_test(user:User, account_name:str, subtotal:int, total:int, shares:int):
     # tests the entire block of conditions
     #
     # this command to test:
@@ -58,12 +58,12 @@ def conditions_test(user:User, account_name:str, subtotal:float, total:float, sh
     #
     # todo:
     #   rewrite these unit tests to be more specific and thorough. the stuff works, but the unit tests arent good
-    print(total, user.accounts[account_name]["balance"])
+    print(total, user.accounts[account_name].balance)
     if not user.has_enough_balance(account_name=account_name, cost=total): return "Does not have enough money"
     if user.volume_exceeds_trade_limit(account_name=account_name, volume=subtotal): return "subtotal exceeds trading limit" # uses subtotal instead of total
     if user.shares_exceeds_trade_limit(shares): return "Shares exceed trading limit"
 
-def modify_account_test(user:User, account_name:str, total:float, buying:bool):
+def modify_account_test(user:User, account_name:str, total:int, buying:bool):
     # modifies the account.
     # this has 2 scenarios:
     #    buying             total = -total
@@ -78,20 +78,20 @@ def change_value_test(coin:CryptoCurrency, value):
     coin.change_currency_value(value)
     print("new value: ", coin.value)
 
-def holding_exists_test(user:User, account_name:str, coin_name:str):
+def holding_exists_test(user:User, account_name:str, coin_uid:int):
     # checks if the holding exists in the account specified by the user.
-    print(user.holding_exists(account_name, coin_name))
+    print(user.holding_exists(account_name, coin_uid))
 
-def increase_holding_test(user:User, account_name:str, coin_name:str, shares:int):
+def increase_holding_test(user:User, account_name:str, coin_uid:int, shares:int):
     # increases the holding of a certain coin.
     # the points of failure are:
     #   adding a new coin
     #   modifying an existing one
     #   increments num_holding if adding a new one
-    user.increase_holding(account_name, coin_name, shares)
+    user.increase_holding(account_name, coin_uid, shares)
     user.save()
 
-def decrease_holding_test(user:User, account_name:str, coin_name:str, shares:int):
+def decrease_holding_test(user:User, account_name:str, coin_uid:int, shares:int):
     # decreases the holding of a certain coin.
     # the points of failure are:
     #   when a holding drops below 0        (gets deleted)
@@ -99,23 +99,23 @@ def decrease_holding_test(user:User, account_name:str, coin_name:str, shares:int
     #   holding reaches 0                   (gets deleted)
     #   decrements num_holding if the coin is deleted
     # dont cover if the currency dosent exist as it is handled in user.has_enough_shares()
-    user.decrease_holding(account_name, coin_name, shares)
+    user.decrease_holding(account_name, coin_uid, shares)
     user.save()
 
-def has_enough_shares_test(user:User, account_name:str, coin_name:str, shares:int):
+def has_enough_shares_test(user:User, account_name:str, coin_uid:int, shares:int):
     # scenarios:
     #   doe not have a holding
     #   has a holing, not enough
     #   has a aholding, enough
-    print(user.has_enough_shares(account_name, coin_name, shares))
+    print(user.has_enough_shares(account_name, coin_uid, shares))
 
-def balance_exceeds_limit_test(user:User, account_name:str ,amount:float):
+def balance_exceeds_limit_test(user:User, account_name:str ,amount:int):
     # scenarios:
     #   does not exceed limit
     #   does
     print(user.balance_exceeds_limit(account_name, amount))
 
-def cap_balance_test(user:User, account_name:str ,amount:float):
+def cap_balance_test(user:User, account_name:str ,amount:int):
     # scenarios
     #   balance < limit
     # balance >= limit
@@ -140,7 +140,7 @@ def buy_test(uid, account_name:str, coin_name:str, shares:int):
     if CryptoCurrency.exists(coin_name) == False:
         return "Currency does not exist"
     else:
-        coin = CryptoCurrency(CryptoCurrency.load_coin_dict(coin_name))
+        coin = CryptoCurrency.load_coin(coin_name)
 
 
 
@@ -155,15 +155,15 @@ def buy_test(uid, account_name:str, coin_name:str, shares:int):
     print("value", v)
     while (shares > 0 and (v > coin.delete_value and v < coin.max_value)):
 
-        deducted_shares = min(shares_per_interval, shares)
+        deducted_shares = min(config.current.shares_per_interval, shares)
 
         v = coin.calc_value(v,deducted_shares, buying=True) # given the number of shares, calculates the new value of v
         subtotal += coin.calc_cost(v, deducted_shares) # calculates the subtotal given v and the number of shares
 
-        if shares >= shares_per_interval:
-            shares -= shares_per_interval
+        if shares >= config.current.shares_per_interval:
+            shares -= config.current.shares_per_interval
 
-        elif shares < shares_per_interval:
+        elif shares < config.current.shares_per_interval:
             shares = 0
 
         shares_traded += deducted_shares
@@ -176,22 +176,22 @@ def buy_test(uid, account_name:str, coin_name:str, shares:int):
 
     # a number of checks for:
     if not user.has_enough_balance(account_name=account_name, cost=total): # if the user cannot afford to pay
-        return f"Does not have enough money\nHas: {user.accounts[account_name]['balance']}.\n needs: {total}"
+        return f"Does not have enough money\nHas: {user.accounts[account_name].balance}.\n needs: {total}"
 
     if user.volume_exceeds_trade_limit(account_name=account_name, volume=subtotal): # if the volume of the purchase exceeds the limit
         # uses subtotal instead of total
-        return f"subtotal exceeds trading limit\nsubtotal: {subtotal}\nlimit: {taxed_trading_limit_dollars} {tax_free_trading_limit_dollars}"
+        return f"subtotal exceeds trading limit\nsubtotal: {subtotal}\nlimit: {config.current.taxed_trading_limit_dollars} {config.current.tax_free_trading_limit_dollars}"
 
 
     if user.shares_exceeds_trade_limit(shares_total): # if the user has attempted to trade more shares than they are allowed to.
         # uses the shares_total
-        return f"Shares exceed trading limit. \nto buy: {shares_total}\nmax:{trading_limit_shares}"
+        return f"Shares exceed trading limit. \nto buy: {shares_total}\nmax:{config.current.trading_limit_shares}"
 
 
 
     user.modify_account(account_name=account_name, amount=-total) # when buying, amount is +, selling, -
     coin.change_currency_value(v) # changes the value of the currency
-    user.increase_holding(account_name=account_name, coin_name=coin_name, shares=shares_traded) # modifies the holding
+    user.increase_holding(account_name=account_name, coin_uid=coin.uid, shares=shares_traded) # modifies the holding
 
     coin.should_delete()
     coin.save()
@@ -212,7 +212,7 @@ def sell_test(uid, account_name:str, coin_name:str, shares:int):
     if CryptoCurrency.exists(coin_name) == False:
         return "Currency does not exist"
     else:
-        coin = CryptoCurrency(CryptoCurrency.load_coin_dict(coin_name))
+        coin = CryptoCurrency.load_coin(coin_name)
 
     # actually calculates the volume of the purchase
     subtotal = 0
@@ -222,15 +222,15 @@ def sell_test(uid, account_name:str, coin_name:str, shares:int):
     print("init value: ", v)
     while (shares > 0 and (v > coin.delete_value and v < coin.max_value)):  # determine how many times this runs. this section's "shares" will be replaced
 
-        deducted_shares = min(shares_per_interval, shares)
+        deducted_shares = min(config.current.shares_per_interval, shares)
 
         v = coin.calc_value(v, deducted_shares, buying=False)  # given the number of shares, calculates the new value of v
         subtotal += coin.calc_cost(v, deducted_shares)  # calculates the subtotal given v and the number of shares
 
-        if shares >= shares_per_interval:
-            shares -= shares_per_interval
+        if shares >= config.current.shares_per_interval:
+            shares -= config.current.shares_per_interval
 
-        elif shares < shares_per_interval:
+        elif shares < config.current.shares_per_interval:
             shares = 0
 
         shares_traded += deducted_shares
@@ -240,25 +240,25 @@ def sell_test(uid, account_name:str, coin_name:str, shares:int):
 
     # a number of extra checks to make sure the trade is valid------------
 
-    if not user.has_enough_shares(account_name=account_name, coin_name=coin_name, shares=shares_total):
+    if not user.has_enough_shares(account_name=account_name, coin_uid=coin.uid, shares=shares_total):
         # uses shares_total
         # if the coin does not exist in their holdings, it means they have no shares
-        try: return f"not enough shares to sell\nto sell: {shares_total}\nhas: {user.accounts[account_name]['holdings'][coin_name]}"
+        try: return f"not enough shares to sell\nto sell: {shares_total}\nhas: {user.accounts[account_name].holdings[coin.uid]}"
         except KeyError: return f"You dont own {coin_name}"
 
 
     if user.volume_exceeds_trade_limit(account_name=account_name,volume=subtotal): # if the volume of the purchase exceeds the limit
         # uses subtotal instead of total
-        return f"subtotal exceeds trading limit\nsubtotal: {subtotal}\nlimit: {taxed_trading_limit_dollars} {tax_free_trading_limit_dollars}"
+        return f"subtotal exceeds trading limit\nsubtotal: {subtotal}\nlimit: {config.current.taxed_trading_limit_dollars} {config.current.tax_free_trading_limit_dollars}"
 
     if user.shares_exceeds_trade_limit(shares_total): # if the user has attempted to trade more shares than they are allowed to.
         # uses the shares_total
-        return f"Shares exceed trading limit. \nto buy: {shares_total}\nmax:{trading_limit_shares}"
+        return f"Shares exceed trading limit. \nto buy: {shares_total}\nmax:{config.current.trading_limit_shares}"
 
 
     user.cap_balance(account_name=account_name, amount=subtotal) # sets the new balance. if it passes the limit, it caps it
     coin.change_currency_value(v)  # changes the value of the currency
-    user.decrease_holding(account_name=account_name, coin_name=coin_name, shares=shares_traded)  # modifies the holding
+    user.decrease_holding(account_name=account_name, coin_uid=coin.uid, shares=shares_traded)  # modifies the holding
 
     coin.should_delete()
     coin.save()
@@ -275,16 +275,16 @@ def buying_interval_test(shares:int):
     #   shares < shares_per_interval                    (dosent matter if divisble anyway)
     while shares > 0:
 
-        deducted_shares = min(shares_per_interval, shares)
+        deducted_shares = min(config.current.shares_per_interval, shares)
 
         print("shares: ", shares)
         print("deducted: ", deducted_shares)
         print("")
 
-        if shares >= shares_per_interval:
-            shares -= shares_per_interval
+        if shares >= config.current.shares_per_interval:
+            shares -= config.current.shares_per_interval
 
-        elif shares < shares_per_interval:
+        elif shares < config.current.shares_per_interval:
             shares = 0
 
     print("shares: ", shares)
@@ -306,8 +306,8 @@ if __name__ == '__main__':
 
     #calc_value_test(coin, shares=shares, buying=True)
 
-    print(buy_test(1, "tfa", crypto_cache[0]["name"], shares))
+    print(buy_test(1, "tfa", coin.name, shares))
 
-    #cap_balance_test(User(1), "ntfa", amount=100)
+    #cap_balance_test(User(1), "ntfa", amount=to_money(100))
 
-    #print(sell_test(1, "tfa", crypto_cache[0]["name"], shares=shares))
\ No newline at end of file
+    #print(sell_test(1, "tfa", coin.name, shares=shares))
\ No newline at end of file
@@ -11,7 +11,7 @@ def deposit_test(exceeds:bool=False):
     # tests using a regular deposit
     # then with a deposit that exceeds the wallet
     # testing for the wrong bank account will be in the bot's method
-    amount = 50
+    amount = to_money(50)
     user = User(1)
     user.wallet = amount
     if not exceeds: print(user.bank_deposit(amount, "tfa"))
@@ -23,9 +23,9 @@ def withdraw_test(exceeds:bool=False):
     # tests using a regular withdrawal
     # and one that withdraws more money than in the bank account
     # testing for the wrong account will be in the bot's method
-    amount = 50
+    amount = to_money(50)
     user = User(1)
-    user.accounts["tfa"]["balance"] = amount
+    user.accounts["tfa"].balance = amount
     if exceeds: print(user.bank_withdraw(2*amount, "tfa"))
     else: print(user.bank_withdraw(amount, "tfa"))
     user.save()
@@ -39,20 +39,22 @@ def transfer_test(scenario:str="normal"):
     # trading wallet > trading limit
     # negative values are handled by the bot's method
 
-    amount = 49_999
-    if scenario == ">trading_limit": amount +=2
+    amount = to_money(49_999)
+    if scenario == ">trading_limit": amount +=to_money(2)
 
     user1 = User(1)
 
     user1.wallet = amount
 
-    if scenario == ">wallet": amount +=1
+    if scenario == ">wallet": amount +=to_money(1)
 
-    print(user1.transfer(amount, 2))
+    user2 = User(2)
+    print(user1.transfer(amount, user2))
 
     user1.save()
+    user2.save()
 
-def tax_test(account:str, amount:float):
+def tax_test(account:str, amount:int):
     # calculates the total(including tax)
     # scenarios:
     #   tfa account
@@ -0,0 +1,209 @@
+"""
+Price alerts.
+
+A user can ask to be told when a coin crosses a price: '>alert kuki-bux above 20'. an alert goes off once, the first
+time the value of the coin moves from below its price to at or above it(or from above to at or below, for "below"),
+then it is gone.
+
+each coin keeps its alerts in two lists sorted by price, one per direction. after every tick, the alerts that went off
+are the ones whose price is between the value at the last check and the new value, so they are found with two bisects
+and cut out of the list as one slice, no matter how many alerts the coin has.
+
+alerts are logged in the write ahead log and written to src/db/alerts.json when it is compacted, like orders. (see
+orders.py) every user gets one dm per tick, with every alert of theirs that went off in it. it is sent by the outbox,
+so the tick never waits for discord. (see outbox.py)
+"""
+import bisect
+import time
+from src.utils.json_utils import *
+from src.utils.crypto_currency import crypto_cache
+from src.utils.wal import wal
+from src.utils.scheduler import scheduler
+from src.utils.log import logEvent, logMsg
+
+max_alerts = 25 # the most alerts a user can have at once
+
+class Alert:
+    # slots keep every alert small
+    __slots__ = ("id", "uid", "coin", "direction", "price", "placed")
+
+    def __init__(self, id:int, uid:int, coin:int, direction:str, price:float, placed:int):
+        """
+        An alert on a coin. :direction: "above" or "below" :price: in dollars :placed: in unix seconds
+        """
+        self.id = id
+        self.uid = uid
+        self.coin = coin
+        self.direction = direction
+        self.price = price
+        self.placed = placed
+
+    def to_list(self)->list:
+        return [self.id, self.uid, self.coin, self.direction, self.price, self.placed]
+
+class AlertBook:
+    def __init__(self, path:str="src/db/alerts.json"):
+        self.path = path
+        self.alerts = {} # id -> Alert
+        self.by_user = {} # user id -> the ids of their alerts
+        self.above = {} # coin id -> sorted list of (price, id)
+        self.below = {} # coin id -> sorted list of (price, id)
+        self.last = {} # coin id -> its value at the last check
+        self.next_id = 1
+        self.notify = None # called with (user id, the alerts of theirs that went off)
+
+    def __len__(self)->int:
+        return len(self.alerts)
+
+    def get(self, alert_id:int):
+        return self.alerts.get(alert_id)
+
+    def user_alerts(self, uid:int)->list:
+        return [self.alerts[alert_id] for alert_id in sorted(self.by_user.get(uid, ()))]
+
+    def coins(self)->set:
+        # the coins with alerts
+        return {coin_uid for side in (self.above, self.below) for coin_uid, entries in side.items() if entries}
+
+    def _side(self, alert:Alert)->list:
+        return (self.above if alert.direction == "above" else self.below).setdefault(alert.coin, [])
+
+    def add(self, alert:Alert):
+        self.alerts[alert.id] = alert
+        self.by_user.setdefault(alert.uid, set()).add(alert.id)
+        self.next_id = max(self.next_id, alert.id + 1)
+        bisect.insort(self._side(alert), (alert.price, alert.id))
+
+    def remove(self, alert_id:int):
+        """
+        Takes an alert out of the book. Returns it, or None.
+        """
+        alert = self.alerts.pop(alert_id, None)
+        if alert is None: return None
+        ids = self.by_user[alert.uid]
+        ids.discard(alert_id)
+        if not ids: del self.by_user[alert.uid]
+
+        entries = self._side(alert)
+        i = bisect.bisect_left(entries, (alert.price, alert.id))
+        if i < len(entries) and entries[i] == (alert.price, alert.id): # not cut out by crossed() already
+            del entries[i]
+        if not entries: (self.above if alert.direction == "above" else self.below).pop(alert.coin, None)
+        return alert
+
+    def crossed(self, coin_uid:int, old:float, new:float)->list:
+        """
+        Cuts out the alerts on the coin whose price is between :old: and :new:. they stay in the book until fire().
+        """
+        if new > old: # rose: the above alerts in (old, new]
+            entries = self.above.get(coin_uid)
+            if not entries: return []
+            lo = bisect.bisect_right(entries, (old, float("inf")))
+            hi = bisect.bisect_right(entries, (new, float("inf")))
+        elif new < old: # fell: the below alerts in [new, old)
+            entries = self.below.get(coin_uid)
+            if not entries: return []
+            lo = bisect.bisect_left(entries, (new,))
+            hi = bisect.bisect_left(entries, (old,))
+        else:
+            return []
+        crossed = [self.alerts[alert_id] for _, alert_id in entries[lo:hi]]
+        del entries[lo:hi]
+        return crossed
+
+    def check(self, coin_uid:int, value:float)->list:
+        # the alerts the coin crossed since the last check
+        old = self.last.get(coin_uid, value)
+        self.last[coin_uid] = value
+        return self.crossed(coin_uid, old, value)
+
+    def place(self, uid:int, coin_uid:int, direction:str, price:float)->Alert:
+        """
+        Places an alert and logs it. the coin should be checked first, so the alert only goes off for moves after it.
+        """
+        alert = Alert(self.next_id, uid, coin_uid, direction, price, int(time.time()))
+        record = {"op": "alert", "alert": alert.to_list()}
+        wal.append(record)
+        self.apply_record(record)
+        return alert
+
+    def cancel(self, alert_id:int):
+        # takes an alert out of the book and logs it. Returns it, or None
+        if alert_id not in self.alerts: return None
+        wal.append({"op": "alert_cancelled", "id": alert_id})
+        return self.remove(alert_id)
+
+    def fire(self, alerts:list):
+        """
+        Logs that :alerts: went off, takes them out of the book and tells their users.
+        """
+        if not alerts: return
+        record = {"op": "alerts_fired", "ids": [alert.id for alert in alerts]}
+        wal.append(record)
+        self.apply_record(record)
+
+        if self.notify is None: return
+        by_user = {}
+        for alert in alerts:
+            by_user.setdefault(alert.uid, []).append(alert)
+        for uid, alerts in by_user.items():
+            try:
+                self.notify(uid, alerts)
+            except Exception as error: # the alerts are gone either way
+                logMsg(f"Could not tell user {uid} about {len(alerts)} alerts: {type(error).__name__}: {error}")
+
+    def apply_record(self, record:dict):
+        """
+        Applies a record from the write ahead log.
+        """
+        if record["op"] == "alert":
+            self.add(Alert(*record["alert"]))
+        elif record["op"] == "alerts_fired":
+            for alert_id in record["ids"]:
+                self.remove(alert_id)
+        elif record["op"] == "alert_cancelled":
+            self.remove(record["id"])
+
+    def load(self):
+        try:
+            data = load_json(self.path)
+        except (OSError, ValueError):
+            return
+        for alert in data["alerts"]:
+            self.add(Alert(*alert))
+        self.next_id = max(self.next_id, data["next_id"])
+
+    def to_dict(self)->dict:
+        return {"next_id": self.next_id, "alerts": [alert.to_list() for alert in self.alerts.values()]}
+
+    def save(self):
+        write_json_atomic(self.path, self.to_dict())
+
+alert_book = AlertBook()
+
+def check_coins(coin_uids)->list:
+    """
+    Fires the alerts that the coins crossed since they were last checked. Returns them.
+    """
+    fired = []
+    for coin_uid in coin_uids:
+        coin = crypto_cache.get(coin_uid)
+        if coin is None: # it crashed. its alerts can never go off
+            alert_book.last.pop(coin_uid, None)
+            fired += [alert for alert in alert_book.alerts.values() if alert.coin == coin_uid]
+        else:
+            fired += alert_book.check(coin_uid, coin.value)
+    alert_book.fire(fired)
+    return fired
+
+@scheduler.job(every=1, phase="alerts")
+async def check_alerts():
+    """
+    Fires the alerts that the tick(and the trades since the last one) made go off.
+    """
+    if not wal.replayed: return
+    started = time.perf_counter()
+    fired = check_coins(set(crypto_cache) | alert_book.coins())
+    if fired:
+        logEvent("alerts_fired", alerts=len(fired), users=len({alert.uid for alert in fired}), resting=len(alert_book),
+                 ms=(time.perf_counter() - started) * 1000)
@@ -0,0 +1,136 @@
+"""
+Batch auctions.
+
+Normally every '>buy' and '>sell' is its own trade: it locks the coin, runs the interval loop(see
+CryptoCurrency.quote()) and moves the value by itself. in a trading rush on one coin, every trade waits for the coin's
+lock in turn and is priced after all the ones before it.
+
+with "auction window" set in constants.json(seconds, 0 turns it off), trades are made in batch auctions instead. the
+first trade sent for a coin opens a window. every trade sent for the coin until it closes joins the batch. then the
+batch is cleared all at once(see MarketEngine.auction()):
+    the buys and sells are netted against each other and only the difference is priced, with one run of the loop
+    everyone in the batch trades at the same price per share, no matter who sent their trade first
+    every trade is settled in one transaction, so the coin and the users are locked once for the whole batch
+
+a command waits for its batch to be cleared and gets the result of its own trade, like it would have from trade().
+"""
+import asyncio
+import time
+from src.utils.transactions import Transaction
+from src.utils.engine import engine_client, settle_crash
+from src.utils.trading import settle
+from src.utils.log import logEvent
+
+class Bid:
+    # slots keep every bid small
+    __slots__ = ("uid", "account", "side", "shares", "future")
+
+    def __init__(self, uid:int, account:str, side:str, shares:int, future:asyncio.Future):
+        """
+        A trade waiting for its batch to be cleared. :future: gets the result of the trade
+        """
+        self.uid = uid
+        self.account = account
+        self.side = side
+        self.shares = shares
+        self.future = future
+
+    @property
+    def key(self)->str:
+        # the buys of the same account share its balance
+        return f"{self.uid}:{self.account}"
+
+class BatchAuction:
+    def __init__(self):
+        self.books = {} # coin id -> the bids of the coin's open window
+        self._tasks = set() # the windows that are open. kept so they are not garbage collected
+
+    async def submit(self, uid:int, account_name:str, coin_uid:int, side:str, shares:int, window:float)->dict:
+        """
+        Sends a trade to the coin's batch and waits for it to be cleared. opens a window of :window: seconds if the
+        coin has none.
+
+        Returns what trade() would have. raises whatever the clearing raised(an EngineError, a TransactionConflict...)
+        """
+        bid = Bid(uid, account_name, side, shares, asyncio.get_running_loop().create_future())
+        if coin_uid not in self.books:
+            self.books[coin_uid] = []
+            task = asyncio.get_running_loop().create_task(self._clear_after(coin_uid, window))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        self.books[coin_uid].append(bid)
+        return await bid.future
+
+    async def _clear_after(self, coin_uid:int, window:float):
+        await asyncio.sleep(window)
+        bids = self.books.pop(coin_uid)
+        try:
+            results = await self.clear(coin_uid, bids)
+        except Exception as error: # nothing in the batch was committed
+            for bid in bids:
+                if not bid.future.done(): # the command waiting on it was cancelled
+                    bid.future.set_exception(error)
+            return
+
+        for bid, result in zip(bids, results):
+            if bid.future.done(): # the command waiting on it was cancelled, the trade is committed anyway
+                continue
+            if isinstance(result, Exception):
+                bid.future.set_exception(result)
+            else:
+                bid.future.set_result(result)
+
+    async def clear(self, coin_uid:int, bids:list)->list:
+        """
+        Clears a batch and commits every trade in it together. Returns the result of every bid, or the exception that
+        only that bid raised.
+        """
+        started = time.perf_counter()
+        results = [None] * len(bids)
+        async with Transaction(users=[bid.uid for bid in bids], coins=[coin_uid]) as tx:
+            coin = tx.coin(coin_uid)
+            if coin is None: # the coin crashed while we were waiting for it
+                return [{"error": "coin"} for _ in bids]
+
+            # the checks trade() makes before the engine. a user's sells of the same holding add up
+            sent, held, budgets = [], {}, {}
+            for i, bid in enumerate(bids):
+                user = tx.user(bid.uid)
+                try:
+                    account = user.accounts[bid.account]
+                except KeyError as error: # only fails its own command
+                    results[i] = error
+                    continue
+                if user.shares_exceeds_trade_limit(bid.shares):
+                    results[i] = {"error": "shares"}
+                    continue
+                if bid.side == "sell":
+                    left = held.setdefault(bid.key, account.holdings.get(coin_uid, 0))
+                    if bid.shares > left:
+                        results[i] = {"error": "holdings", "held": left}
+                        continue
+                    held[bid.key] = left - bid.shares
+                else:
+                    budgets.setdefault(bid.key, account.balance)
+                sent.append(i)
+            if not sent: return results
+
+            cleared = await engine_client.request("auction", coin=coin_uid, budgets=budgets,
+                                                  bids=[[bids[i].key, bids[i].side, bids[i].shares, bids[i].account]
+                                                        for i in sent])
+            tx.apply_trade(coin_uid, cleared) # changes the value of the currency once for the whole batch
+            events = []
+            for i, fill in zip(sent, cleared["fills"]):
+                fill.update(value=cleared["value"], previous=cleared["previous"])
+                results[i] = fill
+                if fill["error"] is None:
+                    bid = bids[i]
+                    events.append(settle(tx, bid.uid, bid.account, coin_uid, bid.side, fill))
+            await tx.commit(*events)
+        await settle_crash(coin) # checks if the coin has crashed
+
+        logEvent("auction_cleared", coin=coin.name, bids=len(bids), filled=len(events), price=cleared["price"],
+                 previous=cleared["previous"], value=cleared["value"], ms=(time.perf_counter() - started) * 1000)
+        return results
+
+auction = BatchAuction()
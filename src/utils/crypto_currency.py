@@ -1,78 +1,186 @@
 import asyncio
 import os
-from random import randint, uniform, choice
+from random import randint, uniform, choice, getrandbits, Random
 import datetime
+import logging
+import time
 from src.utils.json_utils import *
 from src.utils.math_funcs import *
-from src.constants import *
+from src.constants import config
 from src.utils.log import *
-from discord.ext.tasks import loop
-crypto_cache = [] # the list of crypto currencies. we use this if we wants to retrieve information on a currency
+from src.utils.name_pool import NamePool, NamesExhausted
+from src.utils.money import to_money
+from src.utils.wal import wal
+from src.utils.events import *
+from src.utils.holders import holders
+from src.utils.market import market
+from src.utils.scheduler import scheduler
+crypto_cache = {} # the crypto currencies by id. we use this if we wants to retrieve information on a currency
+cache_loaded = False # the database is never written before it was loaded. otherwise it would be wiped
+db_path = "src/db/crypto_currencies.json"
+name_pool = NamePool() # the names new currencies can be given
+history_length = 168 # the number of hourly values kept in a currency's history. 168 hours is a week
+quarter_ends = ((3, 31), (6, 30), (9, 30), (12, 31)) # (month, day) of the quarterly spikes
+
+class CoinIndex:
+    def __init__(self):
+        """
+        An index of the ids and names of all currencies in the cache.
+
+        every currency gets an integer id(uid) when it is created. ids are never reused, so anything that refers to a
+        currency by id(like user holdings) can never point to a newer currency that was given the same name.
+        names are only used to find a currency when a user types it in.
+        """
+        self.ids = {} # name -> uid
+        self.names = {} # uid -> name
+        self.next_uid = 1 # the id the next currency will get
+
+    def add(self, uid:int, name:str):
+        self.ids[name] = uid
+        self.names[uid] = name
+        self.next_uid = max(self.next_uid, uid+1)
+
+    def remove(self, uid:int):
+        name = self.names.pop(uid, None)
+        if self.ids.get(name) == uid:
+            del self.ids[name]
+
+    def clear(self):
+        # next_uid is kept so ids are never reused
+        self.ids.clear()
+        self.names.clear()
+
+    def allocate(self)->int:
+        uid = self.next_uid
+        self.next_uid += 1
+        return uid
+
+    def uid_of(self, name:str)->int:
+        # returns None if there is no currency with that name
+        return self.ids.get(name)
+
+    def name_of(self, uid:int)->str:
+        return self.names.get(uid)
+
+coin_index = CoinIndex()
 
 
 async def load_db_into_cache(): # loads all currencies into the crypto cache
-    db = load_json("src/db/crypto_currencies.json")
-    for currency_dict in db["currencies"]:
-        crypto_cache.append(currency_dict)
+    if cache_loaded: return # the cache is the source of truth once it is loaded. reloading would undo unsaved trades
+    load_db_into_cache_sync()
 
 async def clear_cache():
     # clears the cache. used on on_ready.
     # if the bot disconnects while still running, this will prevent the cache from being duplicated
-    for i in range(len(crypto_cache)-1, 0, -1):
-        crypto_cache.pop(i)
+    global cache_loaded
+    crypto_cache.clear()
+    coin_index.clear()
+    cache_loaded = False
 
 def load_db_into_cache_sync(): # loads all currencies into the crypto cache
-    db = load_json("src/db/crypto_currencies.json")
+    global cache_loaded
+    db = load_json(db_path)
+    coin_index.next_uid = max(coin_index.next_uid, db.get("next_uid", 1))
+
+    # currencies from before ids existed all have a uid of 0. they are given real ids here
+    migrated = False
     for currency_dict in db["currencies"]:
-        crypto_cache.append(currency_dict)
+        if currency_dict["uid"] < 1 or currency_dict["uid"] in coin_index.names:
+            currency_dict["uid"] = coin_index.allocate()
+            migrated = True
+        CryptoCurrency(currency_dict).cache()
+
+    name_pool.reset(coin_index.ids) # the names of existing currencies are taken
+    cache_loaded = True
+    publish_market() # once, for every currency
+
+    if migrated or db.get("next_uid") != coin_index.next_uid:
+        save_db()
 
-@loop(minutes=1)
-async def simulate_cache(): # simulates all currencies in the cache
-    for currency_dict in crypto_cache:
-        coin = CryptoCurrency(currency_dict)
-        coin.simulate()
+def db_to_dict():
+    """
+    Returns a snapshot of every cached currency, as it is written to the database. None if the cache is not loaded.
 
-@loop(minutes=1)
-async def add_currencies(): # determines if we should add a currency or not
+    the cache holds the live currency objects, so it is the source of truth. the whole database is written in one go
+    instead of once per currency. changes in between snapshots are in the write ahead log. (see src/utils/wal.py)
+    """
+    if not cache_loaded: return None
+    return {
+        "currencies": [coin.obj_to_dict() for coin in crypto_cache.values()],
+        "count": len(crypto_cache),
+        "next_uid": coin_index.next_uid
+    }
+
+def save_db():
+    db = db_to_dict()
+    if db is not None: write_json_atomic(db_path, db)
+
+def publish_market():
+    # publishes a new market snapshot for the readers. see src/utils/market.py
+    market.publish(crypto_cache.values())
+
+def log_coin_states(coins):
     """
-    Adds a cryptocurrency.
+    Appends the values of the given currencies to the write ahead log.
 
-    There aren't too many people who will play this game. and if there are too many currencies compared to the people
-    who play, less atention will be given to certain currencies. This allows some people to take control of a coin
-    nobody is watching. Rather, the intended method is for users to compete for the same coins.
+    only the fields that change every tick or trade are logged, not the whole currency.
+    """
+    wal.append({"op": "coin_state", "coins": [coin.state() for coin in coins]})
 
-    the amount of coins we want in the database at any given time is between 2-7.
-    If the number of coins existing is below that, we always add a new one. if it is above it, we never add a new one.
-    if it is anywhere between them, we add them at a rate of about 1/week.
+def apply_record(record:dict):
+    """
+    Applies a currency record from the write ahead log to the cache. used when the log is replayed on startup.
     """
-    db = load_json("src/db/crypto_currencies.json")
-    if db["count"] < min_coins: # always adds a coin
-        coin = CryptoCurrency()
-        logMsg(f"Added new currency named {coin.name}!")
-    elif db["count"] > max_coins: # never adds a coin
-        return
-    else: # there is a small chance of adding a coin
-        if randint(1,2880) == 1: # once every 2 days on average
-            coin = CryptoCurrency()
-            logMsg(f"Added new currency named {coin.name}!")
-
-@loop(hours=24)
-async def add_shares(): # adds more shares to all coins once every day
-    for currency_dict in crypto_cache:
-        coin = CryptoCurrency(currency_dict)
-        diff = choice([-1, 1]) * randint(5_000, 25_000)
-        coin.total_shares += diff
-        coin.save()
+    op = record["op"]
+    if op == "coin": # a new currency
+        coin = CryptoCurrency(record["data"])
         coin.cache()
-        logMsg(f"{'Added' if diff >0 else 'Subtracted'} {diff} shares to {coin.name}!") # logs it
+        name_pool.reserve(coin.name)
 
-@loop(hours=1)
+    elif op == "coin_state":
+        for uid, value, threshold, Vmax_mag, total_shares in record["coins"]:
+            coin = crypto_cache.get(uid)
+            if coin is None: continue
+            coin.value, coin.threshold, coin.Vmax_mag, coin.total_shares = value, threshold, Vmax_mag, total_shares
+
+    elif op == "price_point":
+        coin = crypto_cache.get(record["uid"])
+        # the snapshot might already have it
+        if coin is not None and (not coin.values or coin.values[-1].date != record["date"]):
+            coin.add_price_point(PricePoint(record["date"], record["value"]))
+
+    elif op == "coin_delete":
+        coin = crypto_cache.get(record["uid"])
+        if coin is not None: coin.uncache()
+
+@scheduler.job(every=60, phase="housekeeping")
 async def print_cache(): # prints the cache every hour
     logMsg("CRYPTO CACHE:")
-    for currency_dict in crypto_cache:
-        logMsg(CryptoCurrency(currency_dict))
+    for coin in crypto_cache.values():
+        logMsg(coin)
+
+class PricePoint:
+    __slots__ = ("date", "value")
+
+    def __init__(self, date:str, value:float):
+        """
+        A value a currency had at a certain time. these make up a currency's history.
+        """
+        self.date = date
+        self.value = value
+
+    def obj_to_dict(self)->dict:
+        return {"date": self.date, "value": self.value}
+
+    @classmethod
+    def dict_to_obj(cls, point:dict):
+        return cls(point["date"], point["value"])
 
 class CryptoCurrency:
+    # slots keep every currency small. they have no __dict__, only these attributes
+    __slots__ = ("name", "creation_date", "uid", "delete_value", "value", "Vmax_mag", "total_shares", "threshold",
+                 "Tmax_mag", "values")
+
     def __init__(self, currency:dict=None):
         """
             Initializes a crypto currency.
@@ -80,6 +188,8 @@ class CryptoCurrency:
             Cryptocurrencies are stored in the db/crypto_currencies.json file. on init, the dict pointing to the
             currency in the json file is passed in as an argument. If none is given, a new currency will be generated
             instead.
+            loaded currencies are kept in crypto_cache as objects, so a currency is only built from a dict once, when
+            the database is loaded.
 
             Upon generation, several properties will be generated, then saved:
                 name: the name of the crypto currency generated by a name generator
@@ -93,14 +203,14 @@ class CryptoCurrency:
                 Tmax_mag: the maximum magnitude the threshold can fluctuate by.
                 total_shares: the total number of shares bought
                 delete_value: the value the currency will be deleted at
-                UID: id of the token. do we need this?
+                UID: id of the token. ids are given out in order and never reused. (see CoinIndex)
 
         """
         if currency is None: # if there was no argument given, it creates a new currency
 
             self.creation_date = str(datetime.datetime.now().replace(minute=0,second=0, microsecond=0))
             self.name = CryptoCurrency.regen_name() # uses a generator to generate a random name
-            self.uid = 0
+            self.uid = coin_index.allocate()
             self.delete_value = 0.0 # normally 0
 
             self.value = randint(50, 5000)/100 # normally 0.5 -> 50
@@ -114,48 +224,35 @@ class CryptoCurrency:
             self.threshold = 35.0 # normally 50.0
             self.Tmax_mag = 1.0
 
-            self.values = []
-            self.values.append({
-                "date": self.creation_date,
-                "value": self.value
-            })
+            self.values = [PricePoint(self.creation_date, self.value)]
 
-            # save the currency.
+            # cache and save the currency.
             self.save()
-
-            # cache the currency
-            self.cache()
+            publish_market()
+            event_log.record(CoinCreated(self.obj_to_dict()))
 
         else: # otherwise loads up the currency from the dict given
             self.dict_to_obj(currency) # loads all the currency data
 
-            # saves.
-            self.save()
-
-            # cache the currency
-            self.cache()
-
     @property
     def market_cap(self): # the market is the total value of all shares
-        return min(self.value * self.total_shares, max_market_cap)
+        return min(self.value * self.total_shares, config.current.max_market_cap)
 
     @property
     def max_value(self):
         # the maximum value self.value can ever reach
         # only relevant when the market cap reaches the limit.
-        return max_market_cap / self.total_shares
+        return config.current.max_market_cap / self.total_shares
 
     @staticmethod
     def name_generator()->str:
         """
             Generates a random name.
 
-            Loads up data from db/crypto_names.json and randomly chooses a prefix and suffix and returns them.
+            draws a random unused prefix and suffix combination from the name pool. (see src/utils/name_pool.py)
+            raises NamesExhausted if every name is taken.
         """
-        names = load_json("src/db/crypto_names.json")
-        prefix = choice(names["prefixes"])
-        suffix = choice(names["suffixes"])
-        return prefix+"-"+suffix
+        return name_pool.allocate()
 
     @staticmethod
     def is_unique(name:str)->bool:
@@ -164,32 +261,19 @@ class CryptoCurrency:
 
         Used when generating a new cryptocurrency so it dosent overwrite another or share the same name.
         """
-        db = load_json("src/db/crypto_currencies.json")
-        for index in db["currencies"]:
-            if name == index["name"]: return False
-        return True
+        return name not in name_pool.used
 
     @staticmethod
     def regen_name()->str:
         """
-        Regenerates the name of the currency if it matches another currency in the database.
+        Generates a name that no other currency in the database has.
 
         Most of the code identifies a currency by name. Upon generation, a currency may be given a name that already
         exists. the danger in this is that it could overwrite an existing currency.
-        so this function recursively will continuously regenerate a name until a unique one is generated.
-        There will likely be a limit on how many currencies will exist at a time and there are many name possibilities,
-        however this is more foolproof. an additional level of security could be a has or numerical UID so that the code
-        is completely unreliant on names. this can be implemented later
-
-        :return:
+        the name pool only ever hands out names that are not used, so this never has to retry. once every name is
+        taken, NamesExhausted is raised instead.
         """
-        unique = False
-
-        while not unique:
-            name = CryptoCurrency.name_generator()
-            unique = CryptoCurrency.is_unique(name)
-            if unique: break
-        return name
+        return CryptoCurrency.name_generator()
 
     def dict_to_obj(self, currency):
         """
@@ -206,7 +290,7 @@ class CryptoCurrency:
         self.total_shares = currency["total_shares"]
         self.threshold = currency["threshold"]
         self.Tmax_mag = currency["Tmax_mag"]
-        self.values = currency["values"]
+        self.values = [PricePoint.dict_to_obj(point) for point in currency["values"]]
 
     def obj_to_dict(self)->dict:
         """
@@ -225,7 +309,7 @@ class CryptoCurrency:
         currency["total_shares"] = self.total_shares
         currency["threshold"] = self.threshold
         currency["Tmax_mag"] = self.Tmax_mag
-        currency["values"] = self.values
+        currency["values"] = [point.obj_to_dict() for point in self.values]
 
         return currency
 
@@ -233,62 +317,25 @@ class CryptoCurrency:
         """
             Writes data to the database.
 
-            Loads up the crypto_currency.json file and looks for the currency that shares the same name as self,
-            then writes the new data to the file.
-
-            todo:
-                consider deleting previous values older than 3 months(2016 entries ago)
+            the currency is cached, then the whole currency is appended to the write ahead log. it is written to the
+            database with the next snapshot. (see save_db())
         """
-
-        db = load_json("src/db/crypto_currencies.json") # loads up the db containing all currencies
-
-        currency = self.obj_to_dict() # transforms the object into a dict to be used
-
-        for i in range(len(db["currencies"])): # cycles through all of them to find the matching one by name
-            if db["currencies"][i]["name"] == currency["name"]:
-                db["currencies"][i] = currency
-                update_json("src/db/crypto_currencies.json", db)
-                return
-
-        # if the currency is not found, add it.
-        db["currencies"].append(currency)
-        db["count"] += 1 # updates the number of crypto currencies stored in the database
-        update_json("src/db/crypto_currencies.json", db)
-        return
+        self.cache()
+        wal.append({"op": "coin", "data": self.obj_to_dict()})
 
     def cache(self):
         """
-            Caches the value of a cryptocurrency.
+            Caches a cryptocurrency.
 
             Used to keep track of the commonly used data of a cryptocurrency. Called upon loading in a Crypto.
-            All instances of cryptocurrencies are cached when updated every minute. Additionally, they are cached on
-            startup. This is to keep its statistics in RAM.
-            Due to this, everything the other functions will ever need can be accessed via the cache. accessing the json
-            file is only to update the value and write the changes every minute and adding a new value every hour.
+            The cache holds the currency objects themselves, so everything the other functions will ever need can be
+            accessed via the cache. accessing the json file is only to write the changes every minute.
             This is to minimize writes to disk for both performance and longevity.
 
-            Takes in a dict, deletes all instances of previous values from over a week
-            ago. The previous values are stored every hour, there are 168 hours in a week, so if a value's index
-            subtracted from the total length is greater than 168, its older than a week old. So long as it's not the
-            initial value, we can delete it and append the dict to the crypto_cache array.
+            the market snapshot is not published here, so loading many currencies publishes it once. the caller does.
         """
-
-        currency = self.obj_to_dict() # transforms the object to a dict
-
-        # deletes all instances of older values.
-        values_len = len(currency["values"])
-        for i in range(values_len):
-            if ((values_len-i)>168 and i!=0):
-                del_dict_key(currency, "values", i)
-
-        # searches for any previous records of the dict in the cache and overwrites it
-        cache_len = len(crypto_cache)
-        for i in range(cache_len-1, -1, -1): # iterates through the list backwards.
-            if crypto_cache[i]["name"] == currency["name"]:
-                crypto_cache[i] = currency
-                return
-
-        crypto_cache.append(currency) # if it dosent exist, add it
+        crypto_cache[self.uid] = self
+        coin_index.add(self.uid, self.name)
 
     def delete(self):
         """
@@ -296,27 +343,30 @@ class CryptoCurrency:
 
             Usually used when the currency's value drops below a certain point.
 
-            Looks through the crypto currencies json and deletes the right entry as well as decrement the counter.
+            removes it from the cache so it cannot be referenced and logs that it was deleted.
+            the caller publishes the market once it is done deleting. (see publish_market())
         """
-        db = load_json("src/db/crypto_currencies.json")  # loads up the db containing all currencies
+        if not self.uncache(): return # already deleted
 
-        # deletes from the json so it cannot be loaded again
-        for i in range(len(db["currencies"])):
-            if db["currencies"][i]["name"] == self.name:
-                db["currencies"].pop(i)
-                db["count"] -=1
-                update_json("src/db/crypto_currencies.json", db)
-                break
-
-        # deletes it from the cache as well so it cannot be referenced
-        for cached in crypto_cache:
-            if cached["name"] == self.name:
-                crypto_cache.remove(cached)
-                break
+        wal.append({"op": "coin_delete", "uid": self.uid})
+        event_log.record(CoinDeleted(self.uid))
 
         logMsg(F"deleted {self.name}") # logs it
 
-    def compute(self):
+    def uncache(self)->bool:
+        # removes the currency from the cache. returns False if it was not in it
+        if crypto_cache.pop(self.uid, None) is None: return False
+
+        coin_index.remove(self.uid)
+        name_pool.release(self.name) # the name can be used by a new currency
+        holders.coin_deleted(self.uid) # its holders are cleaned up by drop_dead_holdings()
+        return True
+
+    def state(self)->list:
+        # the fields that change every tick or trade. see log_coin_states()
+        return [self.uid, self.value, self.threshold, self.Vmax_mag, self.total_shares]
+
+    def compute(self, rng:Random, now:datetime.datetime):
         """
         Computes a cryptocurrency's fluctuations.
 
@@ -326,62 +376,75 @@ class CryptoCurrency:
         Then simulates a quarterly spike by checking if the current spike matches the right quarter.
 
         Finally, modify the Vmax_mag value so the average value change gradually changes over time.
+
+        all the randomness comes from :rng: and the time from :now:, so the same seed and time always give the same
+        result.
         """
 
-        self.fluctuate()
+        self.fluctuate(rng)
 
-        self.spike()
+        self.spike(rng, now)
 
-        self.Vmax_mag_fluctuate()
+        self.Vmax_mag_fluctuate(rng)
 
     def should_delete(self):
         # checks if the value dropped below the delete value. if so, delete it
         # should be used before any saves.
         if self.value <= self.delete_value:
             self.delete()
+            return True
+        return False
 
-    def simulate(self):
+    def simulate(self, rng:Random, now:datetime.datetime):
         """
         Simulates a cryptocurrency.
 
         Every minute, the cryptocurrency will be loaded and computed for change, saved and then cached.
         :return:
         """
-        self.compute() # runs the calculations to fluctuate it
-
-        if datetime.datetime.now().minute == 0:
-            self.history_append() # adds to history of values
+        point = self.step(rng, now) # runs the calculations to fluctuate it
 
-        # when testing, comment this line
-        self.save() # saves the values to the database.
+        if point is not None: # logs the new point in the history of values
+            wal.append({"op": "price_point", "uid": self.uid, "date": point.date, "value": point.value})
 
-        self.cache() # caches it
+        # the currency is already cached, it is saved along with every other currency by simulate_cache()
 
         self.should_delete() # checks if it should be deleted
 
-    def spike(self):
+    def step(self, rng:Random, now:datetime.datetime):
+        """
+        Computes one tick of the currency without saving or deleting anything. also used when replaying ticks.
+
+        on the first minute of every hour, the value is added to the history. returns that PricePoint, or None.
+        """
+        self.compute(rng, now)
+
+        if now.minute == 0:
+            point = PricePoint(str(now.replace(second=0)), self.value)
+            self.add_price_point(point) # adds to history of values
+            return point
+        return None
+
+    def spike(self, rng:Random, now:datetime.datetime):
         """
         A quarterly spike that drastically modifies the threshold.
 
-        Every 3 months, (march 31, june 30th, sept 31, dec 31), a spike is generated. the threshold changes
+        Every 3 months, (march 31, june 30th, sept 30th, dec 31), a spike is generated. the threshold changes
         by a magnitude of 30 in either direction.
 
-        issues:
-            due to synchronization issues; the code may trigger a spike twice or not at all. minor issue tbh
-                maybe try a different method other than datetimes?
+        the ticks come from the scheduler(see src/utils/scheduler.py), which runs exactly one tick for every wall-clock
+        minute, so the spike happens exactly once on midnight of those days.
         """
         # quarterly spike. +/-30% to threshold
-        now = str(datetime.datetime.now().replace(second=0, microsecond=0))
-        q1,q2,q3,q4 = "-03-31 00:00","-06-30 00:00","-09-31 00:00","-12-31 00:00" # the quarter datetimes
-        if ((q1 in now) or (q2 in now) or (q3 in now) or (q4 in now)):
-            self.threshold += (choice([-1, 1]) * 30) + 50
+        if (now.month, now.day) in quarter_ends and now.hour == 0 and now.minute == 0:
+            self.threshold += (rng.choice([-1, 1]) * 30) + 50
 
         # daily spike
         # uses rng and not a datetime object because this can happen at any point in the day.
-        spike_chance = randint(0,1440) # rolls a random. 1440 mins/day so this will spike daily
+        spike_chance = rng.randint(0,1440) # rolls a random. 1440 mins/day so this will spike daily
         if spike_chance == 1440: self.threshold = 50
 
-    def Vmax_mag_fluctuate(self):
+    def Vmax_mag_fluctuate(self, rng:Random):
         """
         Fluctuates Vmax_mag.
 
@@ -397,12 +460,12 @@ class CryptoCurrency:
 
         if self.Vmax_mag <= 0.02: # 0.02 is chosen as it is the twice the maximum it can increase by.
             # 0.001-0.01 is arbitrary since Vmax_mag's value is unimportant as long as its not too large or negative
-            self.Vmax_mag += 1 * uniform(0.001, 0.01)
+            self.Vmax_mag += 1 * rng.uniform(0.001, 0.01)
             return
         else:
-            self.Vmax_mag += randint(-1,1) * uniform(0.001, 0.01) # normally 0.001, 0.01
+            self.Vmax_mag += rng.randint(-1,1) * rng.uniform(0.001, 0.01) # normally 0.001, 0.01
 
-    def thresh_fluctuate(self, val_increased:bool):
+    def thresh_fluctuate(self, rng:Random, val_increased:bool):
         """
         Modifies the threshold.
 
@@ -425,26 +488,26 @@ class CryptoCurrency:
         T = self.threshold # threshold value. stored as a variable for typing convenience and readibility
 
         if val_increased:
-            Tfluc_chance = choice((-1,-1,1)) # this is more likely to return -1 which decreases the threshold
+            Tfluc_chance = rng.choice((-1,-1,1)) # this is more likely to return -1 which decreases the threshold
 
             # The expression for sign below returns -1 or 1.
             # -1 for T<35 and +1 for T>35.
             # It is intended to determine the directon of the change in threshold.
             try:sign = -(35-T)/abs(35-T)
-            except ZeroDivisionError: sign = choice((-1,1))
+            except ZeroDivisionError: sign = rng.choice((-1,1))
 
         else:
-            Tfluc_chance = choice((1,1,-1)) # this is more likely to return 1 which increases the threshold
+            Tfluc_chance = rng.choice((1,1,-1)) # this is more likely to return 1 which increases the threshold
 
             # The expression for sign below returns -1 or 1.
             # +1 for T<65 and -1 for T>65.
             # It is intended to determine the direction of the change in threshold.
             try: sign = (65-T)/abs(65-T)
-            except ZeroDivisionError: sign = choice((-1,1))
+            except ZeroDivisionError: sign = rng.choice((-1,1))
 
-        self.threshold += sign * Tfluc_chance  * uniform(0, self.Tmax_mag)
+        self.threshold += sign * Tfluc_chance  * rng.uniform(0, self.Tmax_mag)
 
-    def value_fluctuate(self, val_increased:bool):
+    def value_fluctuate(self, rng:Random, val_increased:bool):
         """
         Fluctuates the value.
         
@@ -470,22 +533,22 @@ class CryptoCurrency:
         T = self.threshold
         percent = self.value/100
 
-        base_factor = uniform(0, self.Vmax_mag) # the normal amount the currency increases by
+        base_factor = rng.uniform(0, self.Vmax_mag) # the normal amount the currency increases by
         try: bounds_factor = max(0, -abs((T**2) - (100*T) + 2275)/((T**2) - (100*T) + 2275)) # outside the bounds, return 1. within bounds, return 0
         except: bounds_factor = 0 # if the bounds factor is undefined, we just set it as 0 so it behaves normally
-        percent_factor = uniform(0, percent/500_000) * gaussian_function(x=T, a=10_000, b=50, c=4) # ranges from 0->0.0002 times the value.
+        percent_factor = rng.uniform(0, percent/500_000) * gaussian_function(x=T, a=10_000, b=50, c=4) # ranges from 0->0.0002 times the value.
 
         if val_increased: sign =1
         else:
             sign =-1
             if self.value < 2.5: # tp prevent currencies from dying too easily, it will only fluctuate by a small amount at dangerously low values
-                self.value += sign * uniform(0.05,0.1)
+                self.value += sign * rng.uniform(0.05,0.1)
                 return
 
         self.value += sign * (base_factor + (bounds_factor * percent_factor))
         self.value = min(self.value, self.max_value) # value cannot rise above the maximum value
 
-    def fluctuate(self):
+    def fluctuate(self, rng:Random):
         """
         Fluctuates the threshold and value.
 
@@ -502,20 +565,20 @@ class CryptoCurrency:
             Simply is increased by a magnitude ranging from [0, Vmax_mag].
             value is garunteed to increase if the random num >= threshold.
         """
-        Vfluc_chance = randint(0, 100)
+        Vfluc_chance = rng.randint(0, 100)
         val_increased:bool
 
         if Vfluc_chance >= self.threshold:
 
-            self.thresh_fluctuate(val_increased=True) # changes the threshold
+            self.thresh_fluctuate(rng, val_increased=True) # changes the threshold
             val_increased = True
 
         else:
-            self.thresh_fluctuate(val_increased=False) # changes the threshold
+            self.thresh_fluctuate(rng, val_increased=False) # changes the threshold
             val_increased = False
 
 
-        self.value_fluctuate(val_increased=val_increased)
+        self.value_fluctuate(rng, val_increased=val_increased)
 
     def display_history(self): return
 
@@ -559,18 +622,18 @@ class CryptoCurrency:
         self.value -= delta
         return delta
 
-    def history_append(self):
+    def add_price_point(self, point:PricePoint):
         """
-        Adds the current value to the history of values.
+        Adds a value to the history of values.
 
         Is called every hour on the frst minute. Example: 01:00:00. at 1:00 am
+
+        only the initial value and the values of the last week are kept.
         """
-        self.values.append( # make sure date is casted to str as JSON cant store datetime objects
-            {
-                "date": str(datetime.datetime.now().replace(microsecond=0, second=0)),
-                "value": self.value
-            }
-        )
+        self.values.append(point)
+
+        if len(self.values) > history_length + 1:
+            del self.values[1:len(self.values) - history_length]
 
     def __str__(self):
         return f"name: {self.name}, created date: {self.creation_date}, uid: {self.uid}, total_shares: {self.total_shares}, market_cap: {self.market_cap},\n" \
@@ -579,15 +642,16 @@ class CryptoCurrency:
 
     @staticmethod
     def exists(coin_name:str): # determines if a currency exists in the database
-        for currency in crypto_cache:
-            if currency["name"] == coin_name: return True
-        return False
+        return coin_name in coin_index.ids
 
     @staticmethod
-    def load_coin_dict(coin_name:str): # loads a currency given its name.
+    def load_coin(coin_name:str): # loads a currency given its name. returns None if it does not exist
         # we load from the cache as the database is mostly used to save currencies, not keep track of them
-        for currency in crypto_cache:
-            if currency["name"] == coin_name: return currency
+        return crypto_cache.get(coin_index.uid_of(coin_name))
+
+    @staticmethod
+    def load_coin_by_uid(uid:int): # loads a currency given its id. returns None if it does not exist
+        return crypto_cache.get(uid)
 
     def calc_value(self, v:float,shares:int, buying:bool)->float:
         """
@@ -613,6 +677,29 @@ class CryptoCurrency:
         else: v -= shares/self.total_shares
         return min(self.max_value, max(v, 0.0)) # value cannot fall below 0 but cannot be higher than max_market_cap / total shares
 
+    def quote(self, shares:int, buying:bool)->tuple:
+        """
+        Prices a trade of :shares: shares without changing the currency. Returns (the new value, the subtotal in money
+        units, the number of shares traded)
+
+        the value is compounded. it is moved shares_per_interval shares at a time and every round is priced at the new
+        value, so a big trade costs more than if it was priced all at once. the loop stops early if the value crashes or
+        reaches the maximum value, so fewer shares than asked for might be traded and the user is not charged unjustly.
+        """
+        subtotal = 0
+        shares_traded = 0 # keeps track of the number of shares traded so far
+        v = self.value # v keeps track of the value as we calculate the trade
+        shares_per_interval = config.current.shares_per_interval
+        while shares > 0 and v > self.delete_value and v < self.max_value:
+            deducted_shares = min(shares_per_interval, shares) # the number of shares we calculate per iteration
+
+            v = self.calc_value(v, deducted_shares, buying=buying) # given the number of shares, calculate the new v
+            subtotal += self.calc_cost(v, deducted_shares) # calculates the subtotal given v and the number of shares
+
+            shares -= deducted_shares
+            shares_traded += deducted_shares
+        return v, subtotal, shares_traded
+
     def change_currency_value(self, v:float):
         """
         Changes the currency value after a purchase/sale.
@@ -621,7 +708,7 @@ class CryptoCurrency:
         """
         self.value = v # modifies the cache
 
-    def calc_cost(self, v:float, shares:int):
+    def calc_cost(self, v:float, shares:int)->int:
         """
         Determines the cost of trading a currency given a certain amount of shares.
 
@@ -629,17 +716,18 @@ class CryptoCurrency:
         this formula returns the subtotal which is then passed into user.calc_tax()
 
         after calculating the value for every round, we multiply the new value by the amount of shares to get the cost
-        of that purchase.
+        of that purchase. the cost is in money units, so adding the costs of every round up is exact.
         """
-        return v * shares
+        return to_money(v * shares)
 
 def clear_db():
     """
     clears the cryptocurrency db
     """
-    db = load_json("src/db/crypto_currencies.json")
-    for currency in db["currencies"]:
-        coin = CryptoCurrency(currency)
+    if not cache_loaded: load_db_into_cache_sync()
+
+    for coin in list(crypto_cache.values()):
         coin.delete()
+    publish_market()
 
 
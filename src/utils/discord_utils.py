@@ -33,9 +33,22 @@ emb_colours = [ #COLOURS FOR EMBEDS. make this variable names like blue = c.blue
     c.teal() ]
 
 
-async def dm_user(bot, id:int, msg:str=None, embed:discord.Embed=None): # dm's a user a message
-    dm_channel = await bot.fetch_user(id) # gets the dm channel
-    await discord.DMChannel.send(dm_channel, msg, embed=embed)
+def code_blocks(text:str, limit:int=2000)->list:
+    """
+    Splits text into code blocks that fit in a discord message.
+
+    discord messages have a limit of 2000 characters, so the text is split by lines into as many blocks as needed.
+    """
+    limit -= len("```\n```") # room for the backticks
+    blocks, block = [], ""
+    for line in text.splitlines():
+        line = line[:limit]
+        if len(block) + len(line) + 1 > limit:
+            blocks.append(f"```\n{block}```")
+            block = ""
+        block += line + "\n"
+    if block: blocks.append(f"```\n{block}```")
+    return blocks
 
 async def embed(): pass # makes an embed ???
 
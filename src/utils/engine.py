@@ -0,0 +1,470 @@
+"""
+The market engine.
+
+Pricing, trades and the tick simulation run in the engine. the bot talks to it through requests:
+    result = await engine_client.request("trade", coin=coin_uid, side="buy", shares=50, account="ntfa", budget=balance)
+
+by default the engine runs inside the bot, on the bot's own coins, and a request is just a function call. it can also
+run as its own process, so the simulation never holds up the bot's event loop:
+    python -m src.utils.engine [socket path] [price board name]
+then the bot is pointed at its socket with "engine socket" in src/kryptonite_bot/imp_info.json.
+
+requests and responses are lines of json over a unix domain socket. (see rpc.py)
+
+the bot stays the only process that writes anything. its crypto_cache is a replica of the engine's coins: every
+response carries the new state of the coins it changed and the bot applies it, logs it to the write ahead log and
+records the events, exactly like it did when it changed the coins itself. the engine keeps nothing on disk. when the
+bot connects, it loads the engine with the bot's coins, so a restarted engine picks up where the log left off.
+
+the engine applies requests in the order they arrive and the bot applies the responses in the same order, so the
+replica goes through the same states as the engine.
+
+after every request that changes a coin, the engine writes the prices to its price board(see price_board.py), so other
+processes can read them without asking. the standalone engine always has one. inside the bot, it is only created if
+"price board" is set in imp_info.json.
+"""
+import asyncio
+import datetime
+import signal
+import sys
+import time
+import logging
+from random import randint, choice, getrandbits, Random
+from src.constants import config
+from src.utils.crypto_currency import (crypto_cache, coin_index, CryptoCurrency, NamesExhausted, publish_market,
+                                       log_coin_states, apply_record as apply_coin_record)
+from src.utils.users import User
+from src.utils.money import to_money, to_dollars
+from src.utils.wal import wal
+from src.utils.events import event_log, Tick, AddShares
+from src.utils.ledger import ledger
+from src.utils.holders import holders
+from src.utils.leaderboard import leaderboard
+from src.utils.market import market
+from src.utils.price_board import PriceBoard, default_name as default_board
+from src.utils.log import logEvent, logMsg
+from src.utils.rpc import RpcClient, RpcError, serve as serve_requests
+from src.utils.scheduler import scheduler
+
+default_socket = "src/db/engine.sock"
+request_timeout = 10 # seconds
+
+class EngineError(RpcError):
+    """
+    Raised when the engine cannot be reached or a request failed in it.
+    """
+
+class MarketEngine:
+    """
+    Owns the coins in the crypto_cache of the process it runs in.
+
+    every method takes and returns plain json, so they can be called over the socket as they are. nothing is published
+    to the market snapshot here, the bot publishes once it applied the results.
+    """
+    methods = ("load", "add_coin", "delete", "add_shares", "tick", "quote", "trade", "auction", "restore", "snapshot",
+               "history")
+    changes_prices = ("load", "add_coin", "delete", "add_shares", "tick", "trade", "auction", "restore")
+
+    def __init__(self):
+        self.board = None # the price board, if there is one
+        self.ticks = 0 # the number of ticks simulated since the engine started
+
+    def handle(self, method:str, params:dict):
+        if method not in self.methods:
+            raise EngineError(f"unknown method {method}")
+        result = getattr(self, method)(**params)
+        if self.board is not None and method in self.changes_prices:
+            self.publish_prices()
+        return result
+
+    def use_price_board(self, name:str=default_board):
+        self.board = PriceBoard.create(name, capacity=max(64, 2 * config.current.max_coins))
+        self.publish_prices()
+
+    def publish_prices(self):
+        self.board.publish([(coin.uid, coin.value, coin.market_cap, coin.total_shares) for coin in crypto_cache.values()],
+                           self.ticks)
+
+    @staticmethod
+    def _coin(uid:int)->CryptoCurrency:
+        coin = crypto_cache.get(uid)
+        if coin is None: raise EngineError(f"coin {uid} does not exist")
+        return coin
+
+    def load(self, coins:list, next_uid:int):
+        """
+        Replaces every coin with the bot's. :coins: the coins as dicts
+        """
+        for coin in list(crypto_cache.values()):
+            coin.uncache()
+        for data in coins:
+            CryptoCurrency(data).cache()
+        coin_index.next_uid = next_uid
+
+    def add_coin(self, coin:dict):
+        # a coin the bot created. already there when the engine runs inside the bot
+        if coin["uid"] not in crypto_cache:
+            CryptoCurrency(coin).cache()
+
+    def delete(self, coin:int):
+        # the bot deleted the coin. it logs the deletion itself
+        coin = crypto_cache.get(coin)
+        if coin is not None: coin.uncache()
+
+    def add_shares(self, diffs:list)->list:
+        """
+        Changes the supply of coins. :diffs: [[coin id, diff], ...] Returns the new states of the coins.
+        """
+        states = []
+        for uid, diff in diffs:
+            coin = crypto_cache.get(uid)
+            if coin is None: continue
+            coin.total_shares += diff
+            states.append(coin.state())
+        return states
+
+    def tick(self, now:str, seeds:list)->dict:
+        """
+        Simulates every coin in :seeds: for one minute. :seeds: [[coin id, seed], ...]
+
+        Returns the new states, the price points that were added to the history and the coins that crashed. nothing is
+        deleted, the bot deletes the crashed coins and tells the engine.
+        """
+        now = datetime.datetime.fromisoformat(now)
+        self.ticks += 1
+        states, points, crashed = [], [], []
+        for uid, seed in seeds:
+            coin = crypto_cache.get(uid)
+            if coin is None: continue
+            point = coin.step(Random(seed), now)
+            if point is not None: points.append([uid, point.date, point.value])
+            if coin.value <= coin.delete_value: crashed.append(uid)
+            states.append(coin.state())
+        return {"states": states, "points": points, "crashed": crashed}
+
+    def quote(self, coin:int, side:str, shares:int)->dict:
+        """
+        Prices a trade without making it.
+        """
+        coin = self._coin(coin)
+        v, subtotal, shares_traded = coin.quote(shares, buying=side == "buy")
+        return {"value": v, "subtotal": subtotal, "shares": shares_traded, "price": coin.value}
+
+    def trade(self, coin:int, side:str, shares:int, account:str, budget:int=0)->dict:
+        """
+        Prices a trade and makes it if it is allowed. :budget: the balance of the account, in money units
+
+        Returns the quote and the new state of the coin. if the trade is not allowed, nothing changes and "error" is
+        "balance"(cannot afford it) or "volume"(exceeds the trading limit).
+        """
+        coin = self._coin(coin)
+        previous = coin.value
+        v, subtotal, shares_traded = coin.quote(shares, buying=side == "buy")
+        total = User.calc_tax(account_name=account, subtotal=subtotal) if side == "buy" else subtotal
+
+        result = {"value": v, "subtotal": subtotal, "total": total, "shares": shares_traded, "previous": previous,
+                  "budget": budget, "error": None}
+        if side == "buy" and total > budget:
+            result["error"] = "balance"
+        elif User.volume_exceeds_trade_limit(account_name=account, volume=subtotal):
+            result["error"] = "volume"
+        else:
+            coin.change_currency_value(v)
+        result["state"] = coin.state()
+        return result
+
+    def auction(self, coin:int, bids:list, budgets:dict)->dict:
+        """
+        Clears a batch auction of the trades sent for a coin in one window. :bids: [[budget key, side, shares, account],
+        ...] in the order they were sent. :budgets: budget key -> the balance its buys share, in money units
+
+        the buys and sells are netted against each other. they trade with each other and only the difference is traded
+        with the market, through one run of quote(). every fill is priced at the average price of that run, so everyone
+        in the batch pays or gets the same price per share. if the value crashes or reaches its maximum before the
+        whole difference is traded, the bigger side is filled in the order it was sent.
+
+        a bid that cannot be afforded or exceeds the trading limit is refused like a trade would be, and the others are
+        priced again without it.
+
+        Returns the new value, the value before, the clearing price, a fill for every bid(shares, subtotal, total,
+        budget, error) and the new state of the coin.
+        """
+        coin = self._coin(coin)
+        previous = coin.value
+        refused = {} # bid -> its fill when it was refused
+        while True:
+            bought = sum(shares for i, (_, side, shares, _) in enumerate(bids) if side == "buy" and i not in refused)
+            sold = sum(shares for i, (_, side, shares, _) in enumerate(bids) if side == "sell" and i not in refused)
+            net = bought - sold
+            v, net_subtotal, net_traded = coin.quote(abs(net), buying=net > 0) if net else (previous, 0, 0)
+            price = to_dollars(net_subtotal) / net_traded if net_traded else previous # dollars per share
+            left = {"buy": min(bought, sold + net_traded), "sell": min(sold, bought + net_traded)} # shares to fill
+
+            fills, spent = [], {}
+            for i, (key, side, shares, account) in enumerate(bids):
+                if i in refused:
+                    fills.append(refused[i])
+                    continue
+                filled = min(shares, left[side])
+                left[side] -= filled
+                subtotal = to_money(price * filled)
+                total = User.calc_tax(account_name=account, subtotal=subtotal) if side == "buy" else subtotal
+                fill = {"shares": filled, "subtotal": subtotal, "total": total,
+                        "budget": budgets.get(key, 0) - spent.get(key, 0), "error": None}
+                if side == "buy" and total > fill["budget"]:
+                    fill["error"] = "balance"
+                elif User.volume_exceeds_trade_limit(account_name=account, volume=subtotal):
+                    fill["error"] = "volume"
+                if fill["error"] is not None:
+                    refused[i] = fill
+                    break
+                if side == "buy": spent[key] = spent.get(key, 0) + total
+                fills.append(fill)
+            else: # nobody was refused
+                break
+
+        coin.change_currency_value(v)
+        return {"value": v, "previous": previous, "price": price, "fills": fills, "state": coin.state(), "error": None}
+
+    def restore(self, coin:int, value:float, expected:float)->bool:
+        """
+        Undoes a trade that the bot could not commit. only if nothing else moved the value since.
+        """
+        coin = crypto_cache.get(coin)
+        if coin is None or coin.value != expected: return False
+        coin.change_currency_value(value)
+        return True
+
+    def snapshot(self)->list:
+        # every coin as a dict
+        return [coin.obj_to_dict() for coin in crypto_cache.values()]
+
+    def history(self, coin:int)->list:
+        # [[date, value], ...] the hourly values of a coin
+        return [[point.date, point.value] for point in self._coin(coin).values]
+
+class EngineClient:
+    def __init__(self):
+        """
+        Sends requests to the engine.
+
+        until a socket is given, the engine runs inside the bot on the bot's coins. the responses are applied to the
+        same coins again, which changes nothing.
+        """
+        self.local = MarketEngine()
+        self.client = None # the connection to the engine's process
+
+    def use_socket(self, path:str):
+        self.client = RpcClient(path, "market engine", error=EngineError, on_connect=self._load,
+                                timeout=request_timeout, changes=MarketEngine.changes_prices)
+
+    @property
+    def remote(self)->bool:
+        return self.client is not None
+
+    async def request(self, method:str, **params):
+        """
+        Sends a request and returns its result. raises EngineError if it failed or the engine cannot be reached.
+        """
+        if self.client is None:
+            return self.local.handle(method, params)
+        try:
+            return await self.client.request(method, **params)
+        except EngineError:
+            if method in MarketEngine.changes_prices: # the engine might have made it. it gets the bot's coins back now
+                try:
+                    await self.client.connect()
+                except EngineError: # the next request tries again
+                    pass
+            raise
+
+    async def reload(self):
+        """
+        Loads the engine with the bot's coins again. the connection is dropped first, so the requests waiting on it fail
+        and none of their results are applied to the replica.
+        """
+        if self.client is None: return
+        self.client.close()
+        try:
+            await self.client.connect()
+        except EngineError as error: # the next request loads it
+            logMsg(f"Could not reload the engine: {error}")
+
+    @staticmethod
+    async def _load(client:RpcClient):
+        # the bot's coins are the durable ones. the engine starts from them every time it is connected to. a request
+        # that failed after the engine might have made it(a trade that timed out) drops the connection, so the engine
+        # loses it here and never keeps a change the bot did not apply
+        await client.send("load", {"coins": [coin.obj_to_dict() for coin in crypto_cache.values()],
+                                   "next_uid": coin_index.next_uid})
+
+engine_client = EngineClient()
+
+def apply_states(states:list):
+    # applies the states the engine sent back to the replica
+    apply_coin_record({"op": "coin_state", "coins": states})
+
+async def undo_trade(coin:CryptoCurrency, value:float)->bool:
+    """
+    Gives a coin its value from before a trade that was not committed back, in the replica and in the engine. see
+    Transaction.rollback()
+
+    Returns True if the engine undid it. if it could not(something else moved the coin since, or it cannot be reached),
+    it is loaded with the replica's coins again, so it never keeps the trade.
+    """
+    expected, coin.value = coin.value, value
+    if not engine_client.remote: # the engine's coin is the replica's coin, it was just set
+        return True
+    try:
+        restored = await engine_client.request("restore", coin=coin.uid, value=value, expected=expected)
+    except EngineError as error:
+        logMsg(f"Could not undo a trade of {coin.name} in the engine: {error}")
+        restored = False
+    if not restored: await engine_client.reload()
+    return restored
+
+async def settle_crash(coin:CryptoCurrency):
+    """
+    Deletes the coin if it crashed after a trade, then tells the engine.
+    """
+    if not coin.should_delete(): return
+    publish_market()
+    try:
+        await engine_client.request("delete", coin=coin.uid)
+    except EngineError as error: # the trade was already committed. the engine loses the coin when it is loaded again
+        logMsg(f"Could not delete {coin.name} in the engine: {error}")
+
+@scheduler.job(every=1, phase="tick", catch_up=True)
+async def simulate_cache(): # simulates all currencies in the engine
+    if not wal.replayed: return # the cache is not loaded yet
+
+    started = time.perf_counter()
+    now = scheduler.now # the minute of the tick, so the hourly price point is never skipped or doubled
+
+    # every coin gets its own random number generator. the seeds are recorded so the tick can be replayed exactly
+    seeds = [[coin.uid, getrandbits(63)] for coin in crypto_cache.values()]
+    try:
+        result = await engine_client.request("tick", now=str(now), seeds=seeds)
+    except EngineError as error:
+        logMsg(f"Skipped a tick: {error}")
+        return
+
+    # recorded once the tick is applied, so it lands after every trade the engine applied before it
+    event_log.record(Tick(str(now), seeds))
+    apply_states(result["states"])
+    for uid, date, value in result["points"]: # logs the new points in the history of values
+        record = {"op": "price_point", "uid": uid, "date": date, "value": value}
+        apply_coin_record(record)
+        wal.append(record)
+    log_coin_states(crypto_cache.values()) # logs all the values at once
+    for coin in crypto_cache.values():
+        logEvent("tick", level=logging.DEBUG, coin=coin.name, value=coin.value, threshold=coin.threshold)
+
+    for uid in result["crashed"]:
+        coin = crypto_cache.get(uid)
+        if coin is not None: coin.delete()
+    publish_market()
+    leaderboard.reprice({uid: coin.value for uid, coin in market.snapshot.coins.items()}) # re-ranks the holders
+    event_log.flush()
+    ledger.flush() # the ledger entries of the last minute, in one write
+
+    logEvent("tick_done", coins=len(crypto_cache), ms=(time.perf_counter() - started) * 1000)
+
+    for uid in result["crashed"]:
+        await engine_client.request("delete", coin=uid)
+
+@scheduler.job(every=1, phase="listing")
+async def add_currencies(): # determines if we should add a currency or not
+    """
+    Adds a cryptocurrency.
+
+    There aren't too many people who will play this game. and if there are too many currencies compared to the people
+    who play, less atention will be given to certain currencies. This allows some people to take control of a coin
+    nobody is watching. Rather, the intended method is for users to compete for the same coins.
+
+    the amount of coins we want in the database at any given time is between 2-7.
+    If the number of coins existing is below that, we always add a new one. if it is above it, we never add a new one.
+    if it is anywhere between them, we add them at a rate of about 1/week.
+    """
+    if not wal.replayed: return
+
+    constants = config.current
+    count = len(crypto_cache)
+    if count > constants.max_coins: # never adds a coin
+        return
+
+    # always adds a coin below the minimum. otherwise, there is a small chance of adding a coin
+    if count < constants.min_coins or randint(1,2880) == 1: # once every 2 days on average
+        try:
+            coin = await add_coin()
+        except NamesExhausted as error:
+            logMsg(f"Could not add a new currency: {error}")
+            return
+        logMsg(f"Added new currency named {coin.name}!")
+
+async def add_coin()->CryptoCurrency:
+    """
+    Creates a new currency and hands it to the engine. raises NamesExhausted if every name is taken.
+    """
+    coin = CryptoCurrency()
+    try:
+        await engine_client.request("add_coin", coin=coin.obj_to_dict())
+    except EngineError as error: # it gets the coin when it is connected to again
+        logMsg(f"Could not send {coin.name} to the engine: {error}")
+    return coin
+
+@scheduler.job(every=1440, phase="supply")
+async def add_shares(): # adds more shares to all coins once every day, at midnight
+    if not wal.replayed: return
+
+    diffs = []
+    for coin in crypto_cache.values():
+        diff = choice([-1, 1]) * randint(5_000, 25_000)
+        diff = max(diff, holders.shares_held(coin.uid) - coin.total_shares) # never less shares than users are holding
+        diffs.append([coin.uid, diff])
+
+    try:
+        states = await engine_client.request("add_shares", diffs=diffs)
+    except EngineError as error:
+        logMsg(f"Did not add shares: {error}")
+        return
+
+    apply_states(states)
+    log_coin_states(crypto_cache.values())
+    publish_market()
+    event_log.record(AddShares(diffs))
+    for uid, diff in diffs:
+        coin = crypto_cache.get(uid)
+        if coin is not None: logEvent("add_shares", coin=coin.name, diff=diff, total_shares=coin.total_shares)
+
+async def serve(path:str, board_name:str=default_board):
+    """
+    Runs the engine as its own process, answering requests on the unix socket at :path:.
+    """
+    engine = MarketEngine()
+    engine.use_price_board(board_name)
+
+    async def handle(method:str, params:dict):
+        return engine.handle(method, params)
+
+    # requests are handled one at a time, in the order they arrive
+    server = await serve_requests(path, handle)
+    logMsg(f"Market engine listening on {path}")
+
+    stopped = asyncio.Event()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        asyncio.get_running_loop().add_signal_handler(signum, stopped.set)
+
+    async with server:
+        while not stopped.is_set(): # the constants are reloaded like in the bot
+            try:
+                await asyncio.wait_for(stopped.wait(), 60)
+            except asyncio.TimeoutError:
+                if config.reload(): logMsg("Reloaded the constants")
+
+    engine.board.close() # the price board would be left in shared memory otherwise
+    logMsg("Market engine stopped")
+
+if __name__ == '__main__':
+    asyncio.run(serve(sys.argv[1] if len(sys.argv) > 1 else default_socket,
+                      sys.argv[2] if len(sys.argv) > 2 else default_board))
@@ -0,0 +1,184 @@
+"""
+The event log.
+
+Every change to the economy is also recorded as a typed event in src/db/events/, one file per day. unlike the write
+ahead log, the event log is never emptied. it is the history of the economy, used to rebuild any past state offline
+for debugging and analytics. (see src/utils/replay.py)
+
+each event is one json line with its sequence number, the time and its type:
+    {"seq": 1042, "time": "2022-06-01 12:00:00", "type": "trade", "user": 1, "coin": 3, ...}
+
+ticks store the seed of every coin's random number generator, so replaying a tick gives exactly the same values.
+"""
+import atexit
+import datetime
+import json
+import os
+from typing import NamedTuple
+
+class Tick(NamedTuple):
+    now: str # the time the tick was simulated at. the simulation depends on it
+    seeds: list # [[coin uid, seed], ...] in the order the coins were simulated
+
+class Trade(NamedTuple):
+    user: int
+    account: str
+    coin: int
+    side: str # "buy" or "sell"
+    shares: int
+    subtotal: int # money units
+    total: int # money units, including tax
+    value: float # the value of the coin after the trade
+
+class Transfer(NamedTuple):
+    sender: int
+    recipient: int
+    amount: int
+
+class BankTransfer(NamedTuple):
+    user: int
+    account: str
+    amount: int # positive for deposits, negative for withdrawals
+
+class Daily(NamedTuple):
+    user: int
+    amount: int
+
+class Beg(NamedTuple):
+    user: int
+    amount: int
+
+class CoinFlip(NamedTuple):
+    user: int
+    amount: int
+    won: bool
+
+class Lower(NamedTuple):
+    user: int
+    guess: int
+    reference: int
+    change: int # the money won or lost
+    won: bool
+
+class AddShares(NamedTuple):
+    diffs: list # [[coin uid, diff], ...]
+
+class CoinCreated(NamedTuple):
+    coin: dict
+
+class CoinDeleted(NamedTuple):
+    coin: int
+
+class UserCreated(NamedTuple):
+    user: int
+    wallet: int
+
+# the type name of every event as it is written in the log
+event_types = {
+    "tick": Tick,
+    "trade": Trade,
+    "transfer": Transfer,
+    "bank_transfer": BankTransfer,
+    "daily": Daily,
+    "beg": Beg,
+    "coin_flip": CoinFlip,
+    "lower": Lower,
+    "add_shares": AddShares,
+    "coin_created": CoinCreated,
+    "coin_deleted": CoinDeleted,
+    "user_created": UserCreated,
+}
+type_names = {event_type: name for name, event_type in event_types.items()}
+
+class EventLog:
+    def __init__(self, directory:str="src/db/events"):
+        """
+        An append only log of events, split into one file per day.
+
+        events are buffered and written every tick(see flush()). the write ahead log is what keeps the economy safe,
+        so the event log does not have to be fsynced.
+        """
+        self.directory = directory
+        self.seq = None # the sequence number of the last event. read from the newest file the first time it is needed
+        self._buffer = []
+
+    def files(self)->list:
+        # every log file, oldest first. the names are dates, so sorting them sorts them by date
+        try:
+            names = sorted(name for name in os.listdir(self.directory) if name.endswith(".jsonl"))
+        except FileNotFoundError:
+            return []
+        return [os.path.join(self.directory, name) for name in names]
+
+    def _last_seq(self)->int:
+        for path in reversed(self.files()):
+            with open(path, "rb") as file:
+                lines = file.read().splitlines()
+            for line in reversed(lines):
+                try:
+                    return json.loads(line)["seq"]
+                except ValueError: # a line cut off by a crash
+                    continue
+        return 0
+
+    def last_seq(self)->int:
+        """
+        Returns the sequence number of the last event recorded.
+        """
+        if self.seq is None: self.seq = self._last_seq()
+        return self.seq
+
+    def record(self, event)->int:
+        """
+        Records an event. returns its sequence number.
+        """
+        self.seq = self.last_seq() + 1
+
+        now = datetime.datetime.now().replace(microsecond=0)
+        line = {"seq": self.seq, "time": str(now), "type": type_names[type(event)]}
+        line.update(event._asdict())
+        self._buffer.append((now.date(), json.dumps(line, separators=(",", ":"))))
+        return self.seq
+
+    def flush(self):
+        """
+        Writes the buffered events to their files.
+        """
+        if not self._buffer: return
+        os.makedirs(self.directory, exist_ok=True)
+
+        buffer, self._buffer = self._buffer, []
+        file, date = None, None
+        try:
+            for event_date, line in buffer:
+                if event_date != date: # events are split by the day they happened
+                    if file is not None: file.close()
+                    date = event_date
+                    file = open(os.path.join(self.directory, f"{date}.jsonl"), "a")
+                file.write(line + "\n")
+        finally:
+            if file is not None: file.close()
+
+    def read(self, after_seq:int=0, since:str=None):
+        """
+        Yields (seq, time, event) for every event after :after_seq:, in order.
+
+        :since: a date("2022-06-01"). files from before that day are skipped without being read.
+        """
+        self.flush()
+        for path in self.files():
+            if since is not None and os.path.basename(path)[:10] < since[:10]: continue
+
+            with open(path, "r") as file:
+                for line in file:
+                    try:
+                        data = json.loads(line)
+                    except ValueError:
+                        continue
+                    if data["seq"] <= after_seq: continue
+
+                    seq, time = data.pop("seq"), data.pop("time")
+                    yield seq, time, event_types[data.pop("type")](**data)
+
+event_log = EventLog()
+atexit.register(event_log.flush)
@@ -0,0 +1,186 @@
+"""
+Guild economies.
+
+By default every server shares one economy: the same coins, constants and users. a server can get an economy of its
+own instead. (the owner runs '>guild_economy' in it) every command sent in that server then runs in a separate economy
+backend(see shards.py) with its own partition of the storage:
+    src/db/guilds/[guild id]/
+        src/kryptonite_bot/   its constants.json(a copy of the global ones, changed on its own after) and imp_info.json
+        src/db/               its coins, users, write ahead log, ledger...
+        logs/
+the partition is laid out like the repo and its backend runs with the partition as its working directory, so every
+path the bot uses points into the partition and nothing else had to change.
+
+every awake guild economy is its own process. their ticks run in parallel, so a busy server's market and traffic
+never hold up the others. a guild's backend is started by the first command sent in the guild. a backend that did not
+get a command for idle_minutes is hibernated: it compacts its write ahead log into its files and stops. at most
+max_workers run at once. when another one is needed, the one that was used the longest time ago is hibernated first.
+"""
+import asyncio
+import os
+import shutil
+import sys
+import time
+from src.utils.json_utils import load_json, update_json, write_json_atomic
+from src.utils.rpc import RpcClient, RpcError
+from src.utils.log import logEvent, logMsg
+from src.utils.scheduler import scheduler
+
+idle_minutes = 30 # a guild economy without commands for this long is hibernated
+start_timeout = 30 # seconds a backend has to start listening
+
+# copied into every new partition. the constants are only the starting point, each guild changes its own
+partition_files = ("src/kryptonite_bot/constants.json", "src/kryptonite_bot/changelog.json", "src/db/crypto_names.json")
+
+class GuildWorker:
+    def __init__(self, guild_id:int, process, client:RpcClient):
+        """
+        The running backend of a guild economy.
+        """
+        self.guild_id = guild_id
+        self.process = process
+        self.client = client
+        self.last_used = time.monotonic()
+        self.active = 0 # requests waiting for an answer. a worker is never hibernated in the middle of one
+
+class GuildEconomies:
+    def __init__(self, directory:str="src/db/guilds", max_workers:int=8):
+        """
+        Keeps track of the guilds with their own economy and runs their backends.
+        """
+        self.directory = directory
+        self.max_workers = max_workers
+        self.guilds = set() # the ids of the guilds with their own economy
+        self.workers = {} # guild id -> GuildWorker, the awake economies
+        self._starting = {} # guild id -> the lock held while its backend starts
+        self.load()
+
+    def load(self):
+        if not os.path.isdir(self.directory): return
+        self.guilds = {int(name) for name in os.listdir(self.directory) if name.isdigit()}
+
+    def __contains__(self, guild_id:int)->bool:
+        return guild_id in self.guilds
+
+    def partition(self, guild_id:int)->str:
+        return f"{self.directory}/{guild_id}"
+
+    def socket_path(self, guild_id:int)->str:
+        # relative, so it stays under the length limit of unix socket paths
+        return f"{self.partition(guild_id)}/src/db/backend.sock"
+
+    def create(self, guild_id:int)->bool:
+        """
+        Gives a guild its own economy. Returns False if it already has one.
+
+        the partition starts with a copy of the global constants, no coins and no users.
+        """
+        if guild_id in self.guilds: return False
+
+        path = self.partition(guild_id)
+        for directory in ("src/kryptonite_bot", "src/db/users", "logs"):
+            os.makedirs(f"{path}/{directory}", exist_ok=True)
+        for file in partition_files:
+            shutil.copyfile(file, f"{path}/{file}")
+        write_json_atomic(f"{path}/src/db/crypto_currencies.json", {"currencies": [], "count": 0, "next_uid": 1})
+
+        self.guilds.add(guild_id)
+        logEvent("guild_economy_created", guild=guild_id)
+        return True
+
+    async def request(self, guild_id:int, method:str, **params):
+        """
+        Sends a request to the guild's backend, waking it up first if it is hibernated. raises RpcError if it failed.
+        """
+        worker = await self.wake(guild_id)
+        worker.active += 1
+        worker.last_used = time.monotonic()
+        try:
+            return await worker.client.request(method, **params)
+        finally:
+            worker.active -= 1
+            worker.last_used = time.monotonic()
+
+    async def wake(self, guild_id:int)->GuildWorker:
+        """
+        Returns the guild's running backend. starts it if it is not running.
+        """
+        worker = self.workers.get(guild_id)
+        if worker is not None and worker.process.returncode is None: return worker
+
+        lock = self._starting.setdefault(guild_id, asyncio.Lock())
+        async with lock: # a burst of commands in a hibernated guild only starts it once
+            worker = self.workers.get(guild_id)
+            if worker is not None and worker.process.returncode is None: return worker
+            if worker is not None: # it stopped by itself. its partition is still consistent, the log is replayed
+                logMsg(f"The economy of guild {guild_id} stopped with code {worker.process.returncode}")
+                self.workers.pop(guild_id)
+
+            if len(self.workers) >= self.max_workers: await self.hibernate_oldest()
+            worker = await self._start(guild_id)
+            self.workers[guild_id] = worker
+            return worker
+
+    async def _start(self, guild_id:int)->GuildWorker:
+        started = time.perf_counter()
+        path = self.partition(guild_id)
+        socket_path = self.socket_path(guild_id)
+
+        # the backend's settings are the bot's, pointed at the partition. written every time so a new token is used
+        imp_info = load_json("src/kryptonite_bot/imp_info.json")
+        imp_info.update({"backend socket": "src/db/backend.sock", "engine socket": "", "price board": "",
+                         "guild id": guild_id})
+        update_json(f"{path}/src/kryptonite_bot/imp_info.json", imp_info)
+        if os.path.exists(socket_path): os.remove(socket_path) # left behind by a backend that was killed
+
+        env = dict(os.environ, PYTHONPATH=os.getcwd()) # the partition has no code, it is imported from here
+        process = await asyncio.create_subprocess_exec(sys.executable, "-m", "src.main", cwd=path, env=env)
+
+        deadline = time.monotonic() + start_timeout
+        while not os.path.exists(socket_path): # it listens once its economy is loaded
+            if process.returncode is not None or time.monotonic() > deadline:
+                if process.returncode is None: process.kill()
+                raise RpcError(f"the economy of guild {guild_id} did not start")
+            await asyncio.sleep(0.1)
+
+        client = RpcClient(socket_path, f"economy of guild {guild_id}", timeout=30)
+        logEvent("guild_economy_woken", guild=guild_id, workers=len(self.workers) + 1,
+                 ms=(time.perf_counter() - started) * 1000)
+        return GuildWorker(guild_id, process, client)
+
+    async def hibernate(self, guild_id:int):
+        """
+        Stops the guild's backend. it compacts its log into its partition before it exits.
+        """
+        worker = self.workers.pop(guild_id, None)
+        if worker is None: return
+        worker.client.close()
+        if worker.process.returncode is None:
+            worker.process.terminate()
+            await worker.process.wait()
+        logEvent("guild_economy_hibernated", guild=guild_id, idle_s=time.monotonic() - worker.last_used)
+
+    async def hibernate_oldest(self):
+        # makes room for another worker. ones that are answering a request are left alone
+        idle = [worker for worker in self.workers.values() if worker.active == 0]
+        if not idle:
+            logMsg(f"Every guild economy is busy, running more than {self.max_workers}")
+            return
+        await self.hibernate(min(idle, key=lambda worker: worker.last_used).guild_id)
+
+    async def hibernate_idle(self):
+        now = time.monotonic()
+        for worker in list(self.workers.values()):
+            if worker.active == 0 and now - worker.last_used > idle_minutes * 60:
+                await self.hibernate(worker.guild_id)
+
+    async def close(self):
+        # hibernates every guild economy. when the bot stops
+        for guild_id in list(self.workers):
+            await self.hibernate(guild_id)
+
+guild_economies = GuildEconomies()
+
+@scheduler.job(every=1, phase="housekeeping")
+async def hibernate_guilds(): # hibernates the guild economies nobody used for a while
+    await guild_economies.hibernate_idle()
@@ -0,0 +1,107 @@
+"""
+The holders index.
+
+Maps every coin to the users holding it: coin id -> user id -> account name -> shares. it is the inverted index of the
+holdings in the user files, so anything about the holders of a coin only visits the users that actually hold it:
+    - when a coin is deleted, only its holders are cleaned up. (see drop_dead_holdings() in transactions.py)
+    - add_shares never takes the supply of a coin below the shares users are holding.
+    - '>view' shows the number of holders and the shares they hold.
+
+the index is updated with the whole holdings of a user every time they are saved or committed, so holdings changed by
+a transaction that was rolled back never get in. it is written to src/db/holders.json when the write ahead log is
+compacted and the user records in the log are replayed on top of it. if the file is missing, it is rebuilt from every
+user file.
+"""
+from src.utils.json_utils import *
+
+class HoldersIndex:
+    def __init__(self, path:str="src/db/holders.json"):
+        self.path = path
+        self.coins = {} # coin id -> user id -> account name -> shares
+        self.users = {} # user id -> the ids of the coins they hold. used to find what to remove when they are updated
+        self.held = {} # coin id -> the total shares held by users
+        self.pending = set() # coins that were deleted but whose holders were not cleaned up yet
+
+    def update(self, uid:int, accounts:dict):
+        """
+        Replaces everything the index knows about a user.
+
+        :accounts: account name -> the holdings of the account(coin id -> shares)
+        """
+        coins = {}
+        for name, holdings in accounts.items():
+            for coin_uid, shares in holdings.items():
+                coins.setdefault(int(coin_uid), {})[name] = shares # replayed records have string keys
+
+        for coin_uid in self.users.pop(uid, set()) - coins.keys(): # coins they dont hold anymore
+            self._remove(coin_uid, uid)
+        for coin_uid, shares in coins.items():
+            self._remove(coin_uid, uid)
+            self.coins.setdefault(coin_uid, {})[uid] = shares
+            self.held[coin_uid] = self.held.get(coin_uid, 0) + sum(shares.values())
+        if coins: self.users[uid] = set(coins)
+
+    def _remove(self, coin_uid:int, uid:int):
+        holders = self.coins.get(coin_uid)
+        if holders is None or uid not in holders: return
+
+        self.held[coin_uid] -= sum(holders.pop(uid).values())
+        if not holders:
+            del self.coins[coin_uid]
+            del self.held[coin_uid]
+
+    def holders_of(self, coin_uid:int)->dict:
+        # user id -> account name -> shares. empty if no one holds the coin
+        return self.coins.get(coin_uid, {})
+
+    def num_holders(self, coin_uid:int)->int:
+        return len(self.coins.get(coin_uid, ()))
+
+    def shares_held(self, coin_uid:int)->int:
+        return self.held.get(coin_uid, 0)
+
+    def coin_deleted(self, coin_uid:int):
+        # the holders still have the coin in their holdings until they are cleaned up
+        if coin_uid in self.coins: self.pending.add(coin_uid)
+
+    def cleared(self, coin_uid:int):
+        # every holder of a deleted coin was cleaned up
+        self.pending.discard(coin_uid)
+
+    def rebuild(self, users:dict):
+        """
+        Rebuilds the index from every user. :users: user id -> User
+        """
+        self.coins, self.users, self.held = {}, {}, {}
+        for uid, user in users.items():
+            self.update(uid, user.all_holdings())
+
+    def load(self)->bool:
+        """
+        Loads the index from the last compaction. returns False if there is none and it has to be rebuilt.
+        """
+        try:
+            data = load_json(self.path)
+        except (OSError, ValueError):
+            return False
+
+        users = {} # the file is by coin, the index is updated by user
+        for coin_uid, holders in data["coins"].items():
+            for uid, accounts in holders.items():
+                for name, shares in accounts.items():
+                    users.setdefault(int(uid), {}).setdefault(name, {})[int(coin_uid)] = shares
+        for uid, accounts in users.items():
+            self.update(uid, accounts)
+        self.pending = set(data["pending"])
+        return True
+
+    def to_dict(self)->dict:
+        # a copy, the index keeps changing while compaction writes it
+        return {"coins": {coin_uid: {uid: dict(shares) for uid, shares in users.items()}
+                          for coin_uid, users in self.coins.items()},
+                "pending": sorted(self.pending)}
+
+    def save(self):
+        write_json_atomic(self.path, self.to_dict())
+
+holders = HoldersIndex()
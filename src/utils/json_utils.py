@@ -4,6 +4,7 @@ JSON utilities.
 Currently consists of loading and updating json files
 """
 import json
+import os
 
 def load_json(file_path):
     """
@@ -34,6 +35,24 @@ def update_json(file_path, file_data, operation="w"):
     with open(file_path, operation) as file:
         file.write(json.dumps(file_data, indent=4, sort_keys=False))
 
+def write_json_atomic(file_path, file_data, fsync:bool=True):
+    """
+    Writes a json file so that it is either fully written or not changed at all.
+
+    the data is written to a temporary file next to it, flushed to disk and then renamed over the old file. a rename
+    is atomic, so a crash can never leave a half written file behind. update_json() opens the file with "w" which
+    empties it first.
+
+    :fsync: whether to wait until the data is actually on disk before renaming
+    """
+    temp_path = f"{file_path}.tmp"
+    with open(temp_path, "w") as file:
+        file.write(json.dumps(file_data, indent=4, sort_keys=False))
+        if fsync:
+            file.flush()
+            os.fsync(file.fileno())
+    os.replace(temp_path, file_path)
+
 def pretty_print(data:dict):
     print(json.dumps(data, indent=4, sort_keys=False))
 
@@ -0,0 +1,209 @@
+"""
+The leaderboard.
+
+Ranks every user by net worth: their wallet, both bank accounts and the market value of their holdings. the ranking is
+kept in a skip list that is updated a user at a time, so it never has to read the user files:
+    - when a user is saved or committed, only their own position changes. (see User.reindex())
+    - every tick, the holders of a coin are the only users whose worth moves with its price, so only the users in the
+      holders index are re-ranked. (see src/utils/holders.py)
+
+the cash of every user is written to src/db/leaderboard.json when the write ahead log is compacted, so on startup the
+ranking is built from it and the users in the log, without opening the user files. they are only read on the first
+start with a leaderboard. (see recover() in transactions.py)
+"""
+from random import Random
+from src.utils.json_utils import *
+from src.utils.money import money_scale
+from src.utils.holders import holders
+
+class _Node:
+    __slots__ = ("key", "next", "width")
+
+    def __init__(self, key, level:int):
+        self.key = key
+        self.next = [None] * level
+        self.width = [1] * level # how many places the link at each level skips
+
+class SkipList:
+    max_level = 32 # enough for 4^32 keys
+
+    def __init__(self):
+        """
+        An indexable skip list. keeps its keys sorted and finds, inserts, removes and ranks them in O(log n).
+
+        every link remembers how many places it skips, so the position of a key is the sum of the links followed to
+        reach it, and the key at a position is found by following links until they add up to it.
+        """
+        self.head = _Node(None, self.max_level)
+        self.size = 0
+        self._rng = Random()
+
+    def __len__(self)->int:
+        return self.size
+
+    def _random_level(self)->int:
+        # 1 in 4 nodes go up a level
+        level = 1
+        while level < self.max_level and self._rng.random() < 0.25:
+            level += 1
+        return level
+
+    def _find(self, key):
+        # the last node before :key: on every level, and its position
+        update, positions = [None] * self.max_level, [0] * self.max_level
+        node, position = self.head, 0
+        for level in reversed(range(self.max_level)):
+            while node.next[level] is not None and node.next[level].key < key:
+                position += node.width[level]
+                node = node.next[level]
+            update[level], positions[level] = node, position
+        return update, positions
+
+    def insert(self, key):
+        update, positions = self._find(key)
+        position = positions[0] # the new node goes right after this
+
+        node = _Node(key, self._random_level())
+        for level in range(self.max_level):
+            if level < len(node.next):
+                node.next[level] = update[level].next[level]
+                update[level].next[level] = node
+                node.width[level] = update[level].width[level] - (position - positions[level])
+                update[level].width[level] = position + 1 - positions[level]
+            else: # the link passes over the new node
+                update[level].width[level] += 1
+        self.size += 1
+
+    def remove(self, key):
+        """
+        raises a KeyError if the key is not in the list.
+        """
+        update, _ = self._find(key)
+        node = update[0].next[0]
+        if node is None or node.key != key: raise KeyError(key)
+
+        for level in range(self.max_level):
+            if update[level].next[level] is node:
+                update[level].width[level] += node.width[level] - 1
+                update[level].next[level] = node.next[level]
+            else:
+                update[level].width[level] -= 1
+        self.size -= 1
+
+    def rank(self, key)->int:
+        """
+        Returns the position of :key:, starting at 1. raises a KeyError if it is not in the list.
+        """
+        update, positions = self._find(key)
+        node = update[0].next[0]
+        if node is None or node.key != key: raise KeyError(key)
+        return positions[0] + 1
+
+    def slice(self, start:int, count:int)->list:
+        """
+        Returns up to :count: keys starting at position :start:(starting at 1).
+        """
+        node, position = self.head, 0
+        for level in reversed(range(self.max_level)): # jumps to the node before :start:
+            while node.next[level] is not None and position + node.width[level] < start:
+                position += node.width[level]
+                node = node.next[level]
+
+        keys = []
+        node = node.next[0]
+        while node is not None and len(keys) < count:
+            keys.append(node.key)
+            node = node.next[0]
+        return keys
+
+class Leaderboard:
+    def __init__(self, path:str="src/db/leaderboard.json"):
+        """
+        Users ranked by net worth, richest first. ties go to the lower id.
+
+        worths are in money units. holdings are valued at the prices of the last tick.
+        """
+        self.path = path
+        self.ranking = SkipList() # (-worth, uid) keys
+        self.cash = {} # user id -> money in their wallet and bank accounts
+        self.worth = {} # user id -> net worth
+        self.prices = {} # coin id -> the value the worths were computed with
+
+    def holdings_value(self, uid:int)->int:
+        value = 0.0
+        for coin_uid in holders.users.get(uid, ()):
+            shares = sum(holders.coins[coin_uid][uid].values())
+            value += shares * self.prices.get(coin_uid, 0) # coins that crashed are worth nothing
+        return round(value * money_scale)
+
+    def _set(self, uid:int, worth:int):
+        old = self.worth.get(uid)
+        if old == worth: return
+        if old is not None: self.ranking.remove((-old, uid))
+        self.worth[uid] = worth
+        self.ranking.insert((-worth, uid))
+
+    def update(self, uid:int, cash:int):
+        """
+        Re-ranks a user after they were saved. their holdings are read from the holders index, so it has to be
+        updated first.
+        """
+        self.cash[uid] = cash
+        self._set(uid, cash + self.holdings_value(uid))
+
+    def reprice(self, prices:dict):
+        """
+        Re-ranks every user holding coins at the new prices. :prices: coin id -> value
+        """
+        self.prices = dict(prices)
+        for uid in list(holders.users):
+            self._set(uid, self.cash.get(uid, 0) + self.holdings_value(uid))
+
+    def build(self, cash:dict, prices:dict):
+        """
+        Ranks every user from scratch. :cash: user id -> money in their wallet and bank accounts
+        """
+        self.ranking, self.cash, self.worth = SkipList(), {}, {}
+        self.prices = dict(prices)
+        for uid, money in cash.items():
+            self.update(uid, money)
+
+    def load(self):
+        """
+        Returns the cash of every user at the last compaction, or None if there is no leaderboard yet.
+        """
+        try:
+            data = load_json(self.path)
+        except (OSError, ValueError):
+            return None
+        return {int(uid): money for uid, money in data["cash"].items()}
+
+    def to_dict(self)->dict:
+        return {"cash": dict(self.cash)}
+
+    def save(self):
+        write_json_atomic(self.path, self.to_dict())
+
+    def top(self, start:int=1, count:int=10)->list:
+        """
+        Returns [(rank, user id, worth), ...] for :count: users starting at rank :start:.
+        """
+        return [(rank, uid, -worth) for rank, (worth, uid) in
+                enumerate(self.ranking.slice(start, count), start)]
+
+    def rank_of(self, uid:int):
+        # the rank of the user, starting at 1. None if they have never been saved
+        worth = self.worth.get(uid)
+        if worth is None: return None
+        return self.ranking.rank((-worth, uid))
+
+    def among(self, uids)->list:
+        """
+        Ranks only the given users.(the members of a guild) Returns [(rank, user id, worth), ...]
+
+        guilds are much smaller than the whole userbase, so they are just sorted.
+        """
+        ranked = sorted((-self.worth[uid], uid) for uid in uids if uid in self.worth)
+        return [(rank, uid, -worth) for rank, (worth, uid) in enumerate(ranked, 1)]
+
+leaderboard = Leaderboard()
@@ -0,0 +1,171 @@
+"""
+The money ledger.
+
+Every time money moves, a balanced entry is posted: money taken out of some accounts and put into others, adding up
+to 0. the accounts are either a user's wallet/bank accounts or one of the system accounts:
+    mint: pays out new money. (start amount, daily, beg)
+    house: the other side of every bet. (coin_flip, lower)
+    market: the other side of every trade.
+    tax: collects the taxes on trades.
+    cap: collects the money cut off by the max balance.
+
+system accounts start at 0 and go negative as they pay out, so the money of every user plus the balances of the
+system accounts always adds up to 0. transactions check this for the users they touch on every commit(see
+transactions.py) and the whole economy is checked every time a snapshot is taken.(see replay.py)
+
+entries go into the write ahead log with the commit they belong to, and are written to src/db/ledger.jsonl in
+batches, once per tick. the balances of the system accounts are saved in src/db/ledger.json when the log is compacted.
+"""
+import atexit
+import json
+from typing import NamedTuple
+from src.utils.json_utils import *
+from src.utils.log import logMsg
+
+system_accounts = ("mint", "house", "market", "tax", "cap")
+
+class LedgerImbalance(Exception):
+    """
+    Raised when an entry does not add up to 0, or when users gained or lost money that was not posted.
+    """
+
+class Entry(NamedTuple):
+    memo: str # what the money was for. ("daily", "buy", ...)
+    postings: dict # account -> amount in money units. adds up to 0
+
+def wallet(uid:int)->str:
+    return f"{uid}:wallet"
+
+def bank(uid:int, account_name:str)->str:
+    # the name of a user's bank account in the ledger. "wallet" is accepted too
+    return f"{uid}:{account_name}"
+
+def move(memo:str, source:str, dest:str, amount:int)->Entry:
+    """
+    An entry moving :amount: from :source: to :dest:.
+    """
+    return Entry(memo, {source: -amount, dest: amount})
+
+def user_of(account:str):
+    # the id of the user that owns the account, or None for system accounts
+    uid, _, _ = account.partition(":")
+    return int(uid) if _ else None
+
+class Ledger:
+    def __init__(self, state_path:str="src/db/ledger.json", journal_path:str="src/db/ledger.jsonl"):
+        self.state_path = state_path
+        self.journal_path = journal_path
+        self.balances = {name: 0 for name in system_accounts}
+        self.seq = 0 # the number of the last entry posted
+        self.opened = False # if the existing money was given an opening balance yet. see open()
+        self._saved_seq = 0 # the last entry in ledger.json
+        self._journal_seq = 0 # the last entry in ledger.jsonl
+        self._buffer = []
+
+    def load(self):
+        """
+        Loads the balances from the last compaction and finds the last entry written to the journal.
+        """
+        try:
+            state = load_json(self.state_path)
+        except (OSError, ValueError):
+            return
+        self.balances.update(state["balances"])
+        self.seq = self._saved_seq = self._journal_seq = state["seq"]
+        self.opened = True
+
+        try:
+            with open(self.journal_path, "rb") as file:
+                for line in file.read().splitlines()[::-1]:
+                    try:
+                        self._journal_seq = max(self._journal_seq, json.loads(line)["seq"])
+                        break
+                    except ValueError: # cut off by a crash
+                        continue
+        except FileNotFoundError:
+            pass
+
+    def open(self, user_money:int):
+        """
+        Gives the money users had before the ledger existed an opening balance, as if the mint paid it all out.
+        """
+        self.balances["mint"] -= user_money + self.total() # entries replayed before opening are already counted
+        self.opened = True
+        logMsg(f"Opened the ledger with {user_money} units of existing money")
+
+    @staticmethod
+    def check(entry:Entry):
+        if sum(entry.postings.values()) != 0:
+            raise LedgerImbalance(f"{entry.memo} entry does not add up to 0: {entry.postings}")
+
+    def apply(self, entry:Entry, seq:int=None)->dict:
+        """
+        Posts an entry to the system accounts. Returns it as the dict that is logged.
+
+        :seq: only given when replaying the write ahead log. entries that are already in the balances are skipped.
+        """
+        self.check(entry)
+        if seq is None:
+            self.seq += 1
+            seq = self.seq
+        elif seq <= self._saved_seq:
+            return None
+        else:
+            self.seq = max(self.seq, seq)
+
+        for account, amount in entry.postings.items():
+            if account in self.balances:
+                self.balances[account] += amount
+
+        record = {"seq": seq, "memo": entry.memo, "postings": entry.postings}
+        if seq > self._journal_seq: self._buffer.append(record)
+        return record
+
+    @staticmethod
+    def user_deltas(entries)->dict:
+        """
+        Returns how much money every user gained or lost in the given entries, by user id.
+        """
+        deltas = {}
+        for entry in entries:
+            for account, amount in entry.postings.items():
+                uid = user_of(account)
+                if uid is not None:
+                    deltas[uid] = deltas.get(uid, 0) + amount
+        return deltas
+
+    def total(self)->int:
+        # the balance of all system accounts. the money of every user adds up to the opposite of this
+        return sum(self.balances.values())
+
+    def flush(self):
+        """
+        Writes the entries posted since the last flush to the journal, all at once.
+        """
+        if not self._buffer: return
+        buffer, self._buffer = self._buffer, []
+        with open(self.journal_path, "a") as file:
+            file.write("".join(json.dumps(record, separators=(",", ":")) + "\n" for record in buffer))
+        self._journal_seq = buffer[-1]["seq"]
+
+    def to_dict(self)->dict:
+        """
+        Returns the balances to save. the journal is flushed first, it has to reach the seq they are saved with.
+        """
+        self.flush()
+        return {"seq": self.seq, "balances": dict(self.balances)}
+
+    def saved(self, seq:int):
+        # the balances up to :seq: are in ledger.json. replayed entries up to there are already in them
+        self._saved_seq = seq
+
+    def save(self):
+        """
+        Saves the balances. called when the ledger is first opened.
+        """
+        state = self.to_dict()
+        write_json_atomic(self.state_path, state)
+        self.saved(state["seq"])
+
+ledger = Ledger()
+atexit.register(ledger.flush)
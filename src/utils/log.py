@@ -1,13 +1,187 @@
+"""
+Logging utilities.
+
+Everything logged goes through a queue. the event loop only puts records into the queue and a background thread
+(the listener) formats them and writes them to the console and to the log files. This way, a slow disk or a flood of
+gateway events never blocks the bot.
+
+log files are stored in logs/ and are rotated once they get too big. old files are compressed with gzip.
+"""
+import atexit
 import datetime
+import gzip
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import shutil
 
 #add in ansi colour codes
 
+logger = logging.getLogger("kryptonite") # the logger used by the bot itself
+log_queue = queue.SimpleQueue()
+_listener = None
+
+# the fraction of DEBUG records that are kept for noisy loggers. every other level is always kept.
+default_sample_rates = {
+    "discord.gateway": 0.05,
+    "discord.http": 0.25,
+    "discord.client": 0.25,
+}
+
+class SamplingFilter(logging.Filter):
+    def __init__(self, rates:dict):
+        """
+        Only lets through a fraction of the DEBUG records of certain loggers.
+
+        rates are given per logger name. a rate also applies to the children of that logger, so "discord.gateway"
+        will sample "discord.gateway.shard" too. the rate that is used is cached per logger name so we dont have to
+        walk up the names on every record.
+        """
+        super().__init__()
+        self.rates = rates
+        self._cache = {}
+
+    def rate(self, name:str)->float:
+        try:
+            return self._cache[name]
+        except KeyError:
+            pass
+
+        rate, parent = 1.0, name
+        while parent:
+            if parent in self.rates:
+                rate = self.rates[parent]
+                break
+            parent = parent.rpartition(".")[0]
+
+        self._cache[name] = rate
+        return rate
+
+    def filter(self, record)->bool:
+        if record.levelno > logging.DEBUG: return True
+        rate = self.rate(record.name)
+        return rate >= 1.0 or random.random() < rate
+
+class KeyValueFormatter(logging.Formatter):
+    """
+    Formats structured records as "message key=value key=value".
+
+    the key/value pairs are passed in as the "fields" extra. see logEvent()
+    """
+    def format(self, record)->str:
+        msg = super().format(record)
+        fields = getattr(record, "fields", None)
+        if fields:
+            msg += " " + " ".join(f"{key}={format_value(value)}" for key, value in fields.items())
+        return msg
+
+class CompressedRotatingFileHandler(logging.handlers.RotatingFileHandler):
+    """
+    A RotatingFileHandler that gzips the files it rotates out.
+
+    only runs in the listener thread, so compressing never blocks the event loop.
+    """
+    def __init__(self, filename, max_bytes:int, backup_count:int):
+        super().__init__(filename, mode="a", maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8")
+        self.namer = lambda name: name + ".gz"
+        self.rotator = self.compress
+
+    @staticmethod
+    def compress(source:str, dest:str):
+        with open(source, "rb") as file, gzip.open(dest, "wb") as compressed:
+            shutil.copyfileobj(file, compressed)
+        os.remove(source)
+
+def format_value(value)->str:
+    # floats are rounded so the logs stay readable, strings with spaces are quoted
+    if isinstance(value, float):
+        value = round(value, 4)
+    value = str(value)
+    if " " in value or value == "":
+        value = '"' + value.replace('"', '\\"') + '"'
+    return value
+
+def setup_logging(log_dir:str="logs", sample_rates:dict=None, max_bytes:int=5_000_000, backup_count:int=5):
+    """
+    Sets up the logging pipeline.
+
+    the bot's own logger and discord's logger both put their records into log_queue. the listener thread then
+    writes them to:
+        the console: the bot's INFO records. this is what logMsg used to print
+        logs/kryptonite.log: all of the bot's records
+        logs/discord.log: discord's records. DEBUG records from noisy loggers are sampled by :sample_rates:
+
+    Is safe to call more than once, only the first call does anything.
+    """
+    global _listener
+    if _listener is not None: return
+
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    queue_handler.addFilter(SamplingFilter(default_sample_rates if sample_rates is None else sample_rates))
+
+    for name, level in (("kryptonite", logging.DEBUG), ("discord", logging.DEBUG)):
+        log = logging.getLogger(name)
+        log.setLevel(level)
+        log.addHandler(queue_handler)
+        log.propagate = False
+
+    console = logging.StreamHandler()
+    console.setLevel(logging.INFO)
+    console.addFilter(logging.Filter("kryptonite"))
+    console.setFormatter(KeyValueFormatter("[%(asctime)s]: %(message)s", datefmt="%Y-%m-%d %H:%M:%S"))
+
+    file_format = KeyValueFormatter("%(asctime)s:%(levelname)s:%(name)s: %(message)s")
+
+    bot_file = CompressedRotatingFileHandler(os.path.join(log_dir, "kryptonite.log"), max_bytes, backup_count)
+    bot_file.addFilter(logging.Filter("kryptonite"))
+    bot_file.setFormatter(file_format)
+
+    discord_file = CompressedRotatingFileHandler(os.path.join(log_dir, "discord.log"), max_bytes, backup_count)
+    discord_file.addFilter(logging.Filter("discord"))
+    discord_file.setFormatter(file_format)
+
+    _listener = logging.handlers.QueueListener(log_queue, console, bot_file, discord_file, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+
+def stop_logging():
+    """
+    Writes out whatever is left in the queue and stops the listener thread.
+    """
+    global _listener
+    if _listener is None: return
+    _listener.stop()
+    _listener = None
+
 def logMsg(message):
     """
     Logs messages by printing them and giving us the datetime.
 
+    once setup_logging() was called, the message is queued instead and the listener thread prints it.
+
     :param message: message we want to print
     """
+    if _listener is None: # logging was never set up. (test scripts)
+        now = datetime.datetime.now().replace(microsecond=0)
+        print(f"[{now}]: {message}")
+        return
+
+    logger.info(message)
+
+def logEvent(event:str, level:int=logging.INFO, **fields):
+    """
+    Logs a structured record.
+
+    the event name is the message and every keyword argument is written as key=value after it.
+    Example:
+        >>>logEvent("trade", side="buy", coin="kuki-bux", shares=50)
+        [2022-06-01 12:00:00]: trade side=buy coin=kuki-bux shares=50
+    """
+    if _listener is None:
+        if level < logging.INFO: return
+        logMsg(" ".join([event] + [f"{key}={format_value(value)}" for key, value in fields.items()]))
+        return
 
-    now = datetime.datetime.now().replace(microsecond=0)
-    print(f"[{now}]: {message}")
+    logger.log(level, event, extra={"fields": fields})
@@ -0,0 +1,61 @@
+"""
+The market snapshot.
+
+The coins in crypto_cache are changed in place by ticks and trades. commands that only read the market(view, list,
+holdings, can_afford) read an immutable snapshot of it instead. a new snapshot is published after every tick, trade
+and every coin that is added or deleted, then swapped in with a single assignment.
+
+readers just take market.snapshot once and use it. nothing in it can change, so every coin in it is from the same
+moment and it never has to be locked or copied:
+    snapshot = market.snapshot
+    coin = snapshot.by_name.get("kuki-bux")
+"""
+import datetime
+from types import MappingProxyType
+from typing import NamedTuple
+
+class CoinView(NamedTuple):
+    uid: int
+    name: str
+    value: float
+    total_shares: int
+    market_cap: float
+    value_text: str # "$12.3456"
+    market_cap_text: str
+
+class MarketSnapshot(NamedTuple):
+    version: int # goes up by 1 with every snapshot
+    time: str
+    coins: MappingProxyType # coin id -> CoinView
+    by_name: MappingProxyType # coin name -> CoinView
+    listing: str # the text of '>list'
+
+    def price(self, uid:int)->float:
+        # the value of a coin. coins that crashed are worth nothing
+        coin = self.coins.get(uid)
+        return 0 if coin is None else coin.value
+
+class Market:
+    def __init__(self):
+        self.snapshot = MarketSnapshot(0, "", MappingProxyType({}), MappingProxyType({}), "")
+
+    def publish(self, coins):
+        """
+        Takes a snapshot of :coins:(the live coins) and makes it the current one.
+        """
+        views = {}
+        for coin in coins:
+            market_cap = coin.market_cap
+            views[coin.uid] = CoinView(coin.uid, coin.name, coin.value, coin.total_shares, market_cap,
+                                       f"${round(coin.value, 4)}", f"${round(market_cap, 4)}")
+
+        listing = "".join(f"{view.name}  -  {view.value_text}\n" for view in views.values())
+        self.snapshot = MarketSnapshot(
+            self.snapshot.version + 1,
+            str(datetime.datetime.now().replace(microsecond=0)),
+            MappingProxyType(views),
+            MappingProxyType({view.name: view for view in views.values()}),
+            listing or "No currencies", # embeds cannot contain empty strings
+        )
+
+market = Market()
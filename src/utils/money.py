@@ -0,0 +1,70 @@
+"""
+Money utilities.
+
+All money(wallets, balances, costs, taxes) is stored as an integer number of money units instead of a float number
+of dollars. 1 unit is $0.0001, the same precision the bot always displayed with round(x, 4).
+integers never lose precision, so balances dont turn into '1e+X' and adding money up is always exact.
+
+the maximum balance($1e14) is 1e18 units, which still fits in a signed 64 bit integer. (9.2e18)
+this means balances can be put into int64 arrays for bulk operations.
+
+coin values(prices) are still floats. only the amount of money a trade costs is converted to units.
+"""
+from decimal import Decimal, InvalidOperation, ROUND_HALF_EVEN, ROUND_CEILING, ROUND_FLOOR
+
+money_scale = 10_000 # the number of units in a dollar
+int64_max = 2**63 - 1
+
+def to_money(dollars)->int:
+    """
+    Converts dollars(int, float or str) to money units.
+
+    floats are converted through their string so 0.1 becomes exactly 1000 units.
+    raises a ValueError if it is not a number. because of that it can also be used as a command converter:
+        async def deposit(ctx, account_name:str, amount:to_money)
+    Examples:
+        >>>to_money(12.5)
+        125000
+        >>>to_money("0.0001")
+        1
+    """
+    if isinstance(dollars, int) and not isinstance(dollars, bool):
+        return dollars * money_scale
+
+    try:
+        amount = Decimal(str(dollars).replace("_", "").strip())
+    except InvalidOperation:
+        raise ValueError(f"{dollars} is not a valid amount of money") from None
+    if not amount.is_finite():
+        raise ValueError(f"{dollars} is not a valid amount of money")
+    return int((amount * money_scale).to_integral_value(ROUND_HALF_EVEN))
+
+def to_dollars(amount:int)->float:
+    """
+    Converts money units to dollars. only used for display and for math with coin values.
+    """
+    return amount / money_scale
+
+def fmt_money(amount:int)->str:
+    """
+    Formats money units as dollars without rounding errors. trailing zeros are removed.
+    Examples:
+        >>>fmt_money(125000)
+        '12.5'
+        >>>fmt_money(-1)
+        '-0.0001'
+    """
+    sign = "-" if amount < 0 else ""
+    dollars, cents = divmod(abs(amount), money_scale)
+    if cents == 0:
+        return f"{sign}{dollars}"
+    return f"{sign}{dollars}.{cents:04d}".rstrip("0")
+
+def mul_rate(amount:int, rate:float, rounding:str="half_even")->int:
+    """
+    Multiplies money by a rate, like a tax rate. the result is rounded to a whole unit.
+
+    :rounding: "half_even", "up" or "down". taxes round up so they are never undercharged.
+    """
+    rounding = {"half_even": ROUND_HALF_EVEN, "up": ROUND_CEILING, "down": ROUND_FLOOR}[rounding]
+    return int((amount * Decimal(str(rate))).to_integral_value(rounding))
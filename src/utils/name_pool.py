@@ -0,0 +1,98 @@
+"""
+The pool of names cryptocurrencies can be given.
+
+Names are made of a prefix and a suffix from db/crypto_names.json. every combination of them is numbered,
+so a name is just an index from 0 to len(prefixes)*len(suffixes).
+"""
+from random import randrange
+from src.utils.json_utils import load_json
+
+class NamesExhausted(Exception):
+    """
+    Raised when every possible name is already used by a currency.
+    """
+
+class NamePool:
+    def __init__(self, path:str="src/db/crypto_names.json"):
+        """
+        Loads the prefixes and suffixes once and keeps track of which names are used.
+
+        the free indexes are kept in a list. to draw a name, we pick a random position in that list, swap it with the
+        last index and pop it. This draws uniformly from the names that are left in O(1), no matter how many names
+        are already taken. _positions keeps track of where every index is in the list so a name can be given back
+        in O(1) too.
+        """
+        names = load_json(path)
+        self.prefixes = list(dict.fromkeys(names["prefixes"])) # removes duplicates, keeps the order
+        self.suffixes = list(dict.fromkeys(names["suffixes"]))
+        self.size = len(self.prefixes) * len(self.suffixes)
+
+        self._indexes = {self.name(i): i for i in range(self.size)}
+        self._free = []
+        self._positions = []
+        self.used = set() # every name that is used. includes names that are not in the pool anymore
+        self.reset()
+
+    def __len__(self)->int:
+        # the number of names left
+        return len(self._free)
+
+    def name(self, index:int)->str:
+        """
+        Returns the name at the given index.
+        """
+        prefix, suffix = divmod(index, len(self.suffixes))
+        return self.prefixes[prefix] + "-" + self.suffixes[suffix]
+
+    def reset(self, used_names=()):
+        """
+        Frees every name, then marks :used_names: as used.
+        """
+        self._free = list(range(self.size))
+        self._positions = list(range(self.size))
+        self.used = set()
+        for name in used_names:
+            self.reserve(name)
+
+    def _take(self, index:int):
+        # swaps the index with the last free index and pops it
+        position = self._positions[index]
+        last = self._free[-1]
+        self._free[position] = last
+        self._positions[last] = position
+        self._free.pop()
+        self._positions[index] = -1
+
+    def allocate(self)->str:
+        """
+        Draws a random unused name and marks it as used.
+
+        raises NamesExhausted if there are no names left.
+        """
+        if not self._free:
+            raise NamesExhausted(f"All {self.size} names are in use.")
+
+        index = self._free[randrange(len(self._free))]
+        self._take(index)
+        name = self.name(index)
+        self.used.add(name)
+        return name
+
+    def reserve(self, name:str):
+        """
+        Marks a name as used. used for the names of currencies that already exist.
+        """
+        self.used.add(name)
+        index = self._indexes.get(name)
+        if index is not None and self._positions[index] != -1:
+            self._take(index)
+
+    def release(self, name:str):
+        """
+        Gives a name back to the pool. used when a currency is deleted.
+        """
+        self.used.discard(name)
+        index = self._indexes.get(name)
+        if index is not None and self._positions[index] == -1:
+            self._positions[index] = len(self._free)
+            self._free.append(index)
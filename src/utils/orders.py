@@ -0,0 +1,204 @@
+"""
+Orders.
+
+Instead of trading right away, a user can leave an order on a coin. it rests until the price of the coin crosses its
+trigger price, then it is made at the market price like any other trade. (see execute_orders() in trading.py)
+    limit buy:          buys once the price is at or below the limit
+    limit sell:         sells once the price is at or above the limit
+    stop(loss) sell:    sells once the price is at or below the stop
+    stop buy:           buys once the price is at or above the stop
+    take-profit sell:   sells once the price is at or above the target
+
+so every order waits for the price to either fall to its trigger or rise to it. each coin keeps a heap of each: the
+falling orders in a max heap(the highest trigger is crossed first) and the rising orders in a min heap. after a tick,
+only the tops of the heaps are looked at, so the cost depends on the orders that triggered, not on how many are
+resting. cancelled orders are left in the heaps and skipped when they come up. once most of a coin's heap entries are
+cancelled orders, its heaps are rebuilt.
+
+orders are part of the economy like timers(see timers.py): they are placed in a transaction, logged in the write ahead
+log and written to src/db/orders.json when the log is compacted, so they survive restarts. an order that did not
+trigger in max_days is cancelled by a timer. the timer goes away with the order when it is filled or closed first.
+"""
+import heapq
+import time
+from src.utils.json_utils import *
+from src.utils.wal import wal
+from src.utils.timers import timers
+
+max_days = 7 # an order expires after this many days
+max_orders = 25 # the most orders a user can have resting at once
+
+# (side, kind) -> the direction the price has to move in to trigger the order
+directions = {
+    ("buy", "limit"): "falling",
+    ("sell", "limit"): "rising",
+    ("sell", "stop"): "falling",
+    ("buy", "stop"): "rising",
+    ("sell", "take-profit"): "rising",
+}
+
+def expiry_key(order_id:int)->str:
+    # the key of the timer that expires the order
+    return f"order:{order_id}"
+
+class Order:
+    # slots keep every order small
+    __slots__ = ("id", "uid", "account", "coin", "side", "kind", "price", "shares", "placed")
+
+    def __init__(self, id:int, uid:int, account:str, coin:int, side:str, kind:str, price:float, shares:int, placed:int):
+        """
+        A resting order. :price: the trigger price in dollars. :placed: when it was placed, in unix seconds
+        """
+        self.id = id
+        self.uid = uid
+        self.account = account
+        self.coin = coin
+        self.side = side
+        self.kind = kind
+        self.price = price
+        self.shares = shares
+        self.placed = placed
+
+    @property
+    def direction(self)->str:
+        return directions[(self.side, self.kind)]
+
+    def to_list(self)->list:
+        return [self.id, self.uid, self.account, self.coin, self.side, self.kind, self.price, self.shares, self.placed]
+
+class OrderBook:
+    def __init__(self, path:str="src/db/orders.json"):
+        self.path = path
+        self.orders = {} # id -> Order, every resting order
+        self.by_user = {} # user id -> the ids of their orders
+        self.by_coin = {} # coin id -> the ids of the orders resting on it
+        self.falling = {} # coin id -> max heap of (-price, id)
+        self.rising = {} # coin id -> min heap of (price, id)
+        self.next_id = 1
+        self.notify = None # called with (order, reason) once an order is filled or closed
+
+    def __len__(self)->int:
+        return len(self.orders)
+
+    def get(self, order_id:int):
+        return self.orders.get(order_id)
+
+    def user_orders(self, uid:int)->list:
+        return [self.orders[order_id] for order_id in sorted(self.by_user.get(uid, ()))]
+
+    def coin_orders(self, coin_uid:int)->list:
+        return [self.orders[order_id] for order_id in sorted(self.by_coin.get(coin_uid, ()))]
+
+    def coins(self)->set:
+        # the coins with resting orders
+        return set(self.by_coin)
+
+    def _push(self, order:Order):
+        if order.direction == "falling":
+            heapq.heappush(self.falling.setdefault(order.coin, []), (-order.price, order.id))
+        else:
+            heapq.heappush(self.rising.setdefault(order.coin, []), (order.price, order.id))
+
+    def add(self, order:Order):
+        self.orders[order.id] = order
+        self.by_user.setdefault(order.uid, set()).add(order.id)
+        self.by_coin.setdefault(order.coin, set()).add(order.id)
+        self.next_id = max(self.next_id, order.id + 1)
+        self._push(order)
+
+    def remove(self, order_id:int):
+        """
+        Takes an order out of the book and cancels its expiry timer. its heap entry is skipped when it comes up.
+        Returns the order, or None.
+        """
+        order = self.orders.pop(order_id, None)
+        if order is None: return None
+        timers.cancel(expiry_key(order_id)) # logged with the order leaving the book, replaying it cancels it again
+
+        ids = self.by_user[order.uid]
+        ids.discard(order_id)
+        if not ids: del self.by_user[order.uid]
+
+        ids = self.by_coin[order.coin]
+        ids.discard(order_id)
+        live = len(ids)
+        if not ids: del self.by_coin[order.coin]
+        entries = len(self.falling.get(order.coin, ())) + len(self.rising.get(order.coin, ()))
+        if entries > 2 * live + 64: self._rebuild(order.coin) # mostly removed orders
+        return order
+
+    def _rebuild(self, coin_uid:int):
+        self.falling.pop(coin_uid, None)
+        self.rising.pop(coin_uid, None)
+        for order in self.coin_orders(coin_uid):
+            self._push(order)
+
+    def triggered(self, coin_uid:int, price:float)->list:
+        """
+        Pops the orders on the coin that :price: triggers. they stay in the book until they are filled or closed.
+        """
+        orders = []
+        falling = self.falling.get(coin_uid)
+        while falling and -falling[0][0] >= price: # the price fell to their trigger
+            order = self.orders.get(heapq.heappop(falling)[1])
+            if order is not None: orders.append(order)
+        rising = self.rising.get(coin_uid)
+        while rising and rising[0][0] <= price: # the price rose to their trigger
+            order = self.orders.get(heapq.heappop(rising)[1])
+            if order is not None: orders.append(order)
+        return orders
+
+    def requeue(self, order:Order):
+        # puts back an order that triggered but could not be made
+        if self.orders.get(order.id) is order: self._push(order)
+
+    def place_record(self, uid:int, account:str, coin_uid:int, side:str, kind:str, price:float, shares:int)->dict:
+        """
+        The record of a new order, for Transaction.add_record(). raises ValueError if the side and kind do not go
+        together.
+        """
+        if (side, kind) not in directions:
+            raise ValueError(f"there is no {kind} {side} order")
+        order = Order(self.next_id, uid, account, coin_uid, side, kind, price, shares, int(time.time()))
+        self.next_id += 1
+        return {"op": "order", "order": order.to_list()}
+
+    @staticmethod
+    def done_record(order_id:int, reason:str)->dict:
+        # the record of an order leaving the book. :reason: "filled", "cancelled", "expired" or why its trade was refused
+        return {"op": "order_done", "id": order_id, "reason": reason}
+
+    def close(self, order_id:int, reason:str):
+        """
+        Takes an order out of the book outside of a transaction and logs it.
+        """
+        if order_id not in self.orders: return None
+        record = self.done_record(order_id, reason)
+        wal.append(record)
+        return self.remove(order_id)
+
+    def apply_record(self, record:dict):
+        """
+        Applies a record from the write ahead log.
+        """
+        if record["op"] == "order":
+            self.add(Order(*record["order"]))
+        elif record["op"] == "order_done":
+            self.remove(record["id"])
+
+    def load(self):
+        try:
+            data = load_json(self.path)
+        except (OSError, ValueError):
+            return
+        for order in data["orders"]:
+            self.add(Order(*order))
+        self.next_id = max(self.next_id, data["next_id"])
+
+    def to_dict(self)->dict:
+        return {"next_id": self.next_id, "orders": [order.to_list() for order in self.orders.values()]}
+
+    def save(self):
+        write_json_atomic(self.path, self.to_dict())
+
+order_book = OrderBook()
@@ -0,0 +1,243 @@
+"""
+The outbox.
+
+Every dm the bot sends(a transfer's message, a filled order, price alerts, the owner's notices) goes through the
+outbox instead of being sent where it happens:
+    outbox.send(uid, embed=em) # returns right away
+
+a command never waits for discord to deliver a dm. one task sends everything in the background:
+    the dm channel of every user is cached, so a user is only looked up(fetch_user) the first time they get a dm
+    the messages waiting for the same user are sent together as one message. their embeds are merged into one
+    it stays under discord's rate limits with token buckets: one for every request the bot makes(discord allows 50
+    a second), and one for every dm channel(5 messages every 5 seconds)
+    a user whose dm channel used up its messages waits for their turn without holding up the others
+    a dm that failed because of discord(a 5xx, a 429, the connection) is tried again later, waiting longer every time.
+    a user that does not take dms is skipped
+
+dms are notifications, nothing is lost if one is not delivered: the ones still waiting when the bot stops are dropped.
+"""
+import asyncio
+import collections
+import logging
+import time
+import discord
+from src.utils.log import logEvent, logMsg
+
+global_rate = 40 # requests a second. discord's global limit is 50
+channel_rate, channel_burst = 1, 5 # messages a second and at once, per dm channel. discord allows 5 every 5 seconds
+max_attempts = 5
+retry_delay = 2 # seconds before the first retry. doubled every time
+max_channels = 10_000 # dm channels kept in the cache
+max_content = 2000 # characters in a message
+max_fields = 25 # the most fields an embed can have
+max_embed = 5000 # characters in a merged embed. discord allows 6000 in all
+
+class TokenBucket:
+    def __init__(self, rate:float, capacity:int):
+        """
+        Allows :rate: requests a second on average, and up to :capacity: at once.
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    @property
+    def full(self)->bool:
+        self._refill()
+        return self.tokens >= self.capacity
+
+    def try_acquire(self)->float:
+        # takes a token if there is one. Returns 0 if it did, or the seconds until there is one
+        self._refill()
+        if self.tokens < 1: return (1 - self.tokens) / self.rate
+        self.tokens -= 1
+        return 0
+
+    async def acquire(self):
+        # waits for a token and takes it
+        while True:
+            wait = self.try_acquire()
+            if not wait: return
+            await asyncio.sleep(wait)
+
+class Delivery:
+    __slots__ = ("messages", "attempts", "not_before")
+
+    def __init__(self):
+        """
+        The messages waiting for a user.
+        """
+        self.messages = [] # (content, embed)
+        self.attempts = 0 # the failed attempts so far
+        self.not_before = 0.0 # monotonic time it can be tried again at
+
+def summary(embed:discord.Embed)->tuple:
+    # an embed as the name and value of one field
+    lines = [embed.description] if embed.description else []
+    lines += [f"**{field.name}** {field.value}" for field in embed.fields]
+    return str(embed.title or "Notification")[:256], "\n".join(lines)[:1024] or "-"
+
+def compose(messages:list)->tuple:
+    """
+    Merges messages into one. Returns (content, embed, the messages that did not fit)
+
+    the first message always fits. the others are added in order until one does not.
+    """
+    contents, embeds, fields, rest = [], [], [], []
+    length = size = 0 # characters in the content and in the merged embed
+    for content, embed in messages:
+        field = summary(embed) if embed is not None else None
+        fits = ((not content or length + len(content) < max_content) and
+                (field is None or (len(fields) < max_fields and size + len(field[0]) + len(field[1]) < max_embed)))
+        if rest or (not fits and (contents or embeds)):
+            rest.append((content, embed))
+            continue
+        if content:
+            contents.append(content)
+            length += len(content) + 1
+        if embed is not None:
+            embeds.append(embed)
+            fields.append(field)
+            size += len(field[0]) + len(field[1])
+
+    if len(embeds) > 1: # every embed becomes a field of one embed
+        embed = discord.Embed(title="Notifications", colour=embeds[0].colour)
+        for name, value in fields:
+            embed.add_field(name=name, value=value, inline=False)
+        embeds = [embed]
+    return "\n".join(contents)[:2000] or None, embeds[0] if embeds else None, rest
+
+class Outbox:
+    def __init__(self):
+        self.bot = None
+        self.pending = collections.OrderedDict() # user id -> Delivery, the oldest first
+        self.channels = collections.OrderedDict() # user id -> their dm channel, the most recently used last
+        self.requests = TokenBucket(global_rate, global_rate)
+        self.routes = {} # dm channel id -> TokenBucket
+        self.sent = 0
+        self.merged = 0 # messages that went out as part of another
+        self.retried = 0
+        self.dropped = 0
+        self._wakeup = asyncio.Event()
+        self._stopped = asyncio.Event()
+        self._task = None
+
+    def send(self, uid:int, content:str=None, embed:discord.Embed=None):
+        """
+        Queues a dm to a user. it is sent in the background, with any other dms waiting for them.
+        """
+        self.pending.setdefault(uid, Delivery()).messages.append((content, embed))
+        self._wakeup.set()
+
+    def start(self, bot):
+        self.bot = bot
+        self._task = asyncio.get_event_loop().create_task(self._run())
+
+    async def stop(self):
+        """
+        Stops sending. waits for the dm being sent, the others are dropped.
+        """
+        self._stopped.set()
+        self._wakeup.set()
+        if self._task is not None: await self._task
+        waiting = sum(len(delivery.messages) for delivery in self.pending.values())
+        if waiting: logMsg(f"Dropped {waiting} dms that were not sent yet")
+
+    def _next(self):
+        # the first user whose dms can be sent now, or how long until one can
+        now = time.monotonic()
+        for uid, delivery in self.pending.items():
+            if delivery.not_before <= now: return uid, 0
+        return None, min((delivery.not_before - now for delivery in self.pending.values()), default=None)
+
+    async def _run(self):
+        while not self._stopped.is_set():
+            uid, wait = self._next()
+            if uid is None:
+                self._wakeup.clear()
+                try: # until a dm is queued or a retry is due
+                    await asyncio.wait_for(self._wakeup.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self._deliver(uid, self.pending.pop(uid))
+
+    async def _deliver(self, uid:int, delivery:Delivery):
+        started = time.perf_counter()
+        content, embed, rest = compose(delivery.messages)
+        try:
+            channel = await self._channel(uid)
+            route = self.routes.get(channel.id)
+            if route is None:
+                route = self.routes[channel.id] = TokenBucket(channel_rate, channel_burst)
+            wait = route.try_acquire()
+            if wait: # the others are sent in the meantime
+                delivery.not_before = time.monotonic() + wait
+                self._requeue(uid, delivery, delivery.messages)
+                return
+            await self.requests.acquire()
+            await channel.send(content, embed=embed)
+        except (discord.Forbidden, discord.NotFound) as error: # does not take dms, or does not exist
+            self.dropped += len(delivery.messages)
+            logMsg(f"Could not dm user {uid}: {error}")
+            return
+        except (discord.HTTPException, OSError, asyncio.TimeoutError) as error: # discord or the connection. tried again
+            delivery.attempts += 1
+            if delivery.attempts >= max_attempts:
+                self.dropped += len(delivery.messages)
+                logMsg(f"Gave up on dming user {uid} after {delivery.attempts} attempts: {error}")
+                return
+            self.retried += 1
+            delivery.not_before = time.monotonic() + retry_delay * 2 ** (delivery.attempts - 1)
+            self._requeue(uid, delivery, delivery.messages)
+            return
+        except Exception as error:
+            self.dropped += len(delivery.messages)
+            logMsg(f"Could not dm user {uid}: {type(error).__name__}: {error}")
+            return
+
+        sent = len(delivery.messages) - len(rest)
+        self.sent += 1
+        self.merged += sent - 1
+        if rest: self._requeue(uid, Delivery(), rest)
+        if len(self.routes) > max_channels: # the buckets that are full are the same as new ones
+            self.routes = {channel_id: bucket for channel_id, bucket in self.routes.items() if not bucket.full}
+        logEvent("dm_sent", level=logging.DEBUG, user=uid, messages=sent, waiting=len(self.pending),
+                 ms=(time.perf_counter() - started) * 1000)
+
+    def _requeue(self, uid:int, delivery:Delivery, messages:list):
+        # puts messages back in front of the ones queued for the user while they were being sent
+        queued = self.pending.pop(uid, None)
+        delivery.messages = messages + (queued.messages if queued is not None else [])
+        self.pending[uid] = delivery
+        self._wakeup.set()
+
+    async def _channel(self, uid:int):
+        """
+        Returns the user's dm channel. only asks discord the first time.
+        """
+        channel = self.channels.get(uid)
+        if channel is not None:
+            self.channels.move_to_end(uid)
+            return channel
+
+        user = self.bot.get_user(uid)
+        if user is None: # not in the cache of the gateway(the backend has none)
+            await self.requests.acquire()
+            user = await self.bot.fetch_user(uid)
+        channel = user.dm_channel
+        if channel is None:
+            await self.requests.acquire()
+            channel = await user.create_dm()
+
+        self.channels[uid] = channel
+        if len(self.channels) > max_channels: self.channels.popitem(last=False)
+        return channel
+
+outbox = Outbox()
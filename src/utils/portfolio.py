@@ -0,0 +1,58 @@
+"""
+Portfolio valuation.
+
+Values a user's holdings at the prices of the current market snapshot(see src/utils/market.py) in one pass over their
+accounts. valuations are cached per user and are reused until the user is saved again(their version changes) or a new
+snapshot is published(a tick or a trade).
+"""
+from collections import OrderedDict
+from typing import NamedTuple
+from src.utils.market import market
+from src.utils.money import money_scale
+
+class Holding(NamedTuple):
+    coin: int # the coin id
+    name: str # None if the coin crashed
+    shares: int
+    value: int # money units
+
+class Valuation(NamedTuple):
+    accounts: dict # account name -> [Holding, ...]
+    account_totals: dict # account name -> the value of its holdings, in money units
+    total: int # the value of every holding, in money units
+
+class Portfolio:
+    def __init__(self, size:int=1024):
+        """
+        Keeps the valuations of the last :size: users that were valued.
+        """
+        self.size = size
+        self._cache = OrderedDict() # user id -> (user version, snapshot version, Valuation)
+
+    def value(self, user)->Valuation:
+        """
+        Returns the valuation of a user's holdings. coins that crashed are worth nothing.
+        """
+        snapshot = market.snapshot
+        cached = self._cache.get(user.uid)
+        if cached is not None and cached[0] == user.version and cached[1] == snapshot.version:
+            self._cache.move_to_end(user.uid)
+            return cached[2]
+
+        accounts, account_totals = {}, {}
+        for name, account in user.accounts.items():
+            holdings = []
+            for coin_uid, shares in account.holdings.items():
+                coin = snapshot.coins.get(coin_uid)
+                holdings.append(Holding(coin_uid, None if coin is None else coin.name, shares,
+                                        round(shares * snapshot.price(coin_uid) * money_scale)))
+            accounts[name] = holdings
+            account_totals[name] = sum(holding.value for holding in holdings)
+        valuation = Valuation(accounts, account_totals, sum(account_totals.values()))
+
+        self._cache[user.uid] = (user.version, snapshot.version, valuation)
+        self._cache.move_to_end(user.uid)
+        if len(self._cache) > self.size: self._cache.popitem(last=False) # the least recently valued user
+        return valuation
+
+portfolio = Portfolio()
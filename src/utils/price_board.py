@@ -0,0 +1,151 @@
+"""
+The price board.
+
+The market engine publishes the price of every coin into a block of shared memory, so any process on the same machine
+(a shard, a dashboard, a script) can read the current prices straight out of it. no request to the engine and no
+loading of crypto_currencies.json:
+    board = PriceBoard.attach()
+    row = board.price(coin_uid) # PriceRow(value, market_cap, total_shares, tick) or None
+
+the block is a header followed by one row per coin:
+    header: seq(u64) tick(u64) count(u32) capacity(u32)
+    row:    uid(i64) value(f64) market_cap(f64) total_shares(i64) tick(i64)
+
+there is only one writer(the engine) and it is protected by a seqlock. the writer makes seq odd, writes the rows and
+makes it even again. a reader reads seq, the rows, then seq again. if seq was odd or changed in between, the writer
+was in the middle of a write and the reader tries again. readers never block the writer and never take a lock.
+
+to print the board from the command line:
+    python -m src.utils.price_board [name]
+"""
+import atexit
+import struct
+import sys
+import time
+from multiprocessing import shared_memory, resource_tracker
+from typing import NamedTuple
+
+default_name = "kryptonite-prices"
+header = struct.Struct("<QQII")
+row_format = struct.Struct("<qddqq")
+
+class PriceRow(NamedTuple):
+    value: float
+    market_cap: float
+    total_shares: int
+    tick: int # the tick the row was last written in
+
+class TornRead(Exception):
+    """
+    Raised when a reader kept catching the writer in the middle of a write.
+    """
+
+class PriceBoard:
+    def __init__(self, memory:shared_memory.SharedMemory, owner:bool):
+        """
+        Use PriceBoard.create() in the engine and PriceBoard.attach() everywhere else.
+        """
+        self.memory = memory
+        self.owner = owner
+        self.capacity = header.unpack_from(memory.buf, 0)[3]
+        self._seq = 0
+
+    @classmethod
+    def create(cls, name:str=default_name, capacity:int=64):
+        """
+        Creates the board. a board left behind by an engine that crashed is replaced.
+        """
+        size = header.size + capacity * row_format.size
+        try:
+            memory = shared_memory.SharedMemory(name, create=True, size=size)
+        except FileExistsError:
+            stale = shared_memory.SharedMemory(name)
+            stale.close()
+            stale.unlink()
+            memory = shared_memory.SharedMemory(name, create=True, size=size)
+
+        # the board is removed by close(). every process opening it registers it with the resource tracker and
+        # unregisters it right away, so it does not matter if they share a tracker
+        resource_tracker.unregister(memory._name, "shared_memory")
+        header.pack_into(memory.buf, 0, 0, 0, 0, capacity)
+        board = cls(memory, owner=True)
+        atexit.register(board.close)
+        return board
+
+    @classmethod
+    def attach(cls, name:str=default_name):
+        """
+        Opens the engine's board for reading. raises FileNotFoundError if the engine is not running.
+        """
+        memory = shared_memory.SharedMemory(name)
+        # the resource tracker would remove the board when this process exits, even though the engine still uses it
+        resource_tracker.unregister(memory._name, "shared_memory")
+        return cls(memory, owner=False)
+
+    def publish(self, rows, tick:int):
+        """
+        Writes a new board. :rows: [(uid, value, market_cap, total_shares), ...]
+
+        rows past the capacity are left out.
+        """
+        buf = self.memory.buf
+        rows = list(rows)[:self.capacity]
+
+        self._seq += 1 # odd: readers retry until the write is done
+        struct.pack_into("<Q", buf, 0, self._seq)
+        offset = header.size
+        for uid, value, market_cap, total_shares in rows:
+            row_format.pack_into(buf, offset, uid, value, market_cap, total_shares, tick)
+            offset += row_format.size
+        self._seq += 1
+        header.pack_into(buf, 0, self._seq, tick, len(rows), self.capacity)
+
+    def _read(self, read_rows):
+        buf = self.memory.buf
+        for _ in range(1000):
+            seq = struct.unpack_from("<Q", buf, 0)[0]
+            if seq % 2: # a write is in progress. gives the writer a moment to finish it
+                time.sleep(0)
+                continue
+
+            _, tick, count, _ = header.unpack_from(buf, 0)
+            result = read_rows(buf, count)
+            if struct.unpack_from("<Q", buf, 0)[0] == seq: # nothing was written while reading
+                return tick, result
+        raise TornRead("the price board is being written too often to read")
+
+    def read(self)->tuple:
+        """
+        Returns (tick, {coin id: PriceRow}) for every coin on the board.
+        """
+        def read_rows(buf, count):
+            return {uid: PriceRow(value, market_cap, total_shares, tick) for uid, value, market_cap, total_shares, tick
+                    in row_format.iter_unpack(buf[header.size:header.size + count * row_format.size])}
+        return self._read(read_rows)
+
+    def price(self, uid:int):
+        """
+        Returns the PriceRow of one coin, or None if it is not on the board.
+        """
+        def read_rows(buf, count):
+            for index in range(count): # there are only a few coins, so they are just scanned
+                row = row_format.unpack_from(buf, header.size + index * row_format.size)
+                if row[0] == uid: return PriceRow(*row[1:])
+            return None
+        return self._read(read_rows)[1]
+
+    def close(self):
+        if self.memory is None: return
+        memory, self.memory = self.memory, None
+        memory.close()
+        if self.owner:
+            resource_tracker.register(memory._name, "shared_memory") # unlink() unregisters it again
+            memory.unlink()
+
+if __name__ == '__main__':
+    board = PriceBoard.attach(sys.argv[1] if len(sys.argv) > 1 else default_name)
+    tick, rows = board.read()
+    print(f"tick {tick}")
+    for uid, row in rows.items():
+        print(f"{uid}: ${round(row.value, 4)}  market cap: ${round(row.market_cap, 4)}  shares: {row.total_shares}")
+    board.close()
@@ -0,0 +1,209 @@
+"""
+Profiling utilities.
+
+Lets the owner profile the bot while it is running instead of restarting it under a profiler.
+there are 2 tools in here:
+    SamplingProfiler: a cpu profiler that samples the event loop's stack from a background thread
+    MemoryTracker: takes tracemalloc snapshots and diffs them to find what is allocating the most memory
+"""
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+
+class SamplingProfiler:
+    def __init__(self, interval:float=0.005, thread_id:int=None):
+        """
+        Initializes the sampling profiler.
+
+        Every :interval: seconds, a background thread looks at the current stack of the thread we are profiling.
+        (by default, the thread that created the profiler. this is the event loop's thread)
+        the function on top of the stack gets a "self" sample and every function in the stack gets a "total" sample.
+        the more samples a function has, the more time was spent in it.
+
+        Sampling is cheap since we never hook into every function call like cProfile does, so it is safe to leave
+        running on live traffic.
+        """
+        self.interval = interval
+        self.thread_id = thread_id if thread_id is not None else threading.get_ident()
+        self.self_samples = Counter()
+        self.total_samples = Counter()
+        self.num_samples = 0
+        self.started = 0.0
+        self.elapsed = 0.0
+        self._running = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self)->bool:
+        return self._running.is_set()
+
+    def start(self):
+        """
+        Starts sampling in a daemon thread.
+        """
+        if self.running: return
+
+        self.self_samples.clear()
+        self.total_samples.clear()
+        self.num_samples = 0
+        self.started = time.perf_counter()
+
+        self._running.set()
+        self._thread = threading.Thread(target=self._sample_loop, name="kryptonite-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stops sampling and waits for the sampling thread to finish.
+        """
+        if not self.running: return
+
+        self._running.clear()
+        self._thread.join()
+        self._thread = None
+        self.elapsed = time.perf_counter() - self.started
+
+    def _sample_loop(self):
+        # runs in the profiler thread. only reads frames, never modifies them
+        while self._running.is_set():
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self._record(frame)
+            time.sleep(self.interval)
+
+    def _record(self, frame):
+        """
+        Records a single stack sample.
+
+        a recursive function would show up multiple times in one stack, so the total samples use a set so that each
+        function is only counted once per sample.
+        """
+        self.num_samples += 1
+        self.self_samples[self._key(frame.f_code)] += 1
+
+        seen = set()
+        while frame is not None:
+            key = self._key(frame.f_code)
+            if key not in seen:
+                seen.add(key)
+                self.total_samples[key] += 1
+            frame = frame.f_back
+
+    @staticmethod
+    def _key(code)->tuple:
+        return code.co_filename, code.co_firstlineno, code.co_name
+
+    def top(self, limit:int=15, by:str="self")->list:
+        """
+        Returns the top :limit: functions as a list of (function, self samples, total samples).
+
+        :by: either "self" or "total". self is where the time was actually spent, total includes callees.
+        """
+        samples = self.self_samples if by == "self" else self.total_samples
+        return [(key, self.self_samples[key], self.total_samples[key]) for key, _ in samples.most_common(limit)]
+
+    def report(self, limit:int=15, by:str="self")->str:
+        """
+        Formats the top functions into a table.
+        """
+        if self.num_samples == 0:
+            return "No samples were taken."
+
+        lines = [f"{self.num_samples} samples over {round(self.elapsed, 2)}s (sorted by {by})",
+                 f"{'self%':>6} {'total%':>7}  function"]
+        for (filename, lineno, name), self_count, total_count in self.top(limit, by):
+            lines.append(f"{100*self_count/self.num_samples:6.1f} {100*total_count/self.num_samples:7.1f}  "
+                         f"{name} ({short_path(filename)}:{lineno})")
+        return "\n".join(lines)
+
+class MemoryTracker:
+    def __init__(self, frames:int=5):
+        """
+        Initializes the memory tracker.
+
+        tracemalloc slows down every allocation while it is tracing, so it is only started when asked to.
+        we keep the previous snapshot so every new snapshot can be compared to it. this shows what grew in between,
+        such as the cached currency histories, user dicts or embeds.
+        """
+        self.frames = frames
+        self.previous = None
+
+    @property
+    def tracing(self)->bool:
+        return tracemalloc.is_tracing()
+
+    def start(self):
+        """
+        Starts tracing allocations and takes the first snapshot.
+        """
+        if not self.tracing:
+            tracemalloc.start(self.frames)
+        self.previous = self.take_snapshot()
+
+    def stop(self):
+        """
+        Stops tracing and frees all the memory tracemalloc used.
+        """
+        if self.tracing:
+            tracemalloc.stop()
+        self.previous = None
+
+    @staticmethod
+    def take_snapshot():
+        # ignores tracemalloc's own allocations and the import system
+        return tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+        ))
+
+    def diff(self, limit:int=15, group_by:str="lineno")->str:
+        """
+        Takes a new snapshot and compares it to the previous one.
+
+        Returns a table of the biggest allocators, sorted by how much they grew since the last snapshot.
+        the new snapshot then becomes the one we compare against next time.
+        """
+        if not self.tracing:
+            return "Memory tracing is not running. use '>mem start' first."
+
+        snapshot = self.take_snapshot()
+        if self.previous is None: # tracing was started without '>mem start'(PYTHONTRACEMALLOC), nothing to compare to
+            self.previous = snapshot
+            return "First snapshot taken. use '>mem snap' again to compare against it."
+        stats = snapshot.compare_to(self.previous, group_by)
+        self.previous = snapshot
+
+        current, peak = tracemalloc.get_traced_memory()
+        lines = [f"traced: {format_bytes(current)}  |  peak: {format_bytes(peak)}",
+                 f"{'size':>10} {'diff':>10} {'count':>8}  location"]
+        for stat in stats[:limit]:
+            frame = stat.traceback[0]
+            lines.append(f"{format_bytes(stat.size):>10} {format_bytes(stat.size_diff, signed=True):>10} "
+                         f"{stat.count:>8}  {short_path(frame.filename)}:{frame.lineno}")
+        return "\n".join(lines)
+
+def short_path(filename:str)->str:
+    """
+    Shortens a file path so that tables fit into a discord message.
+
+    paths in the project are shown from src/, everything else(libraries) only shows the file name.
+    """
+    filename = filename.replace("\\", "/")
+    if "/src/" in filename:
+        return "src/" + filename.rsplit("/src/", 1)[1]
+    return filename.rsplit("/", 1)[-1]
+
+def format_bytes(size:int, signed:bool=False)->str:
+    """
+    Formats a number of bytes to be human readable. Example: 2048 -> 2.0KiB
+    """
+    sign = ("+" if size >= 0 else "-") if signed else ("" if size >= 0 else "-")
+    size = abs(size)
+    for unit in ("B", "KiB", "MiB"):
+        if size < 1024:
+            return f"{sign}{round(size, 1)}{unit}"
+        size /= 1024
+    return f"{sign}{round(size, 1)}GiB"
@@ -0,0 +1,252 @@
+"""
+Rebuilds past states of the economy.
+
+Every few hours a snapshot of the whole economy(every currency and every user) is written to src/db/snapshots/. to
+rebuild the economy at any time, the newest snapshot from before that time is loaded and the event log is replayed
+on top of it. (see src/utils/events.py)
+
+nothing here touches the live cache or the user files, so it is safe to run while the bot is running.
+to replay from the command line:
+    python -m src.utils.replay "2022-06-01 12:00:00"
+"""
+import datetime
+import gzip
+import json
+import os
+import sys
+import time
+from random import Random
+from src.utils.json_utils import *
+from src.utils.crypto_currency import CryptoCurrency, crypto_cache, coin_index
+from src.utils.users import User, load_all_users
+from src.utils.ledger import ledger
+from src.utils.events import *
+from src.utils.money import to_money, fmt_money
+from src.utils.wal import wal
+from src.constants import config
+from src.utils.log import logEvent, logMsg
+from src.utils.scheduler import scheduler
+
+snapshot_dir = "src/db/snapshots"
+snapshot_interval = datetime.timedelta(hours=6)
+snapshots_kept = 28 # a week of snapshots
+
+def snapshot_files()->list:
+    # every snapshot, oldest first. the names start with the time they were taken, so sorting them sorts them by time
+    try:
+        names = sorted(name for name in os.listdir(snapshot_dir) if name.endswith(".json.gz"))
+    except FileNotFoundError:
+        return []
+    return [os.path.join(snapshot_dir, name) for name in names]
+
+def snapshot_time(path:str)->str:
+    # "2022-06-01_12-00-00_1042.json.gz" -> "2022-06-01 12:00:00"
+    date, clock = os.path.basename(path).split("_")[:2]
+    return f"{date} {clock.replace('-', ':')}"
+
+def take_snapshot()->str:
+    """
+    Writes a snapshot of every currency and every user. Returns its path.
+
+    the snapshot holds everything up to the last event recorded so far. nothing is awaited in here, so no event can be
+    recorded while it is taken.
+    """
+    event_log.flush()
+    now = datetime.datetime.now().replace(microsecond=0)
+    seq = event_log.last_seq()
+
+    users = load_all_users()
+
+    snapshot = {
+        "seq": seq,
+        "time": str(now),
+        "next_uid": coin_index.next_uid,
+        "coins": [coin.obj_to_dict() for coin in crypto_cache.values()],
+        "users": {str(uid): user for uid, user in users.items()},
+        "ledger": dict(ledger.balances),
+    }
+
+    os.makedirs(snapshot_dir, exist_ok=True)
+    path = os.path.join(snapshot_dir, f"{now:%Y-%m-%d_%H-%M-%S}_{seq}.json.gz")
+    with gzip.open(path + ".tmp", "wt") as file:
+        json.dump(snapshot, file, separators=(",", ":"))
+    os.replace(path + ".tmp", path)
+
+    for old in snapshot_files()[:-snapshots_kept]: # removes the oldest snapshots
+        os.remove(old)
+
+    # the full audit. every user's money and the system accounts have to add up to 0. see src/utils/ledger.py
+    imbalance = sum(User.from_dict(user).total_money for user in users.values()) + ledger.total()
+    if imbalance:
+        logMsg(f"The ledger is off by {fmt_money(imbalance)} dollars. money was created or destroyed without an entry")
+    return path
+
+@scheduler.job(every=60, phase="storage")
+async def snapshot_economy(): # takes a snapshot every 6 hours
+    if not wal.replayed: return # the cache is not loaded yet
+
+    files = snapshot_files()
+    if files and datetime.datetime.now() - datetime.datetime.fromisoformat(snapshot_time(files[-1])) < snapshot_interval:
+        return
+
+    started = time.perf_counter()
+    path = take_snapshot()
+    logEvent("snapshot", path=path, ms=(time.perf_counter() - started) * 1000)
+
+class Replayer:
+    def __init__(self, snapshot:dict):
+        """
+        An economy rebuilt from a snapshot. call replay() to apply the events that came after it.
+
+        the currencies and users are plain objects kept in self.coins and self.users, not in the live cache.
+        """
+        self.seq = snapshot["seq"]
+        self.time = snapshot["time"]
+        self.coins = {coin["uid"]: CryptoCurrency(coin) for coin in snapshot["coins"]}
+        self.users = {int(uid): User.from_dict(user) for uid, user in snapshot["users"].items()}
+        self.missing = 0 # events about users that are not in the snapshot
+
+        self._handlers = {
+            Tick: self.tick,
+            Trade: self.trade,
+            Transfer: self.transfer,
+            BankTransfer: self.bank_transfer,
+            Daily: self.add_to_wallet,
+            Beg: self.add_to_wallet,
+            CoinFlip: self.coin_flip,
+            Lower: self.lower,
+            AddShares: self.add_shares,
+            CoinCreated: self.coin_created,
+            CoinDeleted: self.coin_deleted,
+            UserCreated: self.user_created,
+        }
+
+    @classmethod
+    def load(cls, path:str):
+        with gzip.open(path, "rt") as file:
+            return cls(json.load(file))
+
+    @classmethod
+    def from_snapshot(cls, until:str=None):
+        """
+        Loads the newest snapshot taken at or before :until:.("2022-06-01 12:00:00") loads the newest one if None.
+
+        raises a ValueError if there is no such snapshot.
+        """
+        files = [path for path in snapshot_files() if until is None or snapshot_time(path) <= until]
+        if not files:
+            raise ValueError(f"There is no snapshot from before {until}")
+        return cls.load(files[-1])
+
+    def replay(self, until:str=None)->int:
+        """
+        Applies every event after the snapshot, up to and including :until:. Returns the number of events applied.
+        """
+        applied = 0
+        for seq, event_time, event in event_log.read(after_seq=self.seq, since=self.time):
+            if until is not None and event_time > until: break
+            self._handlers[type(event)](event)
+            self.seq, self.time = seq, event_time
+            applied += 1
+        return applied
+
+    def user(self, uid:int):
+        user = self.users.get(uid)
+        if user is None: self.missing += 1
+        return user
+
+    @staticmethod
+    def cap(user:User):
+        # the same caps that are applied when a user is saved. see User.obj_to_dict()
+        max_balance = to_money(config.current.max_balance)
+        user.wallet = min(user.wallet, max_balance)
+        for account in user.accounts.values():
+            account.balance = min(account.balance, max_balance)
+
+    def tick(self, event:Tick):
+        now = datetime.datetime.fromisoformat(event.now)
+        for uid, seed in event.seeds:
+            coin = self.coins.get(uid)
+            if coin is not None:
+                coin.step(Random(seed), now)
+
+    def trade(self, event:Trade):
+        coin = self.coins.get(event.coin)
+        if coin is not None: coin.value = event.value
+
+        user = self.user(event.user)
+        if user is None: return
+        if event.side == "buy":
+            user.modify_account(event.account, -event.total)
+            user.increase_holding(event.account, event.coin, event.shares)
+        else:
+            user.cap_balance(event.account, event.subtotal)
+            user.decrease_holding(event.account, event.coin, event.shares)
+        self.cap(user)
+
+    def transfer(self, event:Transfer):
+        sender, recipient = self.user(event.sender), self.user(event.recipient)
+        if sender is not None: sender.wallet -= event.amount
+        if recipient is not None:
+            recipient.wallet += event.amount
+            self.cap(recipient)
+
+    def bank_transfer(self, event:BankTransfer):
+        user = self.user(event.user)
+        if user is None: return
+        user.wallet -= event.amount
+        user.accounts[event.account].balance += event.amount
+        self.cap(user)
+
+    def add_to_wallet(self, event):
+        # daily and beg
+        user = self.user(event.user)
+        if user is None: return
+        user.wallet += event.amount
+        self.cap(user)
+
+    def coin_flip(self, event:CoinFlip):
+        user = self.user(event.user)
+        if user is None: return
+        user.wallet += event.amount if event.won else -event.amount
+        self.cap(user)
+
+    def lower(self, event:Lower):
+        user = self.user(event.user)
+        if user is None: return
+        user.wallet += event.change if event.won else -event.change
+        self.cap(user)
+
+    def add_shares(self, event:AddShares):
+        for uid, diff in event.diffs:
+            coin = self.coins.get(uid)
+            if coin is not None: coin.total_shares += diff
+
+    def coin_created(self, event:CoinCreated):
+        coin = CryptoCurrency(event.coin)
+        self.coins[coin.uid] = coin
+
+    def coin_deleted(self, event:CoinDeleted):
+        self.coins.pop(event.coin, None)
+        for user in self.users.values(): # the holdings are worthless. (see User.verify_holdings())
+            for account in user.accounts.values():
+                account.holdings.pop(event.coin, None)
+
+    def user_created(self, event:UserCreated):
+        self.users[event.user] = User.new(event.user, event.wallet)
+
+if __name__ == '__main__':
+    until = sys.argv[1] if len(sys.argv) > 1 else None
+
+    started = time.perf_counter()
+    replayer = Replayer.from_snapshot(until)
+    snapshot = replayer.time
+    applied = replayer.replay(until)
+
+    print(f"replayed {applied} events from the snapshot at {snapshot} up to {replayer.time} "
+          f"in {time.perf_counter() - started:.2f}s")
+    for coin in replayer.coins.values():
+        print(f"{coin.name}: ${round(coin.value, 4)}  shares: {coin.total_shares}")
+    money = sum(user.total_money for user in replayer.users.values())
+    print(f"{len(replayer.users)} users holding ${fmt_money(money)}")
+    if replayer.missing: print(f"{replayer.missing} events were about users missing from the snapshot")
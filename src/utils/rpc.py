@@ -0,0 +1,156 @@
+"""
+Requests between the bot's processes.
+
+The market engine(see engine.py) and the economy backend(see shards.py) answer requests over unix domain sockets. a
+request and its response are each a line of json:
+    {"id": 1, "method": "quote", "params": {"coin": 3, "side": "buy", "shares": 50}}
+    {"id": 1, "result": {...}} or {"id": 1, "error": "..."}
+
+a client keeps one connection open and can have many requests waiting on it at once. responses are matched to their
+requests by id. if the connection is lost, every waiting request fails and the next one connects again.
+
+a request that failed might still have been carried out by the other process: it timed out, or the connection was
+lost after it was sent. if it was one that changes something there, the connection is dropped, so the next request
+connects again and on_connect can set the other process straight before anything else is sent.
+"""
+import asyncio
+import json
+import os
+from src.utils.log import logMsg
+
+stream_limit = 2**24 # the longest line that can be read. snapshots of the whole market are sent in one line
+
+class RpcError(Exception):
+    """
+    Raised when the other process cannot be reached or the request failed in it.
+    """
+
+def encode(message:dict)->bytes:
+    return json.dumps(message, separators=(",", ":")).encode() + b"\n"
+
+class RpcClient:
+    def __init__(self, path:str, name:str, error=RpcError, on_connect=None, timeout:float=10, changes=()):
+        """
+        A connection to the process listening at :path:. :name: is only used in messages.
+
+        :error: the exception raised when a request fails. :on_connect: a coroutine function called with the client
+        every time it connects, before any other request is sent. :changes: the methods that change something in the
+        other process. the connection is dropped when one of them times out.
+        """
+        self.path = path
+        self.name = name
+        self.error = error
+        self.on_connect = on_connect
+        self.timeout = timeout
+        self.changes = set(changes)
+        self._writer = None
+        self._pending = {} # request id -> the future waiting for its response
+        self._next_id = 0
+        self._connect_lock = asyncio.Lock()
+
+    async def request(self, method:str, **params):
+        """
+        Sends a request and returns its result.
+        """
+        await self.connect()
+        return await self.send(method, params)
+
+    async def connect(self):
+        # connects if the connection is not open. raises :error: if it cannot
+        async with self._connect_lock:
+            if self._writer is None: await self._connect()
+
+    async def _connect(self):
+        try:
+            reader, self._writer = await asyncio.open_unix_connection(self.path, limit=stream_limit)
+        except OSError as error:
+            raise self.error(f"could not connect to the {self.name} at {self.path}: {error}")
+        asyncio.ensure_future(self._listen(reader))
+
+        if self.on_connect is not None: await self.on_connect(self)
+        logMsg(f"Connected to the {self.name} at {self.path}")
+
+    async def send(self, method:str, params:dict):
+        """
+        Sends a request on the open connection. only on_connect uses this directly.
+        """
+        if self._writer is None:
+            raise self.error(f"lost the connection to the {self.name}")
+
+        self._next_id += 1
+        request_id = self._next_id
+        future = asyncio.get_event_loop().create_future()
+        self._pending[request_id] = future
+        writer = self._writer
+        writer.write(encode({"id": request_id, "method": method, "params": params}))
+
+        try:
+            return await asyncio.wait_for(future, self.timeout)
+        except asyncio.TimeoutError:
+            self._pending.pop(request_id, None)
+            if method in self.changes and self._writer is writer: # it might still be carried out
+                logMsg(f"Dropped the connection to the {self.name}: {method} timed out")
+                self._disconnect()
+            raise self.error(f"{method} timed out")
+
+    async def _listen(self, reader):
+        # resolves the futures in the order the responses arrive
+        try:
+            while True:
+                line = await reader.readline()
+                if not line: break # the other process closed the connection
+                response = json.loads(line)
+                future = self._pending.pop(response["id"], None)
+                if future is None or future.done(): continue
+                if "error" in response:
+                    future.set_exception(self.error(response["error"]))
+                else:
+                    future.set_result(response["result"])
+        except (OSError, ValueError) as error:
+            logMsg(f"Lost the connection to the {self.name}: {error}")
+        finally:
+            self._disconnect()
+
+    def close(self):
+        # fails every waiting request. the next one connects again
+        self._disconnect()
+
+    def _disconnect(self):
+        writer, self._writer = self._writer, None
+        if writer is not None: writer.close()
+        pending, self._pending = self._pending, {}
+        for future in pending.values(): # the next request connects again
+            if not future.done(): future.set_exception(self.error(f"lost the connection to the {self.name}"))
+
+async def serve(path:str, handle, concurrent:bool=False):
+    """
+    Answers requests on the unix socket at :path:. returns the server.
+
+    :handle: a coroutine function called with (method, params) that returns the result. the requests of a connection
+    are handled one at a time, in order, unless :concurrent: is True. then each one runs in its own task and they are
+    answered as they finish.
+    """
+    async def answer(request, writer):
+        try:
+            response = {"id": request["id"], "result": await handle(request["method"], request["params"])}
+        except Exception as error: # sent back instead of closing the connection
+            response = {"id": request["id"], "error": f"{type(error).__name__}: {error}"}
+        writer.write(encode(response))
+        await writer.drain()
+
+    async def handle_connection(reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line: break
+                if concurrent:
+                    asyncio.ensure_future(answer(json.loads(line), writer))
+                else:
+                    await answer(json.loads(line), writer)
+        except (OSError, ValueError) as error:
+            logMsg(f"Dropped a connection on {path}: {error}")
+        finally:
+            writer.close()
+
+    if os.path.exists(path): os.remove(path) # left behind by a process that stopped
+    return await asyncio.start_unix_server(handle_connection, path, limit=stream_limit)
@@ -0,0 +1,196 @@
+"""
+The scheduler.
+
+Every periodic job of the economy(the market tick, new coins, new shares, compacting the log...) runs from one
+scheduler instead of its own loop. separate loops each slept for their interval after they finished, so they drifted
+away from the clock and from each other. a tick that has to happen on the first minute of the hour could run twice or
+not at all.
+
+the scheduler ticks once per wall-clock minute, right after the minute starts. the sleep is worked out from the clock
+every time, so it never drifts. a job runs every :every: minutes, aligned to the clock: every=60 runs at minute 0 of
+every hour, every=1440 at midnight. jobs are registered where they are defined:
+
+    @scheduler.job(every=1, phase="tick", catch_up=True)
+    async def simulate_cache():
+        now = scheduler.now # the minute being run. always has 0 seconds
+
+scheduler.now is the minute the tick is for, not the time the job actually started, so "now.minute == 0" holds in
+exactly one tick every hour.
+
+the jobs of a tick run one after the other, in the order of phases. (then by name) so the constants are reloaded
+before the market is simulated, the orders the tick triggered are made right after it, then the price alerts go off,
+and the coins that crashed in the tick are cleaned up after it.
+
+if the bot falls behind(the event loop was blocked, the machine slept), the missed minutes are run in order on the
+next tick, up to max_catch_up of them. jobs with catch_up=True run for every missed minute. the others only run
+once, for the last minute they were due in.
+
+the jobs are kept in a timer wheel: one slot per minute of the hour, each holding the jobs due in a minute that falls
+in it. a tick only looks at its own slot. jobs that are due later than this hour stay in the slot until their minute
+comes.
+"""
+import asyncio
+import datetime
+import logging
+import time
+from src.utils.log import logEvent, logMsg
+
+phases = ("constants", "supply", "tick", "orders", "alerts", "listing", "cleanup", "storage", "housekeeping")
+wheel_size = 60 # slots, one per minute of the hour
+max_catch_up = 60 # the most missed minutes that are run after falling behind
+slow_job_ms = 5000 # jobs slower than this are logged as slow
+
+epoch = datetime.datetime(1970, 1, 1)
+
+def minute_of(moment:datetime.datetime)->int:
+    # the number of wall-clock minutes since 1970. local time, so every=1440 is aligned to the local midnight
+    return int((moment - epoch).total_seconds() // 60)
+
+def time_of(minute:int)->datetime.datetime:
+    return epoch + datetime.timedelta(minutes=minute)
+
+class Job:
+    def __init__(self, function, every:int, phase:str, catch_up:bool):
+        """
+        A periodic job and how long it took to run.
+        """
+        self.function = function
+        self.name = function.__name__
+        self.every = every
+        self.phase = phases.index(phase)
+        self.catch_up = catch_up
+        self.due = None # the next minute it runs in
+
+        self.runs = 0
+        self.skipped = 0 # missed runs that were not caught up
+        self.failures = 0
+        self.last_ms = 0.0
+        self.max_ms = 0.0
+        self.total_ms = 0.0
+
+    def next_due(self, after:int)->int:
+        # the first minute after :after: that is aligned to every
+        return (after // self.every + 1) * self.every
+
+class Scheduler:
+    def __init__(self):
+        self.jobs = []
+        self.wheel = [[] for _ in range(wheel_size)]
+        self.now = None # the minute being run, while a tick runs
+        self.cursor = None # the last minute that was run
+        self._stopped = asyncio.Event()
+        self._task = None
+
+    def job(self, every:int=1, phase:str="housekeeping", catch_up:bool=False):
+        """
+        Registers an async function without arguments as a job. returns it unchanged, so it can still be called.
+        """
+        def register(function):
+            self.jobs.append(Job(function, every, phase, catch_up))
+            return function
+        return register
+
+    def _schedule(self, job:Job, after:int):
+        job.due = job.next_due(after)
+        self.wheel[job.due % wheel_size].append(job)
+
+    def _reset(self, cursor:int):
+        # puts every job back in the wheel, due after :cursor:
+        self.cursor = cursor
+        self.wheel = [[] for _ in range(wheel_size)]
+        for job in self.jobs:
+            self._schedule(job, cursor)
+
+    def start(self):
+        """
+        Starts ticking on the next minute.
+        """
+        self._reset(minute_of(datetime.datetime.now()))
+        self._task = asyncio.get_event_loop().create_task(self._run())
+
+    async def stop(self):
+        """
+        Stops ticking. waits for the tick that is running to finish.
+        """
+        self._stopped.set()
+        if self._task is not None: await self._task
+
+    async def _run(self):
+        while not self._stopped.is_set():
+            now = datetime.datetime.now()
+            seconds = 60 - now.second - now.microsecond / 1_000_000 # until the next minute starts
+            try:
+                await asyncio.wait_for(self._stopped.wait(), seconds)
+                break
+            except asyncio.TimeoutError:
+                pass
+            await self.run_until(minute_of(datetime.datetime.now()))
+
+    async def run_until(self, target:int):
+        """
+        Runs every minute after the last one that was run, up to and including :target:.
+        """
+        if target < self.cursor - 1: # the clock was set back. it is followed instead of waiting for it to catch up
+            logMsg(f"The clock went back {self.cursor - target} minutes, the scheduler follows it")
+            self._reset(target - 1)
+
+        missed = target - self.cursor - 1
+        if missed > max_catch_up:
+            for job in self.jobs: # the runs that will never happen
+                job.skipped += len(range(job.next_due(self.cursor), target - max_catch_up, job.every))
+            logEvent("ticks_skipped", minutes=missed - max_catch_up)
+            self._reset(target - max_catch_up - 1)
+        if missed > 0:
+            logEvent("ticks_late", minutes=min(missed, max_catch_up))
+
+        while self.cursor < target:
+            self.cursor += 1
+            await self.run_minute(self.cursor, target)
+
+    async def run_minute(self, minute:int, target:int):
+        """
+        Runs the jobs due in :minute:. :target: the minute the scheduler is catching up to
+        """
+        slot = self.wheel[minute % wheel_size]
+        due = [job for job in slot if job.due <= minute]
+        if not due: return
+        slot[:] = [job for job in slot if job.due > minute]
+
+        self.now = time_of(minute)
+        for job in sorted(due, key=lambda job: (job.phase, job.name)):
+            self._schedule(job, minute)
+            if not job.catch_up and job.due <= target: # it runs again in a later minute of this catch up
+                job.skipped += 1
+                continue
+            await self.run_job(job)
+        self.now = None
+
+    async def run_job(self, job:Job):
+        started = time.perf_counter()
+        try:
+            await job.function()
+        except Exception as error: # the job runs again the next time it is due
+            job.failures += 1
+            logMsg(f"The {job.name} job failed: {type(error).__name__}: {error}")
+        ms = (time.perf_counter() - started) * 1000
+
+        job.runs += 1
+        job.last_ms = ms
+        job.max_ms = max(job.max_ms, ms)
+        job.total_ms += ms
+        logEvent("job_done", level=logging.INFO if ms > slow_job_ms else logging.DEBUG, job=job.name,
+                 tick=str(self.now), ms=ms)
+
+    def report(self)->str:
+        """
+        A table of every job and how long it takes.
+        """
+        lines = [f"{'job':<20}{'every':>7}{'runs':>7}{'skipped':>9}{'failed':>8}{'last ms':>10}{'avg ms':>10}{'max ms':>10}"]
+        for job in sorted(self.jobs, key=lambda job: (job.phase, job.name)):
+            average = job.total_ms / job.runs if job.runs else 0
+            lines.append(f"{job.name:<20}{job.every:>7}{job.runs:>7}{job.skipped:>9}{job.failures:>8}"
+                         f"{job.last_ms:>10.1f}{average:>10.1f}{job.max_ms:>10.1f}")
+        lines.append(f"next tick: {time_of(self.cursor + 1) if self.cursor is not None else 'not started'}")
+        return "\n".join(lines)
+
+scheduler = Scheduler()
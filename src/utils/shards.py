@@ -0,0 +1,187 @@
+"""
+Sharding.
+
+One process holding the gateway connection of every guild does not scale forever. the bot can be split in 2 kinds of
+processes instead:
+    the backend: src/main.py with "backend socket" set in src/kryptonite_bot/imp_info.json. it never connects to the
+        gateway. it runs every command and every task and is the only process that writes anything. (the write ahead
+        log, the ledger, the user files)
+    the shards: python -m src.shard [shard ids] [shard count]. each one connects to the gateway for its shards and
+        forwards every command to the backend, then sends the replies. they keep no state, so any number of them can be
+        started and restarted.
+
+the commands run in the backend exactly like they do when the bot runs alone, so the transactions(see transactions.py)
+still lock and commit every change in one place. a command is forwarded as a request(see rpc.py):
+    {"method": "message", "params": {"message": {"content": ">buy ntfa kuki-bux 5", "author": {...}, ...}}}
+and the result is everything the command sent:
+    [{"content": None, "embed": {...}, "reply": True}, ...]
+
+commands sent in a guild with its own economy are forwarded again, to the backend of that guild. (see guilds.py)
+
+the backend rebuilds the message out of plain stand-ins(RelayMessage, RelayUser, RelayGuild) with just what the
+commands use, and gives the command a RelayContext that collects what it sends instead of sending it.
+"""
+import datetime
+import discord
+from discord.ext import commands
+from discord.ext.commands.view import StringView
+from src.utils.rpc import RpcError, serve
+from src.utils.guilds import guild_economies
+
+member_commands = ("leaderboard", "lb", "top") # the commands that need every member of the guild
+
+class RelayUser:
+    def __init__(self, data:dict):
+        """
+        A user from a forwarded message.
+        """
+        self.id = data["id"]
+        self.name = data.get("name", str(self.id))
+        self.bot = data.get("bot", False)
+        self.avatar_url = data.get("avatar_url", "")
+
+    @property
+    def mention(self)->str:
+        return f"<@{self.id}>"
+
+    def __str__(self):
+        return self.name
+
+class RelayMember(discord.Member):
+    def __init__(self, user:RelayUser, guild):
+        """
+        A member of the guild a message was forwarded from.
+
+        it is a discord.Member so the Member converter accepts it. it is never filled in by discord, everything is read
+        from the user.
+        """
+        self._user = user
+        self.guild = guild
+
+    @property
+    def avatar_url(self)->str:
+        return self._user.avatar_url
+
+class RelayGuild:
+    def __init__(self, data:dict, mentions:list):
+        self.id = data["id"]
+        self.name = data["name"]
+        self._members = {user.id: RelayMember(user, self) for user in mentions}
+        for uid in data.get("members", ()): # only sent for the commands in member_commands
+            self._members.setdefault(uid, RelayMember(RelayUser({"id": uid}), self))
+
+    @property
+    def members(self)->list:
+        return list(self._members.values())
+
+    def get_member(self, uid:int):
+        return self._members.get(uid)
+
+    def get_member_named(self, name:str):
+        return next((member for member in self._members.values() if member.name == name), None)
+
+class RelayMessage:
+    def __init__(self, data:dict):
+        """
+        A message forwarded by a shard.
+        """
+        self.id = data["id"]
+        self.content = data["content"]
+        self.author = RelayUser(data["author"])
+        mentions = [RelayUser(user) for user in data.get("mentions", ())]
+        self.guild = None if data.get("guild") is None else RelayGuild(data["guild"], mentions)
+        self.mentions = mentions if self.guild is None else [self.guild.get_member(user.id) for user in mentions]
+        self.channel = None
+        self.attachments = []
+        self.created_at = datetime.datetime.now(datetime.timezone.utc) # used for cooldowns
+        self.edited_at = None
+        self._state = None
+
+class RelayContext(commands.Context):
+    """
+    Collects what the command sends, so the shard can send it.
+    """
+    def __init__(self, **attrs):
+        super().__init__(**attrs)
+        self.replies = [] # the messages the command sent, as dicts
+
+    async def send(self, content=None, *, embed:discord.Embed=None, reference=None, **kwargs):
+        self.replies.append({"content": None if content is None else str(content),
+                             "embed": None if embed is None else embed.to_dict(),
+                             "reply": reference is not None})
+
+class Backend:
+    def __init__(self, bot:commands.Bot, on_error):
+        """
+        Runs the commands forwarded by the shards on :bot:. :on_error: the bot's on_command_error
+        """
+        self.bot = bot
+        self.on_error = on_error
+
+    async def handle(self, method:str, params:dict):
+        if method != "message":
+            raise RpcError(f"unknown method {method}")
+
+        guild = params["message"].get("guild")
+        if guild is not None and guild["id"] in guild_economies: # the guild has its own economy
+            return await guild_economies.request(guild["id"], "message", message=params["message"])
+        return await self.run_command(RelayMessage(params["message"]))
+
+    def context(self, message:RelayMessage)->RelayContext:
+        # finds the command the same way the bot does
+        view = StringView(message.content)
+        ctx = RelayContext(prefix=None, view=view, bot=self.bot, message=message)
+        if not view.skip_string(self.bot.command_prefix): return ctx
+
+        ctx.prefix = self.bot.command_prefix
+        ctx.invoked_with = view.get_word()
+        ctx.command = self.bot.all_commands.get(ctx.invoked_with)
+        return ctx
+
+    async def run_command(self, message:RelayMessage)->list:
+        """
+        Runs the command in the message and returns what it sent.
+        """
+        ctx = self.context(message)
+        if ctx.command is None: return []
+
+        try:
+            await ctx.command.invoke(ctx)
+        except commands.CommandError as error:
+            await self.on_error(ctx, error)
+        return ctx.replies
+
+async def serve_backend(bot:commands.Bot, path:str, on_error):
+    """
+    Answers the shards on the unix socket at :path:. commands from different users run at the same time, like they do
+    when the bot runs alone.
+    """
+    return await serve(path, Backend(bot, on_error).handle, concurrent=True)
+
+def shard_of(guild_id:int, shard_count:int)->int:
+    # the shard discord sends a guild's events to
+    return (guild_id >> 22) % shard_count
+
+def user_payload(user)->dict:
+    return {"id": user.id, "name": user.name, "bot": user.bot, "avatar_url": str(getattr(user, "avatar_url", ""))}
+
+def message_payload(message, prefix:str)->dict:
+    """
+    Turns a discord message into what is forwarded to the backend.
+    """
+    guild = None
+    if message.guild is not None:
+        words = message.content[len(prefix):].split(maxsplit=1)
+        members = [member.id for member in message.guild.members] if words and words[0] in member_commands else []
+        guild = {"id": message.guild.id, "name": message.guild.name, "members": members}
+
+    return {"id": message.id, "content": message.content, "author": user_payload(message.author),
+            "mentions": [user_payload(user) for user in message.mentions], "guild": guild}
+
+async def deliver(message, replies:list):
+    """
+    Sends what the command sent in the backend, in the channel of :message:.
+    """
+    for reply in replies:
+        embed = None if reply["embed"] is None else discord.Embed.from_dict(reply["embed"])
+        await message.channel.send(reply["content"], embed=embed, reference=message if reply["reply"] else None)
@@ -0,0 +1,255 @@
+"""
+Timers.
+
+Things that have to happen to a user at a certain time(a cooldown running out, an order expiring, a reminder) are
+timers. unlike discord's cooldowns, they are part of the economy: they are set in a transaction, logged in the write
+ahead log with the commit and written to src/db/timers.json when the log is compacted, so they survive restarts.
+
+    async with Transaction(users=[uid]) as tx:
+        tx.start_cooldown("daily", uid, 86400) # raises OnCooldown if the last one did not run out yet
+        tx.set_timer(f"remind:{uid}", 3600, kind="remind", data={"text": "..."})
+
+when a timer is due, it fires: it is removed and the handler of its kind is called with every timer of that kind that
+fired in the same second, as a batch:
+    @timers.handler("remind")
+    async def send_reminders(fired:list): ...
+a timer without a handler(a cooldown) just disappears. a fired timer is logged, so it never fires twice, but a
+restart right after it fired can call its handler again. (at least once)
+
+the timers are kept in a hierarchical timing wheel, so setting, cancelling and firing one is O(1) no matter how many
+are pending. it has 5 levels of 64 slots. level 0 has a slot for each of the next 64 seconds, level 1 one for each of
+the next 64 blocks of 64 seconds, and so on. (64**5 seconds is about 34 years) a timer goes in the lowest level where
+it falls in the current block of the level above. when the wheel reaches a slot of a higher level, its timers are put
+down into the lower levels, closer to their second. each timer is moved at most 4 times.
+"""
+import asyncio
+import logging
+import time
+from src.utils.json_utils import *
+from src.utils.wal import wal
+from src.utils.log import logEvent, logMsg
+
+slot_bits = 6
+slots = 1 << slot_bits # 64
+levels = 5
+max_delay = (1 << (slot_bits * levels)) - 1 # seconds
+rebuild_after = slots * slots # seconds. if the wheel fell further behind than this, it is rebuilt instead of stepped
+
+class OnCooldown(Exception):
+    """
+    Raised when a command is used again before its cooldown ran out.
+    """
+    def __init__(self, retry_after:float):
+        super().__init__(f"on cooldown for {int(retry_after)} more seconds")
+        self.retry_after = retry_after
+
+def cooldown_key(name:str, uid:int)->str:
+    return f"cooldown:{name}:{uid}"
+
+class Timer:
+    # slots keep every timer small. there can be one per user and command
+    __slots__ = ("key", "due", "kind", "data", "level", "slot")
+
+    def __init__(self, key:str, due:int, kind:str, data=None):
+        """
+        A timer that fires at :due:, in unix seconds. :data: anything json can hold, for the handler
+        """
+        self.key = key
+        self.due = due
+        self.kind = kind
+        self.data = data
+        self.level = None # where it is in the wheel. level -1 is the timers that are already due
+        self.slot = None
+
+    def to_list(self)->list:
+        return [self.key, self.due, self.kind, self.data]
+
+class TimerWheel:
+    def __init__(self, path:str="src/db/timers.json"):
+        self.path = path
+        self.timers = {} # key -> Timer, every pending timer
+        self.wheel = [[{} for _ in range(slots)] for _ in range(levels)] # level -> slot -> key -> Timer
+        self.due = {} # key -> Timer, the timers that were due when they were placed. they fire on the next advance
+        self.now = int(time.time()) # the last second the wheel was advanced to
+        self.handlers = {} # kind -> the coroutine function called with the timers that fired
+        self._stopped = asyncio.Event()
+        self._task = None
+
+    def __len__(self)->int:
+        return len(self.timers)
+
+    def handler(self, kind:str):
+        """
+        Registers the handler of a kind of timer. it is called with a list of the timers that fired together.
+        """
+        def register(function):
+            self.handlers[kind] = function
+            return function
+        return register
+
+    def _place(self, timer:Timer):
+        if timer.due <= self.now:
+            timer.level, timer.slot = -1, None
+            self.due[timer.key] = timer
+            return
+
+        # the lowest level where the timer is in the same block of the level above as now
+        for level in range(levels):
+            shift = slot_bits * (level + 1)
+            if timer.due >> shift == self.now >> shift: break
+        timer.level = level
+        timer.slot = (timer.due >> (slot_bits * level)) & (slots - 1)
+        self.wheel[level][timer.slot][timer.key] = timer
+
+    def _unplace(self, timer:Timer):
+        if timer.level == -1:
+            del self.due[timer.key]
+        else:
+            del self.wheel[timer.level][timer.slot][timer.key]
+
+    def set(self, key:str, due:int, kind:str, data=None):
+        """
+        Sets a timer. replaces the timer with the same key, if there is one.
+        """
+        if due - self.now > max_delay:
+            raise ValueError(f"timers can only be set up to {max_delay} seconds ahead")
+        self.cancel(key)
+        timer = Timer(key, due, kind, data)
+        self.timers[key] = timer
+        self._place(timer)
+
+    def cancel(self, key:str)->bool:
+        timer = self.timers.pop(key, None)
+        if timer is None: return False
+        self._unplace(timer)
+        return True
+
+    def get(self, key:str):
+        return self.timers.get(key)
+
+    def remaining(self, key:str)->float:
+        """
+        Returns the seconds until the timer fires, or 0 if there is no such timer.
+        """
+        timer = self.timers.get(key)
+        return 0 if timer is None else max(timer.due - time.time(), 0)
+
+    def advance(self, to:int)->list:
+        """
+        Moves the wheel to the second :to: and returns the timers that fired on the way, in the order they were due.
+        """
+        fired = sorted(self._take(self.due), key=lambda timer: timer.due) # set when they were already due
+        self.due = {}
+
+        if to - self.now > rebuild_after: # stepping through every second would take longer than placing every timer
+            self.now = to
+            self.wheel = [[{} for _ in range(slots)] for _ in range(levels)]
+            for timer in self.timers.values():
+                self._place(timer)
+            fired += sorted(self._take(self.due), key=lambda timer: timer.due)
+            self.due = {}
+
+        while self.now < to and self.timers:
+            self.now += 1
+            self._cascade(self.now) # timers due this very second are put in self.due
+            slot = self.now & (slots - 1)
+            for bucket in (self.due, self.wheel[0][slot]):
+                fired += self._take(bucket)
+            self.due, self.wheel[0][slot] = {}, {}
+        self.now = max(self.now, to)
+        return fired
+
+    def _take(self, bucket:dict)->list:
+        # removes the timers in :bucket: from the pending timers
+        for key in bucket:
+            del self.timers[key]
+        return list(bucket.values())
+
+    def _cascade(self, second:int):
+        # the highest level whose block starts at this second. its slot is put down first, then the ones below it
+        top = 0
+        while top + 1 < levels and second & ((1 << (slot_bits * (top + 1))) - 1) == 0:
+            top += 1
+        for level in range(top, 0, -1):
+            slot = (second >> (slot_bits * level)) & (slots - 1)
+            bucket = self.wheel[level][slot]
+            if not bucket: continue
+            self.wheel[level][slot] = {}
+            for timer in bucket.values():
+                self._place(timer)
+
+    async def fire(self, fired:list):
+        """
+        Logs that the timers fired, then calls the handler of every kind with its batch.
+        """
+        if not fired: return
+        started = time.perf_counter()
+        wal.append({"op": "timers_fired", "keys": [timer.key for timer in fired]})
+
+        batches = {}
+        for timer in fired:
+            batches.setdefault(timer.kind, []).append(timer)
+        for kind, batch in batches.items():
+            handler = self.handlers.get(kind)
+            if handler is None: continue
+            try:
+                await handler(batch)
+            except Exception as error: # the timers are gone either way, the other kinds still get theirs
+                logMsg(f"The {kind} timer handler failed on {len(batch)} timers: {type(error).__name__}: {error}")
+
+        logEvent("timers_fired", level=logging.DEBUG, timers=len(fired), kinds=len(batches),
+                 ms=(time.perf_counter() - started) * 1000)
+
+    def start(self):
+        """
+        Starts firing the timers, once every second.
+        """
+        self._task = asyncio.get_event_loop().create_task(self._run())
+
+    async def stop(self):
+        self._stopped.set()
+        if self._task is not None: await self._task
+
+    async def _run(self):
+        while not self._stopped.is_set():
+            try: # wakes up right after the next second starts
+                await asyncio.wait_for(self._stopped.wait(), 1 - time.time() % 1)
+                break
+            except asyncio.TimeoutError:
+                pass
+            if wal.replayed: # the timers are loaded with the log
+                await self.fire(self.advance(int(time.time())))
+
+    def record(self, key:str, due:int, kind:str, data=None)->dict:
+        # the record of a timer being set, for the write ahead log
+        return {"op": "timer", "key": key, "due": due, "kind": kind, "data": data}
+
+    def apply_record(self, record:dict):
+        """
+        Applies a record from the write ahead log.
+        """
+        if record["op"] == "timer":
+            self.set(record["key"], record["due"], record["kind"], record["data"])
+        elif record["op"] == "timers_fired":
+            for key in record["keys"]:
+                self.cancel(key)
+
+    def load(self):
+        """
+        Loads the timers from the last compaction. the ones that came due while the bot was down fire right away.
+        """
+        try:
+            data = load_json(self.path)
+        except (OSError, ValueError):
+            return
+        self.now = int(time.time())
+        for key, due, kind, data in data["timers"]:
+            self.set(key, due, kind, data)
+
+    def to_dict(self)->dict:
+        return {"timers": [timer.to_list() for timer in self.timers.values()]}
+
+    def save(self):
+        write_json_atomic(self.path, self.to_dict())
+
+timers = TimerWheel()
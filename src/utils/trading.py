@@ -0,0 +1,158 @@
+"""
+Trading.
+
+The one path every trade goes through, whether a user typed '>buy' or one of their orders was triggered. (see
+orders.py) the engine prices the trade and makes it(see engine.py), then the user pays or gets paid, the money is
+posted to the ledger and everything is committed together:
+
+    async with Transaction(users=[uid], coins=[coin_uid]) as tx:
+        result = await trade(tx, uid, "ntfa", coin_uid, "buy", 50)
+        if result["error"] is None: ... # the trade was committed
+
+if the trade is refused, nothing is committed and result["error"] says why:
+    "coin": the coin does not exist anymore
+    "shares": more shares than the trading limit
+    "holdings": selling more shares than the account holds
+    "balance": the account cannot afford it
+    "volume": the subtotal is over the trading limit of the account
+
+the orders that a tick triggered are made the same way, by execute_orders(), right after the tick. an order is a
+market order once it triggers: it gets the price of the moment it is made, not its trigger price. nothing is set aside
+for it while it rests, so it can still be refused when it triggers. it is closed then, and the user is told why.
+"""
+import time
+from src.utils.engine import engine_client, settle_crash, EngineError
+from src.utils.ledger import Entry, move, bank
+from src.utils.events import Trade
+from src.utils.money import fmt_money
+from src.utils.crypto_currency import crypto_cache
+from src.utils.transactions import Transaction, TransactionConflict
+from src.utils.orders import order_book
+from src.utils.timers import timers
+from src.utils.scheduler import scheduler
+from src.utils.wal import wal
+from src.utils.log import logEvent, logMsg
+
+async def trade(tx, uid:int, account_name:str, coin_uid:int, side:str, shares:int)->dict:
+    """
+    Makes a trade for a user and coin locked by :tx:, then commits :tx:. :side: "buy" or "sell"
+
+    Returns what the engine returned(value, subtotal, total, shares, previous, budget), or only {"error": ...} if it
+    was refused before it got to the engine.
+    """
+    user = tx.user(uid)
+    coin = tx.coin(coin_uid)
+    if coin is None: # the coin crashed while we were waiting for it
+        return {"error": "coin"}
+    if user.shares_exceeds_trade_limit(shares):
+        return {"error": "shares"}
+    if side == "sell" and not user.has_enough_shares(account_name=account_name, coin_uid=coin_uid, shares=shares):
+        return {"error": "holdings", "held": user.accounts[account_name].holdings.get(coin_uid, 0)}
+
+    # the engine prices the trade(see CryptoCurrency.quote()) and makes it if it is allowed
+    budget = user.accounts[account_name].balance if side == "buy" else 0
+    result = await engine_client.request("trade", coin=coin_uid, side=side, shares=shares, account=account_name,
+                                         budget=budget)
+    if result["error"] is not None: return result
+
+    tx.apply_trade(coin_uid, result) # changes the value of the currency
+    await tx.commit(settle(tx, uid, account_name, coin_uid, side, result))
+    await settle_crash(coin) # checks if the coin has crashed
+
+    logEvent("trade", side=side, user=uid, account=account_name, coin=coin.name, shares=result["shares"],
+             subtotal=fmt_money(result["subtotal"]), total=fmt_money(result["total"]), value=result["value"])
+    return result
+
+def settle(tx, uid:int, account_name:str, coin_uid:int, side:str, fill:dict)->Trade:
+    """
+    Pays for a trade the engine made and posts it to the ledger. :fill: the shares, subtotal, total and value
+
+    Returns its event, for tx.commit().
+    """
+    user = tx.user(uid)
+    subtotal, total, shares = fill["subtotal"], fill["total"], fill["shares"]
+    if side == "buy": # the market gets the subtotal and the taxes go to the tax account
+        user.modify_account(account_name=account_name, amount=-total)
+        user.increase_holding(account_name=account_name, coin_uid=coin_uid, shares=shares)
+        postings = {bank(uid, account_name): -total, "market": subtotal}
+        if total != subtotal: postings["tax"] = total - subtotal
+        tx.post(Entry("buy", postings))
+    else: # if the new balance passes the limit, commit() caps it and posts what was cut off
+        user.modify_account(account_name=account_name, amount=subtotal)
+        user.decrease_holding(account_name=account_name, coin_uid=coin_uid, shares=shares)
+        tx.post(move("sell", "market", bank(uid, account_name), subtotal))
+    return Trade(uid, account_name, coin_uid, side, shares, subtotal, total, fill["value"])
+
+def notify(order, reason:str):
+    # tells the user what happened to their order
+    if order_book.notify is None: return
+    try:
+        order_book.notify(order, reason)
+    except Exception as error: # the order is closed either way
+        logMsg(f"Could not tell user {order.uid} about order {order.id}: {type(error).__name__}: {error}")
+
+async def execute_order(order)->dict:
+    """
+    Makes a triggered order. it is taken out of the book in the same commit as its trade, or closed if the trade is
+    refused.
+    """
+    async with Transaction(users=[order.uid], coins=[order.coin]) as tx:
+        if order_book.get(order.id) is not order: # cancelled while it waited for the lock
+            return {"error": "cancelled"}
+        tx.add_record(order_book.done_record(order.id, "filled"))
+        result = await trade(tx, order.uid, order.account, order.coin, order.side, order.shares)
+
+    if result["error"] is None:
+        notify(order, "filled")
+    else:
+        order_book.close(order.id, result["error"])
+        logEvent("order_refused", order=order.id, user=order.uid, reason=result["error"])
+        notify(order, result["error"])
+    return result
+
+@scheduler.job(every=1, phase="orders")
+async def execute_orders():
+    """
+    Makes the orders whose trigger price the tick crossed.
+    """
+    if not wal.replayed: return
+    started = time.perf_counter()
+
+    for coin_uid in order_book.coins() - crypto_cache.keys(): # the coin crashed
+        for order in order_book.coin_orders(coin_uid):
+            order_book.close(order.id, "coin")
+            notify(order, "coin")
+
+    triggered = []
+    for coin_uid in order_book.coins():
+        triggered += order_book.triggered(coin_uid, crypto_cache[coin_uid].value)
+    # every triggered order was popped from its heap. each one is either made, closed or put back
+    filled = 0
+    for i, order in enumerate(triggered):
+        try:
+            result = await execute_order(order)
+        except EngineError as error: # they are tried again after the next tick
+            for waiting in triggered[i:]:
+                order_book.requeue(waiting)
+            logMsg(f"Could not make {len(triggered) - i} triggered orders: {error}")
+            break
+        except TransactionConflict as error: # the user was saved in between. tried again after the next tick
+            order_book.requeue(order)
+            logMsg(f"Could not make order {order.id}: {error}")
+            continue
+        except Exception as error: # it would fail the same way every time. the other orders still get made
+            if order_book.close(order.id, "error") is not None: notify(order, "error")
+            logMsg(f"Closed order {order.id}, it failed: {type(error).__name__}: {error}")
+            continue
+        filled += result["error"] is None
+
+    if triggered:
+        logEvent("orders_executed", triggered=len(triggered), filled=filled, resting=len(order_book),
+                 ms=(time.perf_counter() - started) * 1000)
+
+@timers.handler("order_expiry")
+async def expire_orders(fired:list):
+    # the orders that did not trigger in time. the ones that were already filled or cancelled are gone
+    for timer in fired:
+        order = order_book.close(timer.data, "expired")
+        if order is not None: notify(order, "expired")
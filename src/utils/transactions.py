@@ -0,0 +1,401 @@
+"""
+Transactions.
+
+A command that changes users or coins runs inside a transaction:
+
+    async with Transaction(users=[sender_id, recipient_id]) as tx:
+        sender, recipient = tx.user(sender_id), tx.user(recipient_id)
+        ...
+        tx.post(move("transfer", wallet(sender_id), wallet(recipient_id), amount)) # the money that moved
+        await tx.commit(Transfer(sender_id, recipient_id, amount)) # the events that describe the change
+    await ctx.send(...) # only talk to discord after the commit
+
+every user and coin has its own lock. a transaction takes the locks of everything it touches, always in the same
+order(coins, then users, each sorted by id), so 2 transactions can never wait on each other forever. commands that
+touch different users never wait on each other at all.
+
+the users are loaded after the locks are taken, so no one else can change them in between. commit() still checks
+that no one saved them outside of a transaction(the version check), then writes everything that was touched in one
+durable write: a single record in the write ahead log(see wal.py). a record is either fully in the log or dropped,
+so a commit is never half applied. the locks are held until the record is on disk.
+
+every change to a user's money has to be posted to the ledger(see ledger.py) before committing. commit() checks that
+the money each user gained or lost is exactly what was posted for them. if it is not, nothing is written and
+LedgerImbalance is raised. only the users in the transaction are checked, so the audit costs nothing extra.
+
+this module also owns the snapshots: compact() writes the users and currencies that changed into their files and
+cuts them off the log. recover() replays the log on startup.
+
+if the transaction is left without committing(an early return or an error), nothing is written and the coins get
+their old values back.
+"""
+import time
+import weakref
+import asyncio
+from src.utils.json_utils import *
+from src.utils.users import User, user_versions, dirty_users, load_all_users
+from src.utils.ledger import ledger, Entry, LedgerImbalance, move, bank
+from src.utils.holders import holders
+from src.utils.leaderboard import leaderboard
+from src.utils.crypto_currency import crypto_cache, db_path, db_to_dict, publish_market, apply_record as apply_coin_record
+from src.utils.engine import engine_client, apply_states, undo_trade
+from src.utils.wal import wal
+from src.utils.events import event_log
+from src.utils.timers import timers, OnCooldown, cooldown_key
+from src.utils.orders import order_book
+from src.utils.alerts import alert_book
+from src.utils.log import logEvent, logMsg
+from src.utils.scheduler import scheduler
+
+class TransactionConflict(Exception):
+    """
+    Raised when a user was saved by someone else after the transaction loaded it.
+    """
+
+class LockTable:
+    def __init__(self):
+        """
+        Hands out one asyncio lock per user and per coin.
+
+        the locks are kept in a WeakValueDictionary, so a lock disappears once no transaction is using it and the
+        table does not grow with every user that ever used the bot.
+        """
+        self._locks = weakref.WeakValueDictionary()
+
+    def lock(self, key:tuple)->asyncio.Lock:
+        lock = self._locks.get(key)
+        if lock is None:
+            lock = asyncio.Lock()
+            self._locks[key] = lock
+        return lock
+
+lock_table = LockTable()
+
+class Transaction:
+    def __init__(self, users=(), coins=()):
+        """
+        A transaction over the given user ids and coin ids.
+
+        duplicate ids are ignored, so transferring to yourself only locks you once.
+        """
+        self.user_ids = sorted(set(users))
+        self.coin_ids = sorted(set(coins))
+        self.users = {}
+        self.coins = {}
+        self.entries = [] # the ledger entries posted so far
+        self.records = [] # the other records to commit with it. timers, orders...
+        self.committed = False
+        self._locks = []
+        self._coin_values = {} # the value every traded coin had right before its trade
+        self._money = {} # the money every user had when it was loaded
+
+    def keys(self)->list:
+        # the order the locks are taken in. the same for every transaction
+        return [("coin", uid) for uid in self.coin_ids] + [("user", uid) for uid in self.user_ids]
+
+    async def __aenter__(self):
+        try:
+            for key in self.keys():
+                lock = lock_table.lock(key)
+                await lock.acquire()
+                self._locks.append(lock)
+
+            for uid in self.user_ids:
+                self.users[uid] = User(uid)
+                self._money[uid] = self.users[uid].total_money
+            for uid in self.coin_ids:
+                coin = crypto_cache.get(uid)
+                if coin is not None: # the coin might have crashed while we waited
+                    self.coins[uid] = coin
+        except BaseException:
+            self._release()
+            raise
+
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        try:
+            if not self.committed: await self.rollback()
+        finally:
+            self._release()
+        return False
+
+    def _release(self):
+        for lock in reversed(self._locks):
+            lock.release()
+        self._locks = []
+
+    def user(self, uid:int)->User:
+        return self.users[uid]
+
+    def coin(self, uid:int):
+        """
+        Returns the locked coin, or None if it does not exist anymore.
+        """
+        return self.coins.get(uid)
+
+    def apply_trade(self, uid:int, result:dict):
+        """
+        Applies a trade the engine made to the locked coin. :result: what the engine's "trade" returned
+
+        if the transaction is rolled back, the coin gets the value it had right before the trade. the coin lock does
+        not stop ticks when the engine is its own process, so that is not always the value it had when it was locked.
+        """
+        self._coin_values.setdefault(uid, result["previous"])
+        apply_states([result["state"]])
+
+    def add_record(self, record:dict):
+        """
+        Commits a record with the transaction. it is applied with apply_record() once the transaction is committed.
+        """
+        self.records.append(record)
+
+    def set_timer(self, key:str, seconds:float, kind:str, data=None):
+        """
+        Sets a timer that fires in :seconds: once the transaction is committed. see timers.py
+        """
+        self.add_record(timers.record(key, int(time.time() + seconds), kind, data))
+
+    def start_cooldown(self, name:str, uid:int, seconds:float):
+        """
+        Starts a cooldown for a locked user that survives restarts. raises OnCooldown if the last one is still running.
+
+        the user's lock is held, so 2 commands of the same user cannot both get past the check.
+        """
+        key = cooldown_key(name, uid)
+        remaining = timers.remaining(key)
+        if remaining > 0: raise OnCooldown(remaining)
+        self.set_timer(key, seconds, kind="cooldown")
+
+    def post(self, entry:Entry):
+        """
+        Posts a ledger entry with the commit. raises LedgerImbalance right away if it does not add up to 0.
+        """
+        ledger.check(entry)
+        self.entries.append(entry)
+
+    def audit(self):
+        """
+        Checks that every user gained or lost exactly the money posted for them.
+
+        the entries add up to 0 on their own, so if this holds for every commit, no money was ever created or
+        destroyed without an entry.
+        """
+        posted = ledger.user_deltas(self.entries)
+        for uid, user in self.users.items():
+            change, expected = user.total_money - self._money[uid], posted.pop(uid, 0)
+            if change != expected:
+                raise LedgerImbalance(f"user {uid} changed by {change} units but {expected} were posted")
+        if posted: # money posted to users that are not locked
+            raise LedgerImbalance(f"entries post to users outside of the transaction: {sorted(posted)}")
+
+    async def rollback(self):
+        """
+        Gives the traded coins their old values back. the users are just thrown away since they were never saved.
+
+        the engine is told while the coins are still locked, so no other trade can move them in between. only the first
+        call does anything.
+        """
+        coin_values, self._coin_values = self._coin_values, {}
+        for uid, value in coin_values.items():
+            coin = crypto_cache.get(uid)
+            if coin is not None: await undo_trade(coin, value) # the trade was made in the engine too
+
+    async def commit(self, *events):
+        """
+        Writes every user and coin in the transaction and records :events: in the event log.
+
+        raises TransactionConflict if a user was saved by someone else since it was loaded, and LedgerImbalance if the
+        money that changed was not posted. in both cases nothing is written. returns once the commit is on disk.
+        """
+        for uid, user in self.users.items():
+            if user_versions.get(uid, user.version) != user.version:
+                await self.rollback()
+                raise TransactionConflict(f"user {uid} was changed by someone else")
+
+        for uid, user in self.users.items(): # the money cut off by the max balance goes to the cap account
+            for account_name, clipped in user.apply_caps().items():
+                self.post(move("cap", bank(uid, account_name), "cap", clipped))
+
+        try:
+            self.audit()
+        except LedgerImbalance as error:
+            await self.rollback()
+            logMsg(f"Refused to commit: {error}")
+            raise
+
+        records = []
+        for uid, user in self.users.items():
+            user.version += 1
+            data = user.obj_to_dict()
+            records.append({"op": "user", "uid": uid, "data": data})
+            dirty_users[uid] = data
+            user_versions[uid] = user.version
+            user.reindex()
+
+        coins = [coin for uid, coin in self.coins.items() if uid in crypto_cache]
+        if coins:
+            records.append({"op": "coin_state", "coins": [coin.state() for coin in coins]})
+            publish_market() # the readers see the new prices once the trade is committed
+        if self.entries:
+            records.append({"op": "ledger", "entries": [ledger.apply(entry) for entry in self.entries]})
+        for record in self.records:
+            apply_record(record)
+            records.append(record)
+
+        wal.append({"op": "commit", "records": records})
+        for event in events: # recorded before awaiting, so a snapshot can never have the change without its events
+            event_log.record(event)
+        self.committed = True
+        await wal.sync() # the commit is durable once this returns
+
+def apply_record(record:dict):
+    """
+    Applies a record from the write ahead log.
+    """
+    op = record["op"]
+    if op == "commit":
+        for sub_record in record["records"]:
+            apply_record(sub_record)
+    elif op == "user":
+        dirty_users[record["uid"]] = record["data"]
+        user_versions[record["uid"]] = record["data"].get("version", 0)
+        holders.update(record["uid"], {name: account["holdings"] for name, account in record["data"]["accounts"].items()})
+    elif op == "ledger":
+        for entry in record["entries"]:
+            ledger.apply(Entry(entry["memo"], entry["postings"]), seq=entry["seq"])
+    elif op in ("timer", "timers_fired"):
+        timers.apply_record(record)
+    elif op in ("order", "order_done"):
+        order_book.apply_record(record)
+    elif op in ("alert", "alerts_fired", "alert_cancelled"):
+        alert_book.apply_record(record)
+    else:
+        apply_coin_record(record)
+
+def recover():
+    """
+    Replays the write ahead log on top of the snapshots. must be called after the cache is loaded.
+
+    only runs once. (on_ready runs again when the bot reconnects)
+    """
+    if wal.replayed: return
+
+    started = time.perf_counter()
+    ledger.load()
+    holders_loaded = holders.load()
+    timers.load()
+    order_book.load()
+    alert_book.load()
+    records = wal.replay()
+    for record in records:
+        apply_record(record)
+
+    cash = leaderboard.load()
+    users = None
+    if not holders_loaded or cash is None or not ledger.opened: # the first start with one of them. reads every user
+        users = {uid: User.from_dict(user) for uid, user in load_all_users().items()}
+    if not holders_loaded: # the first start with a holders index
+        holders.rebuild(users)
+        holders.save()
+    if cash is None: # the first start with a leaderboard
+        cash = {uid: user.total_money for uid, user in users.items()}
+    else: # the users in the log are newer than the leaderboard
+        cash.update((uid, User.from_dict(user).total_money) for uid, user in dirty_users.items())
+    publish_market() # the replayed values
+    leaderboard.build(cash, {uid: coin.value for uid, coin in crypto_cache.items()})
+    if users is not None: leaderboard.save()
+
+    if not ledger.opened: # the first start with a ledger. the money users already have needs an opening balance
+        ledger.open(sum(user.total_money for user in users.values()))
+        ledger.save()
+
+    if records: compact_sync()
+    logEvent("wal_replayed", records=len(records), ms=(time.perf_counter() - started) * 1000)
+
+def snapshot_files()->list:
+    """
+    Copies everything the snapshots are made of, as a list of (path, data).
+
+    every user that changed since the last snapshot, then the whole market, the balances of the ledger's system
+    accounts, the holders index, the leaderboard, the pending timers, the resting orders and the alerts. nothing in the
+    copies changes with the economy, so they can be written while it keeps going.
+    """
+    files = [(f"src/db/users/{uid}.json", user) for uid, user in dirty_users.items()] # replaced on save, never changed
+    db = db_to_dict()
+    if db is not None: files.append((db_path, db))
+    files += [(ledger.state_path, ledger.to_dict()), (holders.path, holders.to_dict()),
+              (leaderboard.path, leaderboard.to_dict()), (timers.path, timers.to_dict()),
+              (order_book.path, order_book.to_dict()), (alert_book.path, alert_book.to_dict())]
+    return files
+
+def write_files(files:list):
+    for path, data in files:
+        write_json_atomic(path, data)
+
+def compact_sync():
+    """
+    Writes the snapshots and empties the log. only used on startup, before anything else runs.
+
+    the log is only emptied once all of them are on disk, so a crash in the middle just replays the log again.
+    """
+    seq = ledger.seq
+    write_files(snapshot_files())
+    ledger.saved(seq)
+    wal.truncate()
+    dirty_users.clear()
+
+compacting = asyncio.Lock() # the shutdown and the scheduled compaction can overlap
+
+async def compact():
+    """
+    Writes the snapshots and cuts what is in them off the log.
+
+    the state is copied on the event loop and the files are written in a thread, like the log's batches, so commands
+    keep running during the compaction. what they append meanwhile is past the mark and stays in the log, and the users
+    they save stay dirty for the next compaction.
+    """
+    async with compacting:
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        users, seq, mark = dict(dirty_users), ledger.seq, wal.mark()
+        files = snapshot_files()
+        await loop.run_in_executor(None, write_files, files)
+        ledger.saved(seq)
+
+        await wal.sync() # everything before the mark has to be on disk before the log is cut there
+        await loop.run_in_executor(None, wal.cut, mark)
+        wal.moved(mark)
+        for uid, user in users.items():
+            if dirty_users.get(uid) is user: # not saved again while the files were written
+                del dirty_users[uid]
+        logEvent("wal_compacted", users=len(users), bytes=mark, ms=(time.perf_counter() - started) * 1000)
+
+@scheduler.job(every=10, phase="storage")
+async def compact_wal(): # writes the snapshots every 10 minutes
+    if not wal.replayed: return # the log was not replayed yet. the snapshots would miss what is in it
+    await compact()
+
+@scheduler.job(every=1, phase="cleanup")
+async def drop_dead_holdings():
+    """
+    Removes the holdings of deleted coins from their holders.
+
+    only the users in the holders index are visited. each of them is cleaned up in their own transaction, so it waits
+    for any command that is using them.
+    """
+    if not wal.replayed: return
+
+    for coin_uid in sorted(holders.pending):
+        started = time.perf_counter()
+        uids = sorted(holders.holders_of(coin_uid)) # copied, committing updates the index
+        try:
+            for uid in uids:
+                async with Transaction(users=[uid]) as tx:
+                    tx.user(uid).verify_holdings()
+                    await tx.commit()
+        except TransactionConflict: # someone saved them outside of a transaction. tried again next minute
+            continue
+
+        holders.cleared(coin_uid)
+        logEvent("holders_dropped", coin=coin_uid, users=len(uids), ms=(time.perf_counter() - started) * 1000)
@@ -2,17 +2,114 @@ import os
 from src.utils.json_utils import *
 import datetime
 import asyncio
-from src.constants import *
-#from src.constants import tax_rate, taxed_trading_limit_dollars, tax_free_trading_limit_dollars, trading_limit_shares, \
-#    max_transfer_limit, start_amount, max_balance
+from src.constants import config
+from src.utils.crypto_currency import coin_index
+from src.utils.money import *
+from src.utils.wal import wal
+from src.utils.events import event_log, UserCreated
+from src.utils.ledger import ledger, move, wallet as _wallet # kept private so "from src.utils.users import *" does not export it
+from src.utils.holders import holders
+from src.utils.leaderboard import leaderboard
+
+# the version of the user files. files older than this are migrated when they are loaded
+#   1: holdings are keyed by coin name
+#   2: holdings are keyed by coin id
+#   3: the wallet and balances are integer money units instead of float dollars. see src/utils/money.py
+user_schema = 3
+
+# the last version of every user that was saved or loaded. used by transactions to tell if a user was changed by
+# someone else since it was loaded. see src/utils/transactions.py
+user_versions = {}
+
+# users that were saved since the last snapshot, by id. their files are out of date, the newest data is here and in
+# the write ahead log. the files are written when the log is compacted. (see src/utils/transactions.py)
+dirty_users = {}
+
+def migrate_money(dollars)->int:
+    """
+    Converts a float dollar amount from an old user file to money units.
+
+    old files can have balances that overflowed to inf or turned into nan. those become the max balance and 0.
+    """
+    if dollars != dollars: return 0 # nan
+    if dollars in (float("inf"), float("-inf")):
+        return to_money(config.current.max_balance) if dollars > 0 else 0
+    return to_money(dollars)
+
+def load_all_users()->dict:
+    """
+    Returns the dict of every user, by id. users saved since the last compaction come from dirty_users.
+    """
+    users = {}
+    for name in os.listdir("src/db/users"):
+        if name.endswith(".json"):
+            users[int(name[:-5])] = load_json(f"src/db/users/{name}")
+    users.update(dirty_users) # newer than their files
+    return users
+
+class Account:
+    # slots keep every account small. they have no __dict__, only these attributes
+    __slots__ = ("tax_free", "name", "balance", "holdings")
+
+    def __init__(self, name:str, tax_free:bool, balance:int=0, holdings:dict=None):
+        """
+        A crypto account. holds a balance(in money units) and the user's holdings.
+
+        holdings are keyed by coin id and hold the number of shares.
+        """
+        self.name = name
+        self.tax_free = tax_free
+        self.balance = balance
+        self.holdings = {} if holdings is None else holdings
+
+    @property
+    def num_holdings(self)->int:
+        return len(self.holdings)
+
+    def obj_to_dict(self)->dict:
+        """
+        Transforms the account into a dict to save.
+        """
+        return {
+            "tax_free": self.tax_free,
+            "name": self.name,
+            "balance": self.balance,
+            "holdings": dict(self.holdings), # copied so the saved dict does not change with the account. json turns the ids into strings
+            "num_holdings": self.num_holdings
+        }
+
+    @classmethod
+    def dict_to_obj(cls, account:dict, schema:int=user_schema):
+        """
+        Loads an account from its dict.
+
+        json keys are always strings, so the ids are turned back into ints.
+        files from before coin ids existed(schema 1) have holdings keyed by name. those are looked up in the coin index.
+        holdings of coins that dont exist anymore are dropped.
+        balances from before schema 3 are in dollars and are converted to money units.
+        """
+        holdings = {}
+        for key, shares in account["holdings"].items():
+            if schema < 2:
+                uid = coin_index.uid_of(key)
+                if uid is None: continue # the coin was deleted
+            else:
+                uid = int(key)
+            holdings[uid] = holdings.get(uid, 0) + shares
+
+        balance = account["balance"] if schema >= 3 else migrate_money(account["balance"])
+        return cls(account["name"], account["tax_free"], balance, holdings)
 
 class User:
+    # slots keep every user small. they have no __dict__, only these attributes
+    __slots__ = ("uid", "wallet", "accounts", "last_accessed", "version")
+
     def __init__(self, uid:int):
         """
         Initializes the User.
 
         Takes in the user id and loads the respective file in db/users/[uid].json.
-        Then, we verify all tokens the user has still exist, if not, we delete the non-existent ones.
+        if a coin was deleted and its holders were not cleaned up yet, we verify all tokens the user has still exist.
         finally, we update the last time this user was accessed.
 
         we do not save afterward and that is up to the user to save the data after use.
@@ -21,50 +118,60 @@ class User:
         """
 
         try: # assuming the user exists in the database, just load them l=normally
-            user = load_json(f"src/db/users/{uid}.json")
+            user = dirty_users.get(uid) # users saved since the last snapshot are newer than their files
+            if user is None: user = load_json(f"src/db/users/{uid}.json")
+            self.dict_to_obj(user)
             self.uid = uid
-            self.wallet = user["wallet"]
-            self.accounts = user["accounts"]
-            self.last_accessed = user["last_accessed"]
+            user_versions[uid] = self.version
 
-        except: # if they dont exist, create them
-            create_json(f"src/db/users/{uid}.json") # creates the user
-            user = load_json(f"src/db/users/{uid}.json")
-            self.uid = uid
-            self.wallet = start_amount
-            self.create_accounts() # creates all accounts
-            self.update_last_accessed()
+        except FileNotFoundError: # if they dont exist, create them. a file that is there but broken is not replaced
+            self.create(uid, to_money(config.current.start_amount))
 
-            self.save() # saves the user
+            self.save(move("start", "mint", _wallet(uid), self.wallet)) # the start amount is new money
+            event_log.record(UserCreated(uid, self.wallet))
 
         # verifies that all holdings they own still exist.
-        # incase a coin crashes, the holdings will have no value anymore and are deleted.
-        self.verify_holdings()
+        # incase a coin crashes, the holdings will have no value anymore and are deleted. the holders of a crashed coin
+        # are cleaned up right after(see drop_dead_holdings() in transactions.py), so this is skipped the rest of the time
+        if holders.pending: self.verify_holdings()
         self.update_last_accessed()
 
+    def create(self, uid:int, wallet:int):
+        # sets up a brand new user with empty accounts
+        self.uid = uid
+        self.version = 0
+        self.wallet = wallet
+        self.create_accounts() # creates all accounts
+        self.update_last_accessed()
+
+    @classmethod
+    def from_dict(cls, user:dict):
+        """
+        Builds a user from a dict without touching the database. used when replaying events.
+        """
+        self = cls.__new__(cls)
+        self.dict_to_obj(user)
+        return self
+
+    @classmethod
+    def new(cls, uid:int, wallet:int):
+        """
+        Builds a brand new user without touching the database. used when replaying events.
+        """
+        self = cls.__new__(cls)
+        self.create(uid, wallet)
+        return self
+
     def create_accounts(self):
         """
         Creates the 2 crypto accounts.
 
         Creates a Tax free account and a regular account.
         """
-        accounts = {}
-        accounts["ntfa"] =  {
-                "tax_free": False,
-                "name": "ntfa",
-                "balance": 0,
-                "holdings": {},
-                "num_holdings": 0
-            } # the Non-Tax Free Account; ntfa
-        accounts["tfa"] = {
-                "tax_free": True,
-                "name": "tfa",
-                "balance":0,
-                "holdings": {},
-                "num_holdings": 0
-            } # the Tax Free Account; tfa
-
-        self.accounts = accounts
+        self.accounts = {
+            "ntfa": Account("ntfa", tax_free=False), # the Non-Tax Free Account; ntfa
+            "tfa": Account("tfa", tax_free=True) # the Tax Free Account; tfa
+        }
 
     def obj_to_dict(self)->dict:
         """
@@ -75,16 +182,47 @@ class User:
 
         user["uid"] = self.uid
 
-        # prevents both wallet and bank account from exceeding the limits. provided they werent already nan.
-        user["wallet"] = min(self.wallet, max_balance)
-        for account in ["tfa", "ntfa"]:
-            self.accounts[account]["balance"] = min(self.accounts[account]["balance"], max_balance)
-
-        user["accounts"] = self.accounts
+        self.apply_caps() # prevents both wallet and bank account from exceeding the limits
+        user["wallet"] = self.wallet
+        user["accounts"] = {name: account.obj_to_dict() for name, account in self.accounts.items()}
         user["last_accessed"] = self.last_accessed
+        user["version"] = self.version
+        user["schema"] = user_schema
 
         return user
 
+    def apply_caps(self)->dict:
+        """
+        Cuts the wallet and the bank accounts down to the max balance.
+
+        returns how much was cut off of each, by name.({"wallet": 100, "ntfa": 50}) transactions post it to the
+        ledger's cap account. see src/utils/ledger.py
+        """
+        max_balance = to_money(config.current.max_balance)
+        clipped = {}
+        if self.wallet > max_balance:
+            clipped["wallet"] = self.wallet - max_balance
+            self.wallet = max_balance
+        for name, account in self.accounts.items():
+            if account.balance > max_balance:
+                clipped[name] = account.balance - max_balance
+                account.balance = max_balance
+        return clipped
+
+    def reindex(self):
+        # updates the holders index and the leaderboard after the user was saved
+        holders.update(self.uid, self.all_holdings())
+        leaderboard.update(self.uid, self.total_money)
+
+    def all_holdings(self)->dict:
+        # account name -> holdings. what the holders index is updated with
+        return {name: account.holdings for name, account in self.accounts.items()}
+
+    @property
+    def total_money(self)->int:
+        # the money in the wallet and both bank accounts. holdings are not money
+        return self.wallet + sum(account.balance for account in self.accounts.values())
+
     @staticmethod
     def clear_userbase(): # removes all users
         pass
@@ -93,44 +231,50 @@ class User:
     def clear_account(uid:int): # removes a user
         os.remove(f"src/db/users/{uid}.json")
 
-    def dict_to_obj(self):pass
+    def dict_to_obj(self, user:dict):
+        """
+        Loads the user from the dict in their json file.
+        """
+        schema = user.get("schema", 1)
+        self.uid = user.get("uid")
+        self.wallet = user["wallet"] if schema >= 3 else migrate_money(user["wallet"])
+        self.accounts = {name: Account.dict_to_obj(account, schema) for name, account in user["accounts"].items()}
+        self.last_accessed = user["last_accessed"]
+        self.version = user.get("version", 0) # goes up by 1 every time the user is saved
 
-    def save(self):
+    def save(self, *entries):
         """
         Saves the Userdata.
+
+        commands that change more than one user or a coin should use a transaction instead. see transactions.py
+        the user is appended to the write ahead log. their file is written with the next snapshot.
+        :entries: ledger entries for the money that changed. they are logged in the same record as the user, so a crash
+        can never keep one without the other
         """
+        self.version += 1
         user = self.obj_to_dict() # transforms the object to a dict
 
-        update_json(f"src/db/users/{self.uid}.json", user)
+        record = {"op": "user", "uid": self.uid, "data": user}
+        if entries:
+            record = {"op": "commit", "records": [record, {"op": "ledger",
+                                                           "entries": [ledger.apply(entry) for entry in entries]}]}
+        wal.append(record)
+        dirty_users[self.uid] = user
+        user_versions[self.uid] = self.version
+        self.reindex()
 
     def verify_holdings(self):
         """
         Verifies that all the tokens in a user's holdings still exist.
 
         runs through all holdings in both accounts. for every token in the holdings,
-        check if it exists in the database. if not, delete it from the holdings.
+        check if its id is still in the coin index. if not, delete it from the holdings.
         """
-        crypto_db = load_json("src/db/crypto_currencies.json")
-        not_in_db=[]
-        accounts = ["tfa", "ntfa"]
-
-        for account in accounts:
-
-            for holding in self.accounts[account]["holdings"]:
-                in_db = False
-                for crypto in crypto_db["currencies"]:
-                    if holding == crypto["name"]:
-                        in_db = True
-                        break
-
-                if not in_db:
-                    not_in_db.append(holding)
+        for account in self.accounts.values():
+            not_in_db = [holding for holding in account.holdings if holding not in coin_index.names]
 
             for holding in not_in_db:
-                del_dict_key(self.accounts[account]["holdings"], key=holding)
-                self.accounts[account]["num_holdings"] -=1
-
-            not_in_db = []
+                del account.holdings[holding]
 
     def update_last_accessed(self):
         """
@@ -141,43 +285,43 @@ class User:
         """
         self.last_accessed = str(datetime.datetime.now().replace(second=0, microsecond=0))
 
-    def bank_deposit(self, amount:float, account_name:str):
+    def bank_deposit(self, amount:int, account_name:str):
         """
         Deposits the user's wallet into the bank account.
 
         There are no limits on how often/how much one can transfer from their own accounts.
 
-        amount is in cents for simplicity. the user will be entering values in dollars, so we must multiply by 100
+        amount is in money units. the user will be entering values in dollars, so the bot converts them with to_money
         todo:
             add support for depositing/withdrawing all
         """
 
         if amount > self.wallet:
-            return f"Insufficient wallet balance\nBalance: {self.wallet}\nNeeded: {amount}"
+            return f"Insufficient wallet balance\nBalance: ${fmt_money(self.wallet)}\nNeeded: ${fmt_money(amount)}"
 
         self.wallet -=amount
-        self.accounts[account_name]["balance"] += amount
+        self.accounts[account_name].balance += amount
 
-        return f"Deposited ${round(amount,4)} into {account_name} account successfully"
+        return f"Deposited ${fmt_money(amount)} into {account_name} account successfully"
 
-    def bank_withdraw(self, amount:float, account_name:str):
+    def bank_withdraw(self, amount:int, account_name:str):
         """
         Withdraws money from the bank account to the user's wallet.
 
         No limits on how often/how much can be withdrawn.
 
-        amount is in cents for simplicity. the user will be entering values in dollars, so we must multiply by 100
+        amount is in money units. the user will be entering values in dollars, so the bot converts them with to_money
         """
 
-        if amount > self.accounts[account_name]["balance"]: # cannot exceed existing funds
-            return f"Insufficient bank balance.\nBalance: {self.accounts[account_name]['balance']}\nNeeded: {amount}"
+        if amount > self.accounts[account_name].balance: # cannot exceed existing funds
+            return f"Insufficient bank balance.\nBalance: ${fmt_money(self.accounts[account_name].balance)}\nNeeded: ${fmt_money(amount)}"
 
-        self.accounts[account_name]["balance"] -= amount
+        self.accounts[account_name].balance -= amount
         self.wallet += amount
 
-        return f"Withdrew ${round(amount,4)} from {account_name} account successfully"
+        return f"Withdrew ${fmt_money(amount)} from {account_name} account successfully"
 
-    def transfer(self, amount:float, uid:int):
+    def transfer(self, amount:int, recipient):
         """
         Transfers money from one user to another.
 
@@ -185,50 +329,50 @@ class User:
         recipient's wallet. Has to be within the maximum transfer amount
 
         The bot calling this function will determine needed.(positive integers only, who to ping etc)
+        neither user is saved. the bot loads both users in a transaction and commits them together.
 
-        amount is in cents for simplicity. the user will be entering values in dollars, so we must multiply by 100
+        amount is in money units. the user will be entering values in dollars, so the bot converts them with to_money
         """
 
-        if amount > max_transfer_limit: # cant  exceed the transfer limit.
-            return f"Transfer amount exceeds transfer limit.\nTransfer limit: ${max_transfer_limit}"
+        if amount > to_money(config.current.max_transfer_limit): # cant  exceed the transfer limit.
+            return f"Transfer amount exceeds transfer limit.\nTransfer limit: ${config.current.max_transfer_limit}"
 
         if amount > self.wallet:
-            return f"Insufficient funds to transfer.\n Your wallet: ${self.wallet}\nAmount to send: ${amount}"
+            return f"Insufficient funds to transfer.\n Your wallet: ${fmt_money(self.wallet)}\nAmount to send: ${fmt_money(amount)}"
 
-        recipient = User(uid) # loads the recipient
         self.wallet -=amount
         recipient.wallet += amount
 
-        recipient.save()
-        return f"Transfer of ${round(amount,4)} sent successfully"
+        return f"Transfer of ${fmt_money(amount)} sent successfully"
 
     def shares_exceeds_trade_limit(self, shares:int)->bool:
         """
         Determines if the number of shares exceed the trading limit.
         """
-        if shares > trading_limit_shares: return True
+        if shares > config.current.trading_limit_shares: return True
         return False
 
-    def volume_exceeds_trade_limit(self, account_name:str, volume:float)->bool:
+    @staticmethod
+    def volume_exceeds_trade_limit(account_name:str, volume:int)->bool:
         """
-        Determines if the volume of the trade exceeds the trading limits.
+        Determines if the volume(in money units) of the trade exceeds the trading limits.
 
         there are different trading limits depending on the account.
         """
 
         if account_name == "tfa":
-            if volume > tax_free_trading_limit_dollars: return True
+            if volume > to_money(config.current.tax_free_trading_limit_dollars): return True
         elif account_name == "ntfa":
-            if volume > taxed_trading_limit_dollars: return True
+            if volume > to_money(config.current.taxed_trading_limit_dollars): return True
         return False
 
-    def has_enough_balance(self, account_name:str, cost:float)->bool:
+    def has_enough_balance(self, account_name:str, cost:int)->bool:
         """
         Determines if the user has enough money to cover a certain purchase.
         """
-        return self.accounts[account_name]["balance"] >= cost
+        return self.accounts[account_name].balance >= cost
 
-    def has_enough_shares(self, account_name:str, coin_name:str, shares:int)->bool:
+    def has_enough_shares(self, account_name:str, coin_uid:int, shares:int)->bool:
         """
         determines if the user has enough shares to sell.
 
@@ -239,19 +383,19 @@ class User:
         """
 
         # incase the user owns no shares, return False because they dont have enough to sell.
-        if not self.holding_exists(account_name=account_name, coin_name=coin_name):
+        if not self.holding_exists(account_name=account_name, coin_uid=coin_uid):
             return False
         else:
-            return shares <= self.accounts[account_name]["holdings"][coin_name]
+            return shares <= self.accounts[account_name].holdings[coin_uid]
 
-    def balance_exceeds_limit(self, account_name:str, amount:float)->bool:
+    def balance_exceeds_limit(self, account_name:str, amount:int)->bool:
         """
         Ensures that the user's bank account does not exceed the maximum balance.
         """
-        if (self.accounts[account_name]["balance"] + amount) > max_balance: return True
+        if (self.accounts[account_name].balance + amount) > to_money(config.current.max_balance): return True
         return False
 
-    def cap_balance(self, account_name:str, amount:float):
+    def cap_balance(self, account_name:str, amount:int):
         """
         If the user's balance would exceed the max balance, set their balance to the max balance
 
@@ -259,16 +403,16 @@ class User:
         otherwise, dont do anything
         """
         if self.balance_exceeds_limit(account_name, amount):
-            self.accounts[account_name]["balance"] = max_balance
+            self.accounts[account_name].balance = to_money(config.current.max_balance)
 
-            """elif self.accounts[account_name]["balance"] + amount <=0:
-            self.accounts[account_name]["balance"] = 0.0"""
+            """elif self.accounts[account_name].balance + amount <=0:
+            self.accounts[account_name].balance = 0"""
 
         else: self.modify_account(account_name, amount)
 
-        return self.accounts[account_name]["balance"]
+        return self.accounts[account_name].balance
 
-    def modify_account(self, account_name:str, amount:float):
+    def modify_account(self, account_name:str, amount:int):
         """
         modifies a bank account with the given amount of money.
 
@@ -277,50 +421,45 @@ class User:
         sales are positive
         purchases are negative
 
-        amount is in cents for simplicity. the user will be entering values in dollars, so we must multiply by 100
+        amount is in money units.
         """
-        self.accounts[account_name]["balance"] += amount
+        self.accounts[account_name].balance += amount
 
     @staticmethod
-    def calc_tax(account_name:str, subtotal:float):
+    def calc_tax(account_name:str, subtotal:int)->int:
         """
         Calculates the tax rate of a purchase given a subtotal.
 
         the user gives an account name, either tfa or ntfa. it is only taxed if it is a ntfa(non-tax free account)
+        the subtotal is in money units. the taxed total is rounded up to the next unit so tax is never undercharged.
         """
         if account_name == "tfa":
             return subtotal
         else:
-            return tax_rate * subtotal
+            return mul_rate(subtotal, config.current.tax_rate, rounding="up")
 
-    def increase_holding(self, account_name:str, coin_name:str, shares:int):
+    def increase_holding(self, account_name:str, coin_uid:int, shares:int):
         """
         Adds a holding in. used when buying
 
         checks if the holding exists, holding_exists(). if not, we add it.
         if it does, we simply add the currenct shares to it
         """
-        if not self.holding_exists(account_name=account_name, coin_name=coin_name):
-            self.accounts[account_name]["holdings"][coin_name] = shares
-            self.accounts[account_name]["num_holdings"] += 1
-        else:
-            self.accounts[account_name]["holdings"][coin_name] += shares
+        holdings = self.accounts[account_name].holdings
+        holdings[coin_uid] = holdings.get(coin_uid, 0) + shares
 
-    def holding_exists(self, account_name:str, coin_name:str)->bool:
+    def holding_exists(self, account_name:str, coin_uid:int)->bool:
         """
         Checks if a holding exists.
 
-        check account_name for the holding named coin_name. if it exists, return true,
+        check account_name for the holding of the coin with the id coin_uid. if it exists, return true,
         else, return false.
 
         used when buying or selling currencies.
         """
-        try:
-            holding = self.accounts[account_name]["holdings"][coin_name]
-        except KeyError: return False
-        return True
+        return coin_uid in self.accounts[account_name].holdings
 
-    def decrease_holding(self, account_name:str, coin_name:str, shares:int):
+    def decrease_holding(self, account_name:str, coin_uid:int, shares:int):
         """
         removes a holding.
 
@@ -328,10 +467,10 @@ class User:
 
         reduce the number of shares by amount and if it == 0: remove it
         """
-        self.accounts[account_name]["holdings"][coin_name] -= shares
-        if self.accounts[account_name]["holdings"][coin_name] <= 0:
-            del_dict_key(self.accounts[account_name]["holdings"], coin_name)
-            self.accounts[account_name]["num_holdings"] -=1
+        holdings = self.accounts[account_name].holdings
+        holdings[coin_uid] -= shares
+        if holdings[coin_uid] <= 0:
+            del holdings[coin_uid]
 
     def calc_num_of_intervals(self, shares:int):
         """
@@ -364,7 +503,7 @@ class User:
         to get the total amount of times run, we just add the quotient and the remainder
         """
         remainder:int
-        mod = shares % shares_per_interval # the modulus
+        mod = shares % config.current.shares_per_interval # the modulus
 
         # determines the remainder
         if mod == 0:
@@ -372,6 +511,6 @@ class User:
         else:
             remainder = 1
 
-        quotient = (shares - mod) / shares_per_interval # determines the quotient
+        quotient = (shares - mod) / config.current.shares_per_interval # determines the quotient
 
         return quotient + remainder
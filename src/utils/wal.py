@@ -0,0 +1,226 @@
+"""
+The write ahead log.
+
+Every change to the economy(users, coin values, new and deleted coins) is appended to src/db/wal.log before anything
+else. the user files and crypto_currencies.json are only snapshots. they are written once in a while when the log is
+compacted, and the log is emptied afterward. on startup, the snapshots are loaded and the log is replayed on top.
+
+each record is one line: the crc32 of the json, a space, then the json.
+    1a2b3c4d {"op":"user","uid":1,"data":{...}}
+if the bot crashes while a line is written, that last line is cut off or has the wrong checksum. it is dropped when
+the log is replayed, so a torn write can only ever lose the record that was being written, never the economy.
+
+appending only puts the record in a buffer. the buffer is written and fsynced in the background, in a thread, so
+every record appended while one batch is being written goes out together in the next one.(group commit)
+await sync() to wait until everything appended so far is on disk.
+
+compaction writes the snapshots in a thread too, while records keep being appended. it takes a mark() when it copies
+the state and only cuts the log up to that mark once the snapshots are written.(see cut())
+"""
+import asyncio
+import atexit
+import json
+import os
+import threading
+import zlib
+from src.utils.log import logMsg
+
+class WriteAheadLog:
+    def __init__(self, path:str):
+        self.path = path
+        self.size = 0 # bytes on disk
+        self.replayed = False
+        self._file = None
+        self._buffer = []
+        self._appended = 0 # the number of records appended so far
+        self._synced = 0 # the number of records that are on disk
+        self._end = 0 # where the last record appended ends in the file, once it is written
+        self._flushing = None # the task writing the current batch
+        self._scheduled = False
+        self._lock = threading.Lock() # only 1 thread touches the file at a time
+
+    @staticmethod
+    def encode(record:dict)->bytes:
+        payload = json.dumps(record, separators=(",", ":")).encode()
+        return b"%08x " % zlib.crc32(payload) + payload + b"\n"
+
+    @staticmethod
+    def decode(line:bytes):
+        # returns None if the line is torn or corrupted
+        crc, _, payload = line.partition(b" ")
+        try:
+            if int(crc, 16) != zlib.crc32(payload): return None
+            return json.loads(payload)
+        except ValueError:
+            return None
+
+    def append(self, record:dict):
+        """
+        Appends a record.
+
+        inside the event loop the record is written with the next batch. outside of it(test scripts), it is written
+        right away.
+        """
+        line = self.encode(record)
+        self._buffer.append(line)
+        self._appended += 1
+        self._end += len(line)
+
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.flush_sync()
+            return
+
+        if not self._scheduled:
+            self._scheduled = True
+            loop.call_soon(self._start_flush)
+
+    def _start_flush(self):
+        self._scheduled = False
+        if self._flushing is None or self._flushing.done():
+            self._flushing = asyncio.ensure_future(self._flush())
+        # otherwise the batch being written picks the buffer up when it is done
+
+    async def _flush(self):
+        loop = asyncio.get_running_loop()
+        while self._buffer:
+            lines, self._buffer = self._buffer, []
+            end = self._appended
+            try:
+                await loop.run_in_executor(None, self._write, lines)
+            except OSError as error:
+                self._buffer = lines + self._buffer # tried again with the next batch
+                logMsg(f"Could not write to the write ahead log: {error}")
+                raise
+            self._synced = max(self._synced, end)
+
+    async def sync(self):
+        """
+        Waits until every record appended so far is on disk.
+        """
+        target = self._appended
+        while self._synced < target:
+            if self._flushing is None or self._flushing.done():
+                self._flushing = asyncio.ensure_future(self._flush())
+            await asyncio.shield(self._flushing)
+
+    async def idle(self):
+        """
+        Waits until no batch is being written.
+        """
+        while self._flushing is not None and not self._flushing.done():
+            try:
+                await asyncio.shield(self._flushing)
+            except OSError:
+                pass
+
+    def _open(self):
+        if self._file is None:
+            self._file = open(self.path, "ab")
+            self.size = self._file.tell()
+
+    def _write(self, lines:list):
+        data = b"".join(lines)
+        with self._lock:
+            self._open()
+            self._file.write(data)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self.size += len(data)
+
+    def flush_sync(self):
+        """
+        Writes the buffer right away. only used when no batch is being written. (see idle())
+        """
+        lines, self._buffer = self._buffer, []
+        if lines: self._write(lines)
+        self._synced = self._appended
+
+    def replay(self)->list:
+        """
+        Returns every record in the log, in order.
+
+        stops at the first torn or corrupted line and cuts the log off there, so new records are not appended after
+        garbage.
+        """
+        self.replayed = True
+        try:
+            with open(self.path, "rb") as file:
+                data = file.read()
+        except FileNotFoundError:
+            return []
+
+        records = []
+        position = 0
+        while position < len(data):
+            end = data.find(b"\n", position)
+            if end == -1: break # the last line was cut off
+            record = self.decode(data[position:end])
+            if record is None: break
+            records.append(record)
+            position = end + 1
+
+        self._end = position + sum(len(line) for line in self._buffer)
+        if position < len(data):
+            logMsg(f"Dropped {len(data) - position} bytes of torn records from the write ahead log")
+            with self._lock, open(self.path, "r+b") as file:
+                file.truncate(position)
+                os.fsync(file.fileno())
+        return records
+
+    def truncate(self):
+        """
+        Empties the log. only call this once everything in it is in the snapshots.
+
+        records still in the buffer are dropped too, they are in the snapshots as well.
+        """
+        with self._lock:
+            self._open()
+            self._file.truncate(0)
+            os.fsync(self._file.fileno())
+            self.size = 0
+        self._buffer = []
+        self._synced = self._appended
+        self._end = 0
+
+    def mark(self)->int:
+        """
+        Returns where the log ends right now, including the records that are not written yet.
+        """
+        return self._end
+
+    def cut(self, mark:int):
+        """
+        Drops every record before :mark:(see mark()) and keeps the ones appended after it.
+        only call this once everything before the mark is on disk and in the snapshots.
+
+        the records kept are copied to a new file that replaces the log, so a crash in the middle leaves either the
+        old log or the new one. runs in a thread, the caller moves its own marks back by :mark: afterward.
+        """
+        with self._lock:
+            self._open()
+            with open(self.path, "rb") as file:
+                file.seek(mark)
+                rest = file.read()
+            with open(self.path + ".tmp", "wb") as file:
+                file.write(rest)
+                file.flush()
+                os.fsync(file.fileno())
+            self._file.close()
+            os.replace(self.path + ".tmp", self.path)
+            self._file = open(self.path, "ab")
+            self.size = len(rest)
+
+    def moved(self, mark:int):
+        # the log was cut at :mark:, so everything appended since starts that much earlier in the file
+        self._end -= mark
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+wal = WriteAheadLog("src/db/wal.log")
+atexit.register(wal.flush_sync) # whatever is left in the buffer when the bot stops